@@ -1,54 +1,28 @@
 # agents/answer.py
+import re
+import time
+import asyncio
+from contextlib import aclosing
+from typing import Callable, Optional
 
 from agents.state import QueryState
-from utils.llm import get_llm
+from utils.llm import get_llm, ainvoke_llm, astream_llm
 from retrieval.chunks_retriever import ChunksRetriever
+from retrieval.answer_cache import AnswerCache
+from ingestion.chunking import count_tokens
 from langchain_core.messages import SystemMessage, HumanMessage
 
-MAX_CONTEXT_CHARS = 4000
+# context packing (tiktoken cl100k, same count as chunking); room for
+# three full MAX_CHUNK_TOKENS chunks
+MAX_CONTEXT_TOKENS = 1200
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+MIN_DEDUP_CHARS = 20      # shorter fragments are only dropped on an exact repeat
 
-def answer_generation_node(state: QueryState, chunk_retriever: ChunksRetriever) -> QueryState:
-    retrieved = state.get("retrieved_chunks", [])
+# streaming: text is held back until it cannot be the refusal marker
+REFUSAL_MARKER = "INSUFFICIENT_EVIDENCE"
+GATE_PREFIX_CHARS = 48
 
-    # HARD STOP - no evidence
-    if not retrieved:
-        return {
-            "answer_text": None,
-            "answer_citations": [],
-            "answer_supported": False
-        }
-    
-    # Load ground-truth text from postgres
-    contexts = []
-    used_chunk_ids = []
-
-    total_chars = 0
-    for item in retrieved:
-        chunk = chunk_retriever.get(item["chunk_id"])
-        text = chunk["text"]
-
-        if not text:
-            continue
-
-        if total_chars + len(text) > MAX_CONTEXT_CHARS:
-            break
-
-        contexts.append(f"[{chunk['chunk_id']}] {text}")
-        used_chunk_ids.append(chunk["chunk_id"])
-        total_chars += len(text)
-
-    if not contexts:
-        return {
-            **state,
-            "answer_text": None,
-            "answer_citations": [],
-            "answer_supported": False
-        }
-    
-    context_block = "\n\n".join(contexts)
-
-    # LLM
-    system_prompt = """
+SYSTEM_PROMPT = """
     You are an evidence-bound answer generator.
 
     RULES:
@@ -60,9 +34,105 @@ def answer_generation_node(state: QueryState, chunk_retriever: ChunksRetriever)
     - Cite chunk IDs you used.
     """
 
+
+def _sentences(text: str):
+    return [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+def _normalize(sentence: str) -> str:
+    return " ".join(sentence.lower().split())
+
+
+def _is_duplicate(key: str, packed_keys) -> bool:
+    if key in packed_keys:
+        return True
+    # chunk overlap is a token window, so a repeat may start mid-sentence
+    return len(key) >= MIN_DEDUP_CHARS and any(key in k for k in packed_keys)
+
+
+def build_context(state: QueryState, chunk_retriever: ChunksRetriever, max_tokens: int = MAX_CONTEXT_TOKENS):
+    """
+    Load ground-truth text from postgres and pack it into max_tokens
+    (tiktoken) → (contexts, used_chunk_ids, used_document_ids, report).
+
+    The top-ranked chunk goes in first; after that the chunk with the
+    highest relevance per token that still fits, until nothing fits.
+    Relevance is the retrieval score, or 1 / rank when there are none or
+    the cross-encoder reordered the list: fused scores no longer follow
+    that order, and cross-encoder logits are not on a 0..1 scale.
+    Sentences already packed from another chunk (chunking overlap) are
+    dropped before counting. Contexts keep retrieval order.
+    """
+    retrieved = state.get("retrieved_chunks") or []
+    scores = state.get("retrieval_scores") or []
+    if (state.get("rerank_report") or {}).get("scores"):
+        scores = []
+    rows = chunk_retriever.get_many([c["chunk_id"] for c in retrieved])
+
+    candidates = []
+    for rank, item in enumerate(retrieved):
+        chunk = rows.get(str(item["chunk_id"]))
+        if not chunk or not chunk["text"]:
+            continue
+        sentences = [(s, _normalize(s), count_tokens(s)) for s in _sentences(chunk["text"])]
+        relevance = max(scores[rank], 0.0) if rank < len(scores) else 1.0 / (rank + 1)
+        candidates.append({"rank": rank, "chunk": chunk, "sentences": sentences, "relevance": relevance})
+
+    packed, packed_keys = [], set()
+    used_tokens = deduped = 0
+
+    def novel(candidate):
+        kept = [s for s in candidate["sentences"] if not _is_duplicate(s[1], packed_keys)]
+        header = count_tokens(f"[{candidate['chunk']['chunk_id']}] ")
+        return kept, header + sum(s[2] for s in kept)
+
+    remaining = list(candidates)
+    while remaining:
+        best = None
+        for candidate in remaining:
+            kept, tokens = novel(candidate)
+            if not kept or used_tokens + tokens > max_tokens:
+                continue
+            density = candidate["relevance"] / tokens
+            # the top-ranked chunk (e.g. the reranker's pick) is not traded away
+            if candidate is candidates[0]:
+                best = (candidate, kept, tokens)
+                break
+            if best is None or density > best[0]["relevance"] / best[2]:
+                best = (candidate, kept, tokens)
+        if best is None:
+            break
+
+        candidate, kept, tokens = best
+        remaining.remove(candidate)
+        deduped += len(candidate["sentences"]) - len(kept)
+        packed_keys.update(s[1] for s in kept)
+        used_tokens += tokens
+        packed.append((candidate, " ".join(s[0] for s in kept)))
+
+    contexts, used_chunk_ids, used_document_ids = [], [], set()
+    for candidate, text in sorted(packed, key=lambda p: p[0]["rank"]):
+        chunk = candidate["chunk"]
+        contexts.append(f"[{chunk['chunk_id']}] {text}")
+        used_chunk_ids.append(chunk["chunk_id"])
+        used_document_ids.add(chunk["document_id"])
+
+    report = {
+        "context_tokens": used_tokens,
+        "max_context_tokens": max_tokens,
+        "chunks_packed": len(packed),
+        "chunks_skipped": len(candidates) - len(packed),
+        "sentences_deduped": deduped
+    }
+    return contexts, used_chunk_ids, used_document_ids, report
+
+
+def answer_messages(query: str, contexts):
+    context_block = "\n\n".join(contexts)
+
     user_prompt = f"""
     Question:
-    {state["user_query"]}
+    {query}
 
     Context:
     {context_block}
@@ -71,22 +141,30 @@ def answer_generation_node(state: QueryState, chunk_retriever: ChunksRetriever)
     - Answer (1-3 sentences max)
     - Evidence: [chunk_id, chunk_id]
     """
-    messages = [
-        SystemMessage(content=system_prompt),
+    return [
+        SystemMessage(content=SYSTEM_PROMPT),
         HumanMessage(content=user_prompt)
     ]
-    llm = get_llm()
-    response = llm.invoke(messages).content.strip()
 
+
+def prompt_tokens(messages) -> int:
+    return sum(count_tokens(m.content) for m in messages)
+
+
+def no_answer(state: QueryState) -> QueryState:
+    return {
+        **state,
+        "answer_text": None,
+        "answer_citations": [],
+        "answer_supported": False
+    }
+
+
+def parse_answer(state: QueryState, response: str, used_chunk_ids) -> QueryState:
     # Validation gate
-    if "INSUFFICIENT_EVIDENCE" in response:
-        return {
-            **state,
-            "answer_text": None,
-            "answer_citations": [],
-            "answer_supported": False
-        }
-    
+    if REFUSAL_MARKER in response:
+        return no_answer(state)
+
     return {
         **state,
         "answer_text": response,
@@ -94,9 +172,173 @@ def answer_generation_node(state: QueryState, chunk_retriever: ChunksRetriever)
         "answer_supported": True
     }
 
-# agents/answer.py
 
-# agents/answer.py
+# --------------------------------------------------
+# Answer cache (retrieval/answer_cache.py)
+# --------------------------------------------------
+ANSWER_FIELDS = ("answer_text", "answer_citations", "answer_supported")
+
+def cached_answer(state: QueryState, chunk_retriever: ChunksRetriever, answer_cache: Optional[AnswerCache],
+                  used_chunk_ids) -> Optional[QueryState]:
+    if answer_cache is None or state.get("query_embedding") is None:
+        return None
+
+    # a new index generation may have retired cited documents
+    answer_cache.observe_generation(state.get("index_generation"), chunk_retriever.retired_documents)
+    answer = answer_cache.lookup(state["query_embedding"], used_chunk_ids)
+    if answer is None:
+        return None
+    return {**state, **answer, "answer_cache_hit": True}
+
+
+def remember_answer(result: QueryState, answer_cache: Optional[AnswerCache], used_chunk_ids, used_document_ids):
+    if answer_cache is None or result.get("query_embedding") is None:
+        return
+    answer_cache.put(
+        result["query_embedding"],
+        used_chunk_ids,
+        used_document_ids,
+        {k: result[k] for k in ANSWER_FIELDS}
+    )
+
+
+def answer_generation_node(state: QueryState, chunk_retriever: ChunksRetriever,
+                           answer_cache: Optional[AnswerCache] = None) -> QueryState:
+    # HARD STOP - no evidence
+    if not state.get("retrieved_chunks"):
+        return {
+            "answer_text": None,
+            "answer_citations": [],
+            "answer_supported": False
+        }
+
+    contexts, used_chunk_ids, used_document_ids, report = build_context(state, chunk_retriever)
+    if not contexts:
+        return {**no_answer(state), "answer_context": report}
+
+    cached = cached_answer(state, chunk_retriever, answer_cache, used_chunk_ids)
+    if cached is not None:
+        return {**cached, "answer_context": {**report, "prompt_tokens": 0}}
+
+    # LLM
+    llm = get_llm()
+    messages = answer_messages(state["user_query"], contexts)
+    report["prompt_tokens"] = prompt_tokens(messages)
+    response = llm.invoke(messages).content.strip()
+    result = parse_answer(state, response, used_chunk_ids)
+    remember_answer(result, answer_cache, used_chunk_ids, used_document_ids)
+    return {**result, "answer_cache_hit": False, "answer_context": report}
+
+
+async def answer_generation_node_async(state: QueryState, chunk_retriever: ChunksRetriever,
+                                       answer_cache: Optional[AnswerCache] = None) -> QueryState:
+    if not state.get("retrieved_chunks"):
+        return {
+            "answer_text": None,
+            "answer_citations": [],
+            "answer_supported": False
+        }
+
+    # chunk text comes from postgres; keep the blocking reads off the loop
+    contexts, used_chunk_ids, used_document_ids, report = await asyncio.to_thread(build_context, state, chunk_retriever)
+    if not contexts:
+        return {**no_answer(state), "answer_context": report}
+
+    cached = await asyncio.to_thread(cached_answer, state, chunk_retriever, answer_cache, used_chunk_ids)
+    if cached is not None:
+        return {**cached, "answer_context": {**report, "prompt_tokens": 0}}
+
+    messages = answer_messages(state["user_query"], contexts)
+    report["prompt_tokens"] = prompt_tokens(messages)
+    response = await ainvoke_llm(messages)
+    result = parse_answer(state, response.content.strip(), used_chunk_ids)
+    remember_answer(result, answer_cache, used_chunk_ids, used_document_ids)
+    return {**result, "answer_cache_hit": False, "answer_context": report}
+
+
+
+# --------------------------------------------------
+# Streaming
+# --------------------------------------------------
+def _chunk_text(chunk) -> str:
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    # some models stream a list of content parts
+    return "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+
+
+async def answer_generation_node_stream(state: QueryState, chunk_retriever: ChunksRetriever,
+                                        on_text: Callable[[str], None],
+                                        answer_cache: Optional[AnswerCache] = None) -> QueryState:
+    """
+    answer_generation_node_async that hands answer text to on_text as it
+    is generated.
+
+    The first GATE_PREFIX_CHARS characters are buffered so a refusal
+    (INSUFFICIENT_EVIDENCE) never reaches on_text; a refusal stops the
+    stream. If the marker only shows up after text was released, the
+    result is still answer_supported=False, and the caller must honour
+    that over the streamed text.
+
+    answer_timing: first_token_ms (model), first_text_ms (released to
+    on_text) and total_ms, all from the start of the node.
+    """
+    started = time.perf_counter()
+    elapsed = lambda: round((time.perf_counter() - started) * 1000, 3)
+
+    if not state.get("retrieved_chunks"):
+        return {
+            "answer_text": None,
+            "answer_citations": [],
+            "answer_supported": False
+        }
+
+    contexts, used_chunk_ids, used_document_ids, report = await asyncio.to_thread(build_context, state, chunk_retriever)
+    if not contexts:
+        return {**no_answer(state), "answer_context": report}
+
+    cached = await asyncio.to_thread(cached_answer, state, chunk_retriever, answer_cache, used_chunk_ids)
+    if cached is not None:
+        if cached["answer_supported"]:
+            on_text(cached["answer_text"])
+        return {**cached, "answer_context": {**report, "prompt_tokens": 0}, "answer_timing": {"first_token_ms": None, "first_text_ms": elapsed(), "total_ms": elapsed()}}
+
+    timing = {"first_token_ms": None, "first_text_ms": None, "total_ms": None}
+    parts = []
+    released = 0
+
+    def release(text: str):
+        nonlocal released
+        if len(text) > released:
+            if timing["first_text_ms"] is None:
+                timing["first_text_ms"] = elapsed()
+            on_text(text[released:])
+            released = len(text)
+
+    messages = answer_messages(state["user_query"], contexts)
+    report["prompt_tokens"] = prompt_tokens(messages)
+    stream = astream_llm(messages)
+    async with aclosing(stream):
+        async for chunk in stream:
+            if timing["first_token_ms"] is None:
+                timing["first_token_ms"] = elapsed()
+            parts.append(_chunk_text(chunk))
+
+            text = "".join(parts).lstrip()
+            if REFUSAL_MARKER in text:
+                break
+            if len(text) >= GATE_PREFIX_CHARS:
+                release(text)
+
+    response = "".join(parts).strip()
+    if REFUSAL_MARKER not in response:
+        release(response)
+
+    result = parse_answer(state, response, used_chunk_ids)
+    remember_answer(result, answer_cache, used_chunk_ids, used_document_ids)
+    timing["total_ms"] = elapsed()
+    return {**result, "answer_cache_hit": False, "answer_context": report, "answer_timing": timing}
 
 if __name__ == "__main__":
     """
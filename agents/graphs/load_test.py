@@ -0,0 +1,96 @@
+# load_test.py
+"""
+Sync vs async load test of the LLM-bound path (intent → rewrite → answer)
+against utils.fake_llm.FakeLLM, so no Gemini quota or DB is needed.
+
+    python -m agents.graphs.load_test --requests 200 --latency-ms 800 --threads 16 --concurrency 64
+"""
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from agents.graphs.query_understanding import build_query_understanding_graph
+from agents.answer import answer_generation_node, answer_generation_node_async
+from utils.llm import set_llm, set_llm_cache, set_llm_concurrency
+from utils.fake_llm import FakeLLM
+
+
+class InMemoryChunks:
+    """ChunksRetriever.get() / get_many() over a dict."""
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def get(self, chunk_id):
+        return {"chunk_id": chunk_id, "document_id": "load-test", "text": self.texts.get(chunk_id)}
+
+    def get_many(self, chunk_ids):
+        return {cid: self.get(cid) for cid in chunk_ids if cid in self.texts}
+
+
+CHUNKS = InMemoryChunks({f"chunk-{i}": f"Evidence sentence number {i}." for i in range(5)})
+RETRIEVED = [{"chunk_id": f"chunk-{i}"} for i in range(5)]
+
+
+def _initial_state(i: int):
+    return {"user_query": f"what does document {i} say about onboarding?"}
+
+
+def run_sync(graph, n: int, threads: int):
+    def one(i):
+        started = time.perf_counter()
+        state = graph.invoke(_initial_state(i))
+        answer_generation_node({**state, "retrieved_chunks": RETRIEVED}, CHUNKS)
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(one, range(n)))
+
+
+async def run_async(graph, n: int):
+    async def one(i):
+        started = time.perf_counter()
+        state = await graph.ainvoke(_initial_state(i))
+        await answer_generation_node_async({**state, "retrieved_chunks": RETRIEVED}, CHUNKS)
+        return (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(one(i) for i in range(n)))
+
+
+def report(mode: str, latencies, wall_s: float, llm: FakeLLM):
+    lat = np.asarray(latencies)
+    print(
+        f"[{mode}] requests={len(lat)} wall={wall_s:.2f}s "
+        f"throughput={len(lat) / wall_s:.1f} req/s "
+        f"p50={np.percentile(lat, 50):.0f}ms p95={np.percentile(lat, 95):.0f}ms "
+        f"llm_calls={llm.calls} max_in_flight={llm.max_in_flight}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--threads", type=int, default=16, help="worker threads for the sync run")
+    parser.add_argument("--concurrency", type=int, default=64, help="LLM_MAX_CONCURRENCY for the async run")
+    args = parser.parse_args()
+
+    graph = build_query_understanding_graph()
+    set_llm_cache(False)
+
+    llm = FakeLLM(args.latency_ms, args.jitter_ms, seed=0)
+    set_llm(llm)
+    started = time.perf_counter()
+    latencies = run_sync(graph, args.requests, args.threads)
+    report("SYNC", latencies, time.perf_counter() - started, llm)
+
+    llm = FakeLLM(args.latency_ms, args.jitter_ms, seed=0)
+    set_llm(llm)
+    set_llm_concurrency(args.concurrency)
+    started = time.perf_counter()
+    latencies = asyncio.run(run_async(graph, args.requests))
+    report("ASYNC", latencies, time.perf_counter() - started, llm)
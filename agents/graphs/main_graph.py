@@ -0,0 +1,345 @@
+# main_graph.py
+import time
+import asyncio
+import threading
+
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.runnables.config import var_child_runnable_config
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import StreamWriter
+from agents.state import QueryState
+from agents.intent_check import intent_check_node, intent_check_node_async
+from agents.rewrite import rewrite_node, rewrite_node_async
+from agents.understand import understand_node, understand_node_async
+from agents.intent_classifier import local_intent_node, local_intent_node_async, get_intent_classifier
+from agents.embed_query import embed_query_node
+from agents.retrieve import retrieve_node
+from agents.rerank import rerank_node
+from agents.retrieval_validation import retrieval_validation_node
+from agents.answer import answer_generation_node, answer_generation_node_async, answer_generation_node_stream
+from agents.multi_hop import map_reduce_answer_node, map_reduce_answer_node_async, use_map_reduce
+from agents.graphs.query_understanding import refuse_node
+from retrieval.service import get_retrieval_service
+from retrieval.cache import get_retrieval_cache
+from retrieval.answer_cache import get_answer_cache
+from utils.refusal import refusal_message
+from utils.deadline import has_budget, skipped
+from config import COMBINED_UNDERSTANDING, MULTI_HOP_MAP_REDUCE
+
+# keys each parallel branch owns; parallel nodes may only write their own
+INTENT_KEYS = ("intent", "intent_confidence", "intent_reason", "should_refuse", "intent_source")
+EMBED_KEYS = ("query_embedding",)
+REWRITE_KEYS = ("rewritten_queries", "rewrite_risk")
+
+
+def stage(name, node, keys=None, anode=None):
+    """
+    Wrap a node to record its latency in stage_latency_ms.
+    keys → return only those fields (required for nodes that run in parallel).
+    anode → coroutine variant used under graph.ainvoke; without one the
+    sync node runs in a worker thread so the event loop is never blocked.
+    """
+    def finish(update, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        if keys is not None:
+            update = {k: update[k] for k in keys if k in update}
+        return {**update, "stage_latency_ms": {name: elapsed}}
+
+    def run(state: QueryState):
+        started = time.perf_counter()
+        return finish(node(state), started)
+
+    async def arun(state: QueryState):
+        started = time.perf_counter()
+        if anode is not None:
+            update = await anode(state)
+        else:
+            update = await asyncio.to_thread(node, state)
+        return finish(update, started)
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+def accept_node(state: QueryState):
+    # combined mode: rewrites already came with the intent; only gates RETRIEVE
+    return {}
+
+
+def no_evidence_node(state: QueryState):
+    return {
+        "final_answer": refusal_message(state.get("retrieval_failure_reason") or "insufficient_evidence")
+    }
+
+
+def finalize_node(state: QueryState):
+    if state.get("answer_supported"):
+        return {"final_answer": state["answer_text"]}
+    return {"final_answer": refusal_message("insufficient_evidence")}
+
+
+def route_after_intent(state: QueryState) -> str:
+    if state["should_refuse"]:
+        return "REFUSE"
+    return "REWRITE"
+
+
+def route_after_validation(state: QueryState) -> str:
+    if state.get("retrieval_valid"):
+        return "ANSWER"
+    return "NO_EVIDENCE"
+
+
+def route_after_validation_map_reduce(state: QueryState) -> str:
+    route = route_after_validation(state)
+    if route == "ANSWER" and use_map_reduce(state):
+        return "MAP_REDUCE"
+    return route
+
+
+def build_main_graph(chunk_loader, retrieval_service=None, retrieval_cache=None, reranker=None,
+                     combined_understanding: bool = None, intent_classifier=None, answer_cache=None,
+                     stream_answers: bool = False, map_reduce: bool = None):
+    """
+    End-to-end query graph.
+
+        START ─┬─ INTENT_CHECK ─┬─ REFUSE ─────────────────────────── END
+               │                └─ REWRITE ─┐
+               └─ EMBED ────────────────────┴─ RETRIEVE ─ (RERANK) ─ VALIDATE ─┬─ ANSWER ──────┬─ FINALIZE ─ END
+                                                                              ├─ (MAP_REDUCE) ┘
+                                                                              └─ NO_EVIDENCE ─────────── END
+
+    - EMBED runs alongside the intent LLM call, so its cost is hidden.
+    - A refused query ends at REFUSE; RETRIEVE waits for both REWRITE
+      and EMBED, so no index is searched for it.
+    - A failed validation ends at NO_EVIDENCE without an answer LLM call.
+    - map_reduce (default config.MULTI_HOP_MAP_REDUCE) sends multi_hop
+      queries with several sub-questions to MAP_REDUCE: per-sub-question
+      retrieval in one batch, concurrent sub-answers, one reduce call.
+
+    combined_understanding (default config.COMBINED_UNDERSTANDING) swaps
+    INTENT_CHECK → REWRITE for UNDERSTAND → ACCEPT: one LLM call returns
+    intent and rewrites, and ACCEPT only gates RETRIEVE.
+
+    intent_classifier (agents.intent_classifier) lets INTENT_CHECK take
+    confident intents from the query embedding and skip the LLM call.
+    It needs the embedding first, so EMBED then runs before INTENT_CHECK
+    instead of beside it: a fallback pays the embedding time (tens of
+    ms) and a local hit saves the LLM round-trip. That ordering is also
+    what gives the intent LLM call the semantic tier of CachedLLM
+    (utils/llm_cache.py); the default path uses its exact tier only.
+
+    retrieval_cache and answer_cache default to the process-wide
+    instances; pass False to disable either.
+
+    A "deadline" in the input (utils.deadline.with_deadline) is checked
+    by every optional stage: rewrite, multi-query and image search in
+    RETRIEVE, RERANK and MAP_REDUCE are skipped or fall back when the
+    remaining budget is too small, and listed in skipped_stages. Search
+    signal timeouts are cut to the remaining budget too (recorded there
+    as "<signal>_timeout").
+
+    stream_answers makes ANSWER emit text as it is generated, as
+    {"answer_delta": text} on the "custom" stream (a MAP_REDUCE answer
+    arrives as one delta). That graph is async-only:
+
+        async for mode, data in graph.astream(inputs, stream_mode=["custom", "values"]):
+            ...
+
+    The compiled graph serves both invoke and ainvoke. Under ainvoke the
+    LLM nodes await utils.llm.ainvoke_llm (capped by LLM_MAX_CONCURRENCY)
+    and the CPU / index / DB stages run in worker threads, so one event
+    loop can hold many requests that are waiting on Gemini.
+    """
+    if retrieval_service is None:
+        retrieval_service = get_retrieval_service()
+    if retrieval_cache is None:
+        retrieval_cache = get_retrieval_cache()
+    if answer_cache is None:
+        answer_cache = get_answer_cache()
+    answer_cache = answer_cache or None
+    if combined_understanding is None:
+        combined_understanding = COMBINED_UNDERSTANDING
+    if map_reduce is None:
+        map_reduce = MULTI_HOP_MAP_REDUCE
+    if combined_understanding and intent_classifier is not None:
+        raise ValueError("intent_classifier replaces the intent call of the two-call path; disable combined_understanding")
+
+    graph = StateGraph(QueryState)
+
+    # Nodes
+    if combined_understanding:
+        entry, accepted = "UNDERSTAND", "ACCEPT"
+        graph.add_node(entry, stage("understand", understand_node, keys=INTENT_KEYS + REWRITE_KEYS, anode=understand_node_async))
+        graph.add_node(accepted, accept_node)
+    elif intent_classifier is not None:
+        entry, accepted = "INTENT_CHECK", "REWRITE"
+        graph.add_node(
+            entry,
+            stage(
+                "intent",
+                lambda state: local_intent_node(state, intent_classifier),
+                keys=INTENT_KEYS,
+                anode=lambda state: local_intent_node_async(state, intent_classifier)
+            )
+        )
+        graph.add_node(accepted, stage("rewrite", rewrite_node, anode=rewrite_node_async))
+    else:
+        entry, accepted = "INTENT_CHECK", "REWRITE"
+        graph.add_node(entry, stage("intent", intent_check_node, keys=INTENT_KEYS, anode=intent_check_node_async))
+        graph.add_node(accepted, stage("rewrite", rewrite_node, anode=rewrite_node_async))
+    graph.add_node("EMBED", stage("embed", embed_query_node, keys=EMBED_KEYS))
+    graph.add_node("REFUSE", refuse_node)
+    graph.add_node(
+        "RETRIEVE",
+        stage("retrieve", lambda state: retrieve_node(state, retrieval_service, retrieval_cache or None))
+    )
+    if reranker is not None:
+        graph.add_node("RERANK", stage("rerank", lambda state: rerank_node(state, chunk_loader, reranker)))
+    graph.add_node("VALIDATE", stage("validate", lambda state: retrieval_validation_node(state, chunk_loader)))
+    if stream_answers:
+        async def answer_streaming(state: QueryState, config: RunnableConfig, writer: StreamWriter):
+            started = time.perf_counter()
+            # the writer reads the run config from a contextvar, which async
+            # nodes do not inherit before Python 3.11
+            token = var_child_runnable_config.set(config)
+            try:
+                update = await answer_generation_node_stream(
+                    state, chunk_loader, lambda text: writer({"answer_delta": text}), answer_cache
+                )
+            finally:
+                var_child_runnable_config.reset(token)
+            return {**update, "stage_latency_ms": {"answer": (time.perf_counter() - started) * 1000}}
+
+        graph.add_node("ANSWER", answer_streaming)
+
+        async def map_reduce_streaming(state: QueryState, config: RunnableConfig, writer: StreamWriter):
+            started = time.perf_counter()
+            token = var_child_runnable_config.set(config)
+            try:
+                if has_budget(state, "map_reduce"):
+                    update = await map_reduce_answer_node_async(state, retrieval_service, chunk_loader)
+                    if update["answer_supported"]:
+                        writer({"answer_delta": update["answer_text"]})
+                else:
+                    skip = skipped(state, "map_reduce")
+                    update = await answer_generation_node_stream(
+                        state, chunk_loader, lambda text: writer({"answer_delta": text}), answer_cache
+                    )
+                    update = {**update, **skip}
+            finally:
+                var_child_runnable_config.reset(token)
+            return {**update, "stage_latency_ms": {"map_reduce": (time.perf_counter() - started) * 1000}}
+
+        if map_reduce:
+            graph.add_node("MAP_REDUCE", map_reduce_streaming)
+    else:
+        graph.add_node(
+            "ANSWER",
+            stage(
+                "answer",
+                lambda state: answer_generation_node(state, chunk_loader, answer_cache),
+                anode=lambda state: answer_generation_node_async(state, chunk_loader, answer_cache)
+            )
+        )
+        if map_reduce:
+            graph.add_node(
+                "MAP_REDUCE",
+                stage(
+                    "map_reduce",
+                    lambda state: map_reduce_answer_node(state, retrieval_service, chunk_loader, answer_cache),
+                    anode=lambda state: map_reduce_answer_node_async(state, retrieval_service, chunk_loader, answer_cache)
+                )
+            )
+    graph.add_node("NO_EVIDENCE", no_evidence_node)
+    graph.add_node("FINALIZE", finalize_node)
+
+    if intent_classifier is not None:
+        # the classifier reads the query embedding
+        graph.add_edge(START, "EMBED")
+        graph.add_edge("EMBED", entry)
+    else:
+        # Fan out: intent LLM call and query embedding in parallel
+        graph.add_edge(START, entry)
+        graph.add_edge(START, "EMBED")
+
+    graph.add_conditional_edges(
+        entry,
+        route_after_intent,
+        {
+            "REWRITE": accepted,
+            "REFUSE": "REFUSE"
+        }
+    )
+    graph.add_edge("REFUSE", END)
+
+    # Join: retrieval needs the rewrites and the embedding
+    graph.add_edge([accepted, "EMBED"], "RETRIEVE")
+
+    if reranker is not None:
+        graph.add_edge("RETRIEVE", "RERANK")
+        graph.add_edge("RERANK", "VALIDATE")
+    else:
+        graph.add_edge("RETRIEVE", "VALIDATE")
+
+    if map_reduce:
+        graph.add_conditional_edges(
+            "VALIDATE",
+            route_after_validation_map_reduce,
+            {
+                "ANSWER": "ANSWER",
+                "MAP_REDUCE": "MAP_REDUCE",
+                "NO_EVIDENCE": "NO_EVIDENCE"
+            }
+        )
+        graph.add_edge("MAP_REDUCE", "FINALIZE")
+    else:
+        graph.add_conditional_edges(
+            "VALIDATE",
+            route_after_validation,
+            {
+                "ANSWER": "ANSWER",
+                "NO_EVIDENCE": "NO_EVIDENCE"
+            }
+        )
+    graph.add_edge("ANSWER", "FINALIZE")
+    graph.add_edge("FINALIZE", END)
+    graph.add_edge("NO_EVIDENCE", END)
+
+    return graph.compile()
+
+
+# --------------------------------------------------
+# Process-wide instance
+# --------------------------------------------------
+_main_graph = None
+_main_graph_lock = threading.Lock()
+
+def get_main_graph():
+    """Compiled once per process; indexes, models and DB connection are shared."""
+    global _main_graph
+    with _main_graph_lock:
+        if _main_graph is None:
+            import psycopg2
+            from retrieval.chunks_retriever import ChunksRetriever
+            from config import DB_CONFIG
+
+            conn = psycopg2.connect(**DB_CONFIG)
+            # shared by every request thread: read-only autocommit never
+            # leaves a transaction open (or aborted) between queries
+            conn.set_session(readonly=True, autocommit=True)
+            chunk_loader = ChunksRetriever(conn)
+            # a trained local intent classifier is used when one exists
+            classifier = None if COMBINED_UNDERSTANDING else get_intent_classifier()
+            _main_graph = build_main_graph(chunk_loader, intent_classifier=classifier)
+    return _main_graph
+
+
+if __name__ == "__main__":
+    get_retrieval_service().start_in_background()
+
+    graph = get_main_graph()
+    result = graph.invoke({
+        "user_query": "what are the skills required for ai/ml engineer?"
+    })
+    print(result["final_answer"])
+    print(result["stage_latency_ms"])
@@ -1,8 +1,10 @@
 # graph.py
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from agents.state import QueryState
-from agents.intent_check import intent_check_node
-from agents.rewrite import rewrite_node
+from agents.intent_check import intent_check_node, intent_check_node_async
+from agents.rewrite import rewrite_node, rewrite_node_async
+from agents.understand import understand_node, understand_node_async
 from utils.refusal import refusal_message
 
 def refuse_node(state: QueryState):
@@ -15,12 +17,33 @@ def route_after_intent(state: QueryState) -> str:
         return "REFUSE"
     return "REWRITE"
 
-def build_query_understanding_graph():
+def route_after_understanding(state: QueryState) -> str:
+    if state["should_refuse"]:
+        return "REFUSE"
+    return "END"
+
+def build_query_understanding_graph(combined: bool = False):
+    """combined → one UNDERSTAND call (agents/understand.py) instead of INTENT_CHECK → REWRITE."""
     graph = StateGraph(QueryState)
 
-    # nodes
-    graph.add_node("INTENT_CHECK", intent_check_node)
-    graph.add_node("REWRITE", rewrite_node)
+    if combined:
+        graph.add_node("UNDERSTAND", RunnableLambda(understand_node, afunc=understand_node_async))
+        graph.add_node("REFUSE", refuse_node)
+        graph.set_entry_point("UNDERSTAND")
+        graph.add_conditional_edges(
+            "UNDERSTAND",
+            route_after_understanding,
+            {
+                "END": END,
+                "REFUSE": "REFUSE"
+            }
+        )
+        graph.add_edge("REFUSE", END)
+        return graph.compile()
+
+    # nodes (sync for invoke, async for ainvoke)
+    graph.add_node("INTENT_CHECK", RunnableLambda(intent_check_node, afunc=intent_check_node_async))
+    graph.add_node("REWRITE", RunnableLambda(rewrite_node, afunc=rewrite_node_async))
     graph.add_node("REFUSE", refuse_node)
 
     # node entry
@@ -2,21 +2,39 @@
 from langgraph.graph import StateGraph
 from agents.state import QueryState
 from agents.retrieve import retrieve_node
+from agents.rerank import rerank_node
 from agents.retrieval_validation import retrieval_validation_node
+from retrieval.service import get_retrieval_service
+from retrieval.cache import get_retrieval_cache
 
 
-def build_retrieval_graph(chunk_loader):
+def build_retrieval_graph(chunk_loader, retrieval_service=None, retrieval_cache=None, reranker=None):
     """
     Retrieval + Validation graph.
     Responsibilities:
     - Step 4: retrieve candidate chunks
     - Step 6: validate retrieval safety
+
+    retrieval_service defaults to the process-wide instance, so every
+    compiled graph searches the same warm indexes. retrieval_cache works
+    the same way; pass False to disable caching.
+
+    reranker (retrieval.rerank.get_reranker()) adds a cross-encoder
+    rerank between retrieve and validate; None keeps fused order.
     """
+    if retrieval_service is None:
+        retrieval_service = get_retrieval_service()
+    if retrieval_cache is None:
+        retrieval_cache = get_retrieval_cache()
 
     graph = StateGraph(QueryState)
 
     # Nodes
-    graph.add_node("retrieve", retrieve_node)
+    # retrieve needs the long-lived service that owns the loaded indexes
+    graph.add_node(
+        "retrieve",
+        lambda state: retrieve_node(state, retrieval_service, retrieval_cache or None)
+    )
 
     # validation needs chunk_loader for limited text inspection
     graph.add_node(
@@ -24,8 +42,18 @@ def build_retrieval_graph(chunk_loader):
         lambda state: retrieval_validation_node(state, chunk_loader)
     )
 
+    if reranker is not None:
+        graph.add_node(
+            "rerank",
+            lambda state: rerank_node(state, chunk_loader, reranker)
+        )
+
     # Edges
-    graph.add_edge("retrieve", "validate")
+    if reranker is not None:
+        graph.add_edge("retrieve", "rerank")
+        graph.add_edge("rerank", "validate")
+    else:
+        graph.add_edge("retrieve", "validate")
 
     # Entry + Exit
     graph.set_entry_point("retrieve")
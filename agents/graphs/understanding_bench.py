@@ -0,0 +1,76 @@
+# understanding_bench.py
+"""
+p50 / p95 of query understanding: INTENT_CHECK → REWRITE (two LLM calls)
+vs UNDERSTAND (one call), on the same queries, plus how often the two
+modes agree on intent.
+
+    python -m agents.graphs.understanding_bench                      # Gemini
+    python -m agents.graphs.understanding_bench --queries queries.txt
+    python -m agents.graphs.understanding_bench --fake-latency-ms 700
+"""
+import time
+import argparse
+
+import numpy as np
+
+from agents.graphs.query_understanding import build_query_understanding_graph
+from utils.llm import set_llm, set_llm_cache
+from utils.fake_llm import FakeLLM
+
+SAMPLE_QUERIES = [
+    "what are the skills required for ai/ml engineer?",
+    "which python version does the project require?",
+    "how does the onboarding process compare to the offboarding process?",
+    "why did revenue grow faster in Q3 than in Q2?",
+    "who approved the travel policy and when was it last updated?",
+    "what is the capital of the moon?",
+    "summarize the security guidelines for remote access",
+    "list the steps to reset a forgotten password",
+]
+
+
+def run(graph, queries, repeats: int):
+    latencies, intents = [], []
+    for _ in range(repeats):
+        for q in queries:
+            started = time.perf_counter()
+            result = graph.invoke({"user_query": q})
+            latencies.append((time.perf_counter() - started) * 1000)
+            intents.append(result["intent"])
+    return np.asarray(latencies), intents
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", help="file with one query per line (default: built-in sample)")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--fake-latency-ms", type=float, help="use FakeLLM instead of Gemini")
+    args = parser.parse_args()
+
+    queries = SAMPLE_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    # measure LLM calls, not cache hits
+    set_llm_cache(False)
+    if args.fake_latency_ms is not None:
+        set_llm(FakeLLM(args.fake_latency_ms, jitter_ms=args.fake_latency_ms / 4, seed=0))
+
+    results = {}
+    for mode, combined in (("SEPARATE", False), ("COMBINED", True)):
+        latencies, intents = run(build_query_understanding_graph(combined=combined), queries, args.repeats)
+        results[mode] = (latencies, intents)
+        print(
+            f"[{mode}] queries={len(latencies)} "
+            f"p50={np.percentile(latencies, 50):.0f}ms p95={np.percentile(latencies, 95):.0f}ms "
+            f"mean={latencies.mean():.0f}ms"
+        )
+
+    separate, combined = results["SEPARATE"], results["COMBINED"]
+    agreement = np.mean([a == b for a, b in zip(separate[1], combined[1])])
+    print(
+        f"[SAVED] p50={np.percentile(separate[0], 50) - np.percentile(combined[0], 50):.0f}ms "
+        f"p95={np.percentile(separate[0], 95) - np.percentile(combined[0], 95):.0f}ms "
+        f"intent_agreement={agreement:.1%}"
+    )
@@ -1,7 +1,12 @@
 # intent_check.py (NODE-1)
+import time
+import threading
+
 from agents.state import QueryState
-from utils.llm import get_llm
+from utils.llm import get_control_llm, ainvoke_llm
 from utils.json import extract_json
+from utils.llm_cache import CachedLLM
+from config import INTENT_LABEL_LOG
 import json
 
 INTENT_LABELS = [
@@ -12,11 +17,7 @@ INTENT_LABELS = [
     "unknown"
 ]
 
-def intent_check_node(state: QueryState) -> QueryState:
-    query = state["user_query"]
-    llm = get_llm()
-
-    system_prompt = """
+SYSTEM_PROMPT = """
         You are an intent classifier for a retrieval system.
 
         Allowed labels:
@@ -39,20 +40,26 @@ def intent_check_node(state: QueryState) -> QueryState:
     """
 
 
-
+def intent_prompt(query: str) -> str:
     user_prompt = f"""
     Query: "{query}"
 
     Decide intent.
     Explain briefly.
     """
+    return SYSTEM_PROMPT + user_prompt
 
-    response = llm.invoke(system_prompt + user_prompt)
-    # print("RAW LLM OUTPUT:\n", response.content)
 
+def parse_intent(state: QueryState, content: str) -> QueryState:
     try:
-        parsed = extract_json(response.content)
+        parsed = extract_json(content)
     except Exception:
+        parsed = None
+    return apply_intent(state, parsed)
+
+
+def apply_intent(state: QueryState, parsed) -> QueryState:
+    if not isinstance(parsed, dict):
         # if model can’t follow instructions → safest option
         return {
             **state,
@@ -75,3 +82,52 @@ def intent_check_node(state: QueryState) -> QueryState:
         "should_refuse": should_refuse
     }
 
+
+# --------------------------------------------------
+# Label log (training data for agents/intent_classifier.py)
+# --------------------------------------------------
+_label_log_lock = threading.Lock()
+
+def log_intent_label(result: QueryState, latency_ms: float):
+    if not INTENT_LABEL_LOG or result["intent"] == "unknown":
+        return
+    record = {
+        "query": result["user_query"],
+        "intent": result["intent"],
+        "confidence": result["intent_confidence"],
+        "latency_ms": round(latency_ms, 1)
+    }
+    with _label_log_lock:
+        with open(INTENT_LABEL_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def _cache_hints(llm, state: QueryState) -> dict:
+    # semantic cache tier (utils/llm_cache.py); the plain model takes no extra kwargs.
+    # Only the intent classifier path has the embedding here (EMBED runs
+    # first); on the default path intent runs beside EMBED and gets the
+    # exact tier only rather than embedding the query twice
+    if not isinstance(llm, CachedLLM) or state.get("query_embedding") is None:
+        return {}
+    return {"query": state["user_query"], "query_embedding": state["query_embedding"]}
+
+
+def intent_check_node(state: QueryState) -> QueryState:
+    started = time.perf_counter()
+    query = state["user_query"]
+    llm = get_control_llm()
+    # intent depends on what is asked, so near-duplicate queries may share a label
+    response = llm.invoke(intent_prompt(query), **_cache_hints(llm, state))
+    # print("RAW LLM OUTPUT:\n", response.content)
+    result = parse_intent(state, response.content)
+    log_intent_label(result, (time.perf_counter() - started) * 1000)
+    return {**result, "intent_source": "llm"}
+
+
+async def intent_check_node_async(state: QueryState) -> QueryState:
+    started = time.perf_counter()
+    llm = get_control_llm()
+    response = await ainvoke_llm(intent_prompt(state["user_query"]), llm, **_cache_hints(llm, state))
+    result = parse_intent(state, response.content)
+    log_intent_label(result, (time.perf_counter() - started) * 1000)
+    return {**result, "intent_source": "llm"}
@@ -0,0 +1,210 @@
+# intent_classifier.py
+"""
+Local intent classifier: nearest centroid over the BGE query embedding
+that embed_query_node already computes. Trained offline from the LLM
+labels intent_check_node appends to INTENT_LABEL_LOG.
+
+    python -m agents.intent_classifier train intent_labels.jsonl ./models/intent_centroids.npz
+    python -m agents.intent_classifier eval  intent_labels.jsonl ./models/intent_centroids.npz
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from agents.state import QueryState
+from agents.intent_check import intent_check_node, intent_check_node_async
+from retrieval.cache import normalize_query
+from config import INTENT_CLASSIFIER_PATH
+
+CONFIDENCE_THRESHOLD = 0.85
+SOFTMAX_TEMPERATURE = 0.02        # cosine gaps between centroids are small
+# the classifier may skip the LLM for these; refusals always go to the LLM
+LOCAL_LABELS = ("factual", "analytical", "multi_hop")
+# without its own centroid an unanswerable query just lands on the nearest
+# answerable one, so a model lacking it never skips the LLM
+REFUSAL_LABEL = "unanswerable"
+# softmax confidence is relative; a query far from every centroid (out of
+# domain) can still have a clear winner, so the winner must also be close
+MIN_SIMILARITY = 0.6
+MIN_EXAMPLES_PER_LABEL = 5
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype="float32")
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    return mat / np.maximum(norms, 1e-12)
+
+
+class IntentClassifier:
+    """Cosine nearest centroid; confidence is a softmax over centroid similarities."""
+
+    def __init__(self, labels: List[str], centroids: np.ndarray, temperature: float = SOFTMAX_TEMPERATURE):
+        self.labels = list(labels)
+        self.centroids = _normalize_rows(centroids)
+        self.temperature = temperature
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, labels: List[str], temperature: float = SOFTMAX_TEMPERATURE):
+        embeddings = _normalize_rows(embeddings)
+        labels = np.asarray(labels)
+        kept = [l for l in sorted(set(labels)) if (labels == l).sum() >= MIN_EXAMPLES_PER_LABEL]
+        if REFUSAL_LABEL not in kept:
+            raise ValueError(f"Need at least {MIN_EXAMPLES_PER_LABEL} examples labelled {REFUSAL_LABEL!r}")
+        centroids = np.stack([embeddings[labels == l].mean(axis=0) for l in kept])
+        return cls(kept, centroids, temperature)
+
+    def predict_batch(self, embeddings) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Per row: winning label, its softmax confidence and its cosine to the winning centroid."""
+        sims = _normalize_rows(np.atleast_2d(embeddings)) @ self.centroids.T
+        logits = (sims - sims.max(axis=1, keepdims=True)) / self.temperature
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        rows = np.arange(len(best))
+        return [self.labels[i] for i in best], probs[rows, best], sims[rows, best]
+
+    def predict(self, embedding) -> Tuple[str, float, float]:
+        labels, confidences, similarities = self.predict_batch(embedding)
+        return labels[0], float(confidences[0]), float(similarities[0])
+
+    def bypasses(self, labels, confidences, similarities, threshold: float = CONFIDENCE_THRESHOLD) -> np.ndarray:
+        """Which predictions may skip the LLM."""
+        if REFUSAL_LABEL not in self.labels:
+            return np.zeros(len(labels), dtype=bool)
+        return (
+            np.isin(labels, LOCAL_LABELS)
+            & (np.asarray(confidences) >= threshold)
+            & (np.asarray(similarities) >= MIN_SIMILARITY)
+        )
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, labels=np.asarray(self.labels), centroids=self.centroids, temperature=self.temperature)
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(path)
+        return cls(data["labels"].tolist(), data["centroids"], float(data["temperature"]))
+
+
+_classifier = None
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Trained model at INTENT_CLASSIFIER_PATH, or None when none has been trained."""
+    global _classifier
+    if _classifier is None and os.path.exists(INTENT_CLASSIFIER_PATH):
+        _classifier = IntentClassifier.load(INTENT_CLASSIFIER_PATH)
+    return _classifier
+
+
+# --------------------------------------------------
+# Node
+# --------------------------------------------------
+def classify_locally(state: QueryState, classifier: IntentClassifier,
+                     threshold: float = CONFIDENCE_THRESHOLD) -> Optional[QueryState]:
+    """Intent fields when the classifier is sure, else None (→ LLM)."""
+    if state.get("query_embedding") is None:
+        return None
+
+    intent, confidence, similarity = classifier.predict(state["query_embedding"])
+    if not classifier.bypasses([intent], [confidence], [similarity], threshold)[0]:
+        return None
+
+    return {
+        **state,
+        "intent": intent,
+        "intent_confidence": confidence,
+        "intent_reason": f"local classifier (p={confidence:.2f}, cos={similarity:.2f})",
+        "should_refuse": False,
+        "intent_source": "local"
+    }
+
+
+def local_intent_node(state: QueryState, classifier: IntentClassifier,
+                      threshold: float = CONFIDENCE_THRESHOLD) -> QueryState:
+    return classify_locally(state, classifier, threshold) or intent_check_node(state)
+
+
+async def local_intent_node_async(state: QueryState, classifier: IntentClassifier,
+                                  threshold: float = CONFIDENCE_THRESHOLD) -> QueryState:
+    return classify_locally(state, classifier, threshold) or await intent_check_node_async(state)
+
+
+# --------------------------------------------------
+# Offline training / evaluation
+# --------------------------------------------------
+def load_labels(path: str):
+    """Logged LLM labels, last label per normalized query."""
+    records = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                r = json.loads(line)
+                records[normalize_query(r["query"])] = r
+    return list(records.values())
+
+
+def evaluate(classifier: IntentClassifier, embeddings: np.ndarray, records,
+             thresholds=(0.6, 0.7, 0.8, 0.85, 0.9, 0.95)):
+    truth = [r["intent"] for r in records]
+    llm_ms = float(np.mean([r.get("latency_ms", 0.0) for r in records]))
+
+    started = time.perf_counter()
+    predicted, confidence, similarity = classifier.predict_batch(embeddings)
+    local_ms = (time.perf_counter() - started) * 1000 / len(records)
+
+    agree = np.asarray([p == t for p, t in zip(predicted, truth)])
+    print(f"[EVAL] queries={len(records)} overall_agreement={agree.mean():.1%} "
+          f"classifier={local_ms:.3f}ms/query llm_intent_mean={llm_ms:.0f}ms")
+
+    for threshold in thresholds:
+        bypass = classifier.bypasses(predicted, confidence, similarity, threshold)
+        coverage = bypass.mean()
+        agreement = agree[bypass].mean() if bypass.any() else float("nan")
+        saved_ms = coverage * llm_ms - local_ms
+        print(f"[EVAL] threshold={threshold:.2f} bypass={coverage:.1%} "
+              f"agreement_on_bypass={agreement:.1%} saved≈{saved_ms:.0f}ms/query")
+
+
+def _embed(records) -> np.ndarray:
+    from ingestion.embed_func import embed_texts
+    return embed_texts([r["query"] for r in records])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["train", "eval"])
+    parser.add_argument("labels", help="INTENT_LABEL_LOG jsonl")
+    parser.add_argument("model", nargs="?", default=INTENT_CLASSIFIER_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2, help="train: fraction kept for evaluation")
+    args = parser.parse_args()
+
+    records = load_labels(args.labels)
+    if not records:
+        print(f"❌ No labels in {args.labels}")
+        sys.exit(1)
+    embeddings = _embed(records)
+
+    if args.command == "eval":
+        evaluate(IntentClassifier.load(args.model), embeddings, records)
+        sys.exit(0)
+
+    # deterministic split so train / eval runs are comparable
+    order = np.random.default_rng(0).permutation(len(records))
+    n_test = int(len(records) * args.holdout)
+    test, train = order[:n_test], order[n_test:]
+
+    classifier = IntentClassifier.fit(embeddings[train], [records[i]["intent"] for i in train])
+    print(f"[TRAIN] examples={len(train)} labels={classifier.labels}")
+    if n_test:
+        evaluate(classifier, embeddings[test], [records[i] for i in test])
+
+    # the shipped model uses every example
+    classifier = IntentClassifier.fit(embeddings, [r["intent"] for r in records])
+    classifier.save(args.model)
+    print(f"✅ Saved intent classifier to {args.model}")
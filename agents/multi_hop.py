@@ -0,0 +1,224 @@
+# multi_hop.py
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from agents.state import QueryState
+from agents.answer import build_context, answer_messages, prompt_tokens, no_answer, parse_answer, REFUSAL_MARKER
+from agents.answer import answer_generation_node, answer_generation_node_async
+from ingestion.embed_func import embed_texts
+from retrieval.service import RetrievalService
+from retrieval.hybrid_fusion import evidence_score
+from retrieval.filters import MetadataFilter
+from retrieval.chunks_retriever import ChunksRetriever
+from retrieval.answer_cache import AnswerCache
+from retrieval.retrieval_pipeline import DENSE_TIMEOUT_MS, SPARSE_TIMEOUT_MS
+from utils.llm import get_llm, ainvoke_llm
+from utils.deadline import has_budget, skipped, clamp_timeouts
+from langchain_core.messages import SystemMessage, HumanMessage
+
+MAX_SUB_QUESTIONS = 5
+SUB_QUESTION_TOP_K = 5
+SUB_CONTEXT_TOKENS = 600
+# sub-question answer calls in flight per request (LLM_MAX_CONCURRENCY still caps the process)
+SUB_ANSWER_CONCURRENCY = 4
+
+REDUCE_PROMPT = """
+    You combine partial answers into one answer.
+
+    RULES:
+    - Use ONLY the partial answers below.
+    - Do NOT use external knowledge.
+    - If they do not answer the question, respond EXACTLY with:
+        "INSUFFICIENT_EVIDENCE"
+    - Keep the chunk IDs each partial answer cites.
+    """
+
+
+def sub_questions(state: QueryState) -> List[str]:
+    rewrites = state.get("rewritten_queries") or {}
+    questions = [q.strip() for q in (rewrites.get("sub_questions") or []) if isinstance(q, str) and q.strip()]
+    return questions[:MAX_SUB_QUESTIONS]
+
+
+def use_map_reduce(state: QueryState) -> bool:
+    return state.get("intent") == "multi_hop" and len(sub_questions(state)) > 1
+
+
+# --------------------------------------------------
+# Map: one batched retrieval, one answer per sub-question
+# --------------------------------------------------
+def retrieve_sub_questions(state: QueryState, retrieval_service: RetrievalService) -> Tuple[List[QueryState], dict]:
+    """
+    Sub-states ready for build_context, one per sub-question, and the
+    state update recording signal timeouts cut to the remaining budget.
+    """
+    questions = sub_questions(state)
+    query_embeddings = embed_texts(questions)
+    timeouts, clamped = clamp_timeouts(state, {"dense": DENSE_TIMEOUT_MS, "sparse": SPARSE_TIMEOUT_MS})
+    output = retrieval_service.search_each(
+        queries=questions,
+        query_embeddings=query_embeddings,
+        top_k=SUB_QUESTION_TOP_K,
+        # each sub-question is one question, not a set of variants
+        intent=None,
+        filters=MetadataFilter.from_dict(state.get("metadata_filter")),
+        dense_timeout_ms=timeouts["dense"],
+        sparse_timeout_ms=timeouts["sparse"]
+    )
+    sub_states = [
+        {
+            "user_query": question,
+            "retrieved_chunks": [{"chunk_id": r["chunk_id"], "source": "hybrid", "modality": r["modality"]} for r in results],
+            "retrieval_scores": [evidence_score(r) for r in results]
+        }
+        for question, results in zip(questions, output["retrieval_results"])
+    ]
+    return sub_states, clamped
+
+
+def prepare_sub_answer(sub_state: QueryState, chunk_retriever: ChunksRetriever):
+    contexts, used_chunk_ids, _, report = build_context(sub_state, chunk_retriever, max_tokens=SUB_CONTEXT_TOKENS)
+    if not contexts:
+        return None, used_chunk_ids, report
+    messages = answer_messages(sub_state["user_query"], contexts)
+    report["prompt_tokens"] = prompt_tokens(messages)
+    return messages, used_chunk_ids, report
+
+
+def sub_answer(sub_state: QueryState, response, used_chunk_ids, report, started: float,
+               error: Exception = None) -> dict:
+    if response is None:
+        parsed = no_answer(sub_state)
+    else:
+        parsed = parse_answer(sub_state, response.content.strip(), used_chunk_ids)
+    return {
+        "question": sub_state["user_query"],
+        "answer_text": parsed["answer_text"],
+        "answer_citations": parsed["answer_citations"],
+        "answer_supported": parsed["answer_supported"],
+        "prompt_tokens": report.get("prompt_tokens", 0),
+        "latency_ms": (time.perf_counter() - started) * 1000,
+        "error": None if error is None else repr(error)
+    }
+
+
+def failed_sub_answer(sub_state: QueryState, error: Exception, started: float) -> dict:
+    # one failed sub-question (DB read, LLM call) must not sink its siblings;
+    # it is an unsupported partial and the reduce works from the rest
+    print(f"⚠️ Sub-answer failed for {sub_state['user_query']!r}: {error!r}")
+    return sub_answer(sub_state, None, [], {}, started, error=error)
+
+
+# --------------------------------------------------
+# Reduce
+# --------------------------------------------------
+def reduce_messages(query: str, answers: List[dict]):
+    partials = "\n\n".join(
+        f"Sub-question: {a['question']}\nAnswer: {a['answer_text']}"
+        for a in answers
+    )
+    user_prompt = f"""
+    Question:
+    {query}
+
+    Partial answers:
+    {partials}
+
+    Answer format:
+    - Answer (1-3 sentences max)
+    - Evidence: [chunk_id, chunk_id]
+    """
+    return [
+        SystemMessage(content=REDUCE_PROMPT),
+        HumanMessage(content=user_prompt)
+    ]
+
+
+def merged_citations(answers: List[dict]) -> List[str]:
+    seen, merged = set(), []
+    for a in answers:
+        for chunk_id in a["answer_citations"]:
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                merged.append(chunk_id)
+    return merged
+
+
+def reduce_result(state: QueryState, answers: List[dict], response) -> QueryState:
+    supported = [a for a in answers if a["answer_supported"]]
+    if response is None or REFUSAL_MARKER in response.content:
+        return {**no_answer(state), "sub_answers": answers}
+    return {
+        **state,
+        "answer_text": response.content.strip(),
+        "answer_citations": merged_citations(supported),
+        "answer_supported": True,
+        "sub_answers": answers
+    }
+
+
+# --------------------------------------------------
+# Nodes
+# --------------------------------------------------
+def map_reduce_answer_node(state: QueryState, retrieval_service: RetrievalService,
+                           chunk_retriever: ChunksRetriever, answer_cache: Optional[AnswerCache] = None) -> QueryState:
+    """
+    multi_hop answer: retrieve every sub-question in one batch, answer
+    them concurrently (SUB_ANSWER_CONCURRENCY at a time), then one
+    reduce call over the supported partial answers. Wall-clock is about
+    the slowest sub-answer plus the reduce, not the sum. A sub-answer
+    that raises becomes an unsupported partial (with its "error").
+
+    Short on budget (utils/deadline.py): answer_generation_node over the
+    main retrieval instead.
+    """
+    if not has_budget(state, "map_reduce"):
+        skip = skipped(state, "map_reduce")
+        return {**answer_generation_node(state, chunk_retriever, answer_cache), **skip}
+
+    llm = get_llm()
+    sub_states, clamped = retrieve_sub_questions(state, retrieval_service)
+
+    def one(sub_state):
+        started = time.perf_counter()
+        try:
+            messages, used_chunk_ids, report = prepare_sub_answer(sub_state, chunk_retriever)
+            response = llm.invoke(messages) if messages else None
+        except Exception as e:
+            return failed_sub_answer(sub_state, e, started)
+        return sub_answer(sub_state, response, used_chunk_ids, report, started)
+
+    with ThreadPoolExecutor(max_workers=SUB_ANSWER_CONCURRENCY, thread_name_prefix="sub-answer") as pool:
+        answers = list(pool.map(one, sub_states))
+
+    supported = [a for a in answers if a["answer_supported"]]
+    response = llm.invoke(reduce_messages(state["user_query"], supported)) if supported else None
+    return {**reduce_result(state, answers, response), **clamped}
+
+
+async def map_reduce_answer_node_async(state: QueryState, retrieval_service: RetrievalService,
+                                       chunk_retriever: ChunksRetriever, answer_cache: Optional[AnswerCache] = None) -> QueryState:
+    if not has_budget(state, "map_reduce"):
+        skip = skipped(state, "map_reduce")
+        return {**await answer_generation_node_async(state, chunk_retriever, answer_cache), **skip}
+
+    sub_states, clamped = await asyncio.to_thread(retrieve_sub_questions, state, retrieval_service)
+    semaphore = asyncio.Semaphore(SUB_ANSWER_CONCURRENCY)
+
+    async def one(sub_state):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                messages, used_chunk_ids, report = await asyncio.to_thread(prepare_sub_answer, sub_state, chunk_retriever)
+                response = await ainvoke_llm(messages) if messages else None
+            except Exception as e:
+                return failed_sub_answer(sub_state, e, started)
+            return sub_answer(sub_state, response, used_chunk_ids, report, started)
+
+    answers = await asyncio.gather(*(one(s) for s in sub_states))
+
+    supported = [a for a in answers if a["answer_supported"]]
+    response = await ainvoke_llm(reduce_messages(state["user_query"], supported)) if supported else None
+    return {**reduce_result(state, list(answers), response), **clamped}
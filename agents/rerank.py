@@ -0,0 +1,43 @@
+# agents/rerank.py
+from agents.state import QueryState
+from retrieval.rerank import CrossEncoderReranker, RERANK_TOP_N
+from utils.deadline import has_budget, skipped
+
+
+def rerank_node(state: QueryState, chunk_loader, reranker: CrossEncoderReranker) -> QueryState:
+    """
+    Optional step between retrieve and validate.
+    Reorders retrieved_chunks / retrieval_scores by cross-encoder score
+    and keeps the top RERANK_TOP_N; with nothing scored (budget spent
+    before the first batch) the fused list passes through unchanged.
+    rerank_report["scores"] holds the cross-encoder score per chunk_id
+    that was scored (build_context packs by the reranked order).
+    """
+    retrieved = state.get("retrieved_chunks") or []
+    scores = state.get("retrieval_scores") or []
+
+    if not retrieved:
+        return {**state, "rerank_report": None}
+    if not has_budget(state, "rerank"):
+        return {**state, "rerank_report": None, **skipped(state, "rerank")}
+
+    texts = chunk_loader.get_many([c["chunk_id"] for c in retrieved])
+    candidates = [
+        {"chunk_id": c["chunk_id"], "text": (texts.get(c["chunk_id"]) or {}).get("text")}
+        for c in retrieved
+    ]
+
+    order, report = reranker.rerank(state["user_query"], candidates)
+
+    reranked_chunks = [retrieved[i] for i in order]
+    reranked_scores = [scores[i] for i in order]
+    if report["scored"] + report["cached"]:
+        reranked_chunks = reranked_chunks[:RERANK_TOP_N]
+        reranked_scores = reranked_scores[:RERANK_TOP_N]
+
+    return {
+        **state,
+        "retrieved_chunks": reranked_chunks,
+        "retrieval_scores": reranked_scores,
+        "rerank_report": report
+    }
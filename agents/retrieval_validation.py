@@ -44,7 +44,7 @@ def retrieval_validation_node(state, chunk_loader):
         return {**state, "retrieval_valid": False, "retrieval_failure_reason": "weak_retrieval"}
 
     # Recall proxy
-    recall = estimate_recall(query, chunks_meta, k)
+    recall = estimate_recall(chunks_meta, k)
     if recall < MIN_RECALL:
         return {**state, "retrieval_valid": False, "retrieval_failure_reason": "low_recall"}
 
@@ -1,20 +1,116 @@
+import time
+from typing import List
+import numpy as np
+
 from agents.state import QueryState
-from retrieval.hybrid_fusion import hybrid_fusion
-from retrieval.retrieval_signal import dense_retrieve_text, sparse_retrieve
-from storage.vector_store import VectorStore
-from storage.bm25_store import BM25Store
+from ingestion.embed_func import embed_texts, embed_texts_for_image_search
+from retrieval.service import RetrievalService
+from retrieval.hybrid_fusion import evidence_score
+from retrieval.filters import MetadataFilter
+from retrieval.concurrency import submit_bounded
+from retrieval.cache import RetrievalCache
+from retrieval.retrieval_pipeline import DENSE_TIMEOUT_MS, SPARSE_TIMEOUT_MS, IMAGE_TIMEOUT_MS
+from utils.deadline import has_budget, skipped, clamp_timeouts
 
 TOP_K = 10
 
-def retrieve_node(state: QueryState) -> QueryState:
-    query = state["user_query"]
-    query_embedding = state["query_embedding"]
+def query_variants(state: QueryState) -> List[str]:
+    """
+    user_query first, then whatever rewrite_node produced
+    (keyword expansion, HyDE, sub-questions), de-duplicated.
+    """
+    rewrites = state.get("rewritten_queries") or {}
+
+    candidates = [state["user_query"]]
+    for key in ("keyword_expansion", "hyde"):
+        if isinstance(rewrites.get(key), str):
+            candidates.append(rewrites[key])
+    candidates += [q for q in (rewrites.get("sub_questions") or []) if isinstance(q, str)]
+
+    variants, seen = [], set()
+    for q in candidates:
+        key = q.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            variants.append(q.strip())
+    return variants
+
+def embed_variants(variants: List[str], query_embedding=None) -> np.ndarray:
+    # reuse embed_query_node's vector for user_query; the rest in one forward pass
+    if query_embedding is None:
+        return embed_texts(variants)
+
+    first = np.asarray(query_embedding, dtype="float32").reshape(1, -1)
+    if len(variants) == 1:
+        return first
+    return np.vstack([first, embed_texts(variants[1:])])
 
-    dense_results = dense_retrieve_text(query_embedding=query_embedding, vector_index=VectorStore,top_k=TOP_K)
+def retrieve_node(state: QueryState, retrieval_service: RetrievalService,
+                  cache: RetrievalCache = None) -> QueryState:
+    variants = query_variants(state)
 
-    sparse_results = sparse_retrieve(query=query, bm25_index=BM25Store, top_k=TOP_K)
+    # short on time: user_query alone, no image search
+    skips = {}
+    if len(variants) > 1 and not has_budget(state, "multi_query"):
+        variants = variants[:1]
+        skips.update(skipped(state, "multi_query")["skipped_stages"])
 
-    fused = hybrid_fusion(dense_results=dense_results, sparse_results=sparse_results, top_k=TOP_K)
+    # repeated question on an unchanged corpus → skip embedding and search
+    cache_key = None
+    if cache is not None:
+        started = time.perf_counter()
+        cache_key = cache.make_key(variants, TOP_K, state.get("intent"), state.get("metadata_filter"))
+        generation = retrieval_service.start().index_generation
+        cached = cache.get(cache_key, generation)
+        if cached is not None:
+            return {
+                **state,
+                "retrieved_chunks": [dict(c) for c in cached["retrieved_chunks"]],
+                "retrieval_scores": list(cached["retrieval_scores"]),
+                "top_k": TOP_K,
+                "retrieval_queries": variants,
+                "retrieval_latency_ms": {"cache": (time.perf_counter() - started) * 1000},
+                "degraded_signals": [],
+                "index_generation": generation,
+                "retrieval_cache_hit": True,
+                "skipped_stages": skips
+            }
+
+    # CLIP text encoding runs on its own small pool while BGE embeds the
+    # variants, so searching image.index adds no serial step; with too
+    # many encodings already in flight the image signal is left out
+    image_embeddings = None
+    degraded = {}
+    if retrieval_service.start().has_images:
+        if has_budget(state, "image_search"):
+            image_embeddings = submit_bounded("clip", embed_texts_for_image_search, variants)
+            if image_embeddings is None:
+                degraded["image"] = "overloaded"
+        else:
+            skips.update(skipped(state, "image_search")["skipped_stages"])
+
+    embeddings = embed_variants(variants, state.get("query_embedding"))
+
+    # no signal may outlive the request's deadline
+    timeouts, clamped = clamp_timeouts(
+        state, {"dense": DENSE_TIMEOUT_MS, "sparse": SPARSE_TIMEOUT_MS, "image": IMAGE_TIMEOUT_MS}
+    )
+    skips.update(clamped.get("skipped_stages", {}))
+
+    # indexes are already loaded by the service; this is search cost only
+    output = retrieval_service.search_many(
+        queries=variants,
+        query_embeddings=embeddings,
+        top_k=TOP_K,
+        intent=state.get("intent"),
+        filters=MetadataFilter.from_dict(state.get("metadata_filter")),
+        image_query_embeddings=image_embeddings,
+        dense_timeout_ms=timeouts["dense"],
+        sparse_timeout_ms=timeouts["sparse"],
+        image_timeout_ms=timeouts["image"]
+    )
+    fused = output["retrieval_results"]
+    degraded.update(output["degraded_signals"])
 
     retrieved_chunks = []
     retrieval_scores = []
@@ -22,13 +118,29 @@ def retrieve_node(state: QueryState) -> QueryState:
     for r in fused:
         retrieved_chunks.append({
             "chunk_id": r["chunk_id"],
-            "source": "hybrid"
+            "source": "hybrid",
+            "modality": r["modality"]
         })
-        retrieval_scores.append(float(r["score"]))    
+        # validation thresholds need absolute scores, not per-query fused ranks
+        retrieval_scores.append(evidence_score(r))
+
+    # partial results (a signal missed its deadline or was skipped) are not worth replaying
+    if cache_key is not None and not degraded and not skips:
+        cache.put(
+            cache_key,
+            output["index_generation"],
+            {"retrieved_chunks": retrieved_chunks, "retrieval_scores": retrieval_scores}
+        )
 
     return {
         **state,
         "retrieved_chunks": retrieved_chunks,
         "retrieval_scores": retrieval_scores,
-        "top_k": TOP_K
+        "top_k": TOP_K,
+        "retrieval_queries": variants,
+        "retrieval_latency_ms": output["signal_latency_ms"],
+        "degraded_signals": list(degraded),
+        "index_generation": output["index_generation"],
+        "retrieval_cache_hit": False,
+        "skipped_stages": skips
     }
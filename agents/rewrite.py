@@ -1,33 +1,17 @@
 # rewrite.py
+from typing import Optional
+
 from agents.state import QueryState
-from utils.llm import get_llm
+from utils.llm import get_control_llm, ainvoke_llm
+from utils.deadline import has_budget, skipped
 import json
 
-def rewrite_node(state: QueryState) -> QueryState:
-    # refusal status check
-    if state["should_refuse"]:
-        return state
-    
-    query = state["user_query"]
-    intent = state["intent"]
-    llm = get_llm()
-
-    # default outputs
-    rewrites = {
-        "original": query,
-        "keyword_expansion": None,
-        "hyde": None,
-        "sub_questions": None
-    }
-
-    risk_flags = {
-        "recall_boost": False,
-        "precision_risk": False
-    }
 
+def rewrite_prompt(intent: str, query: str) -> Optional[str]:
+    """Prompt for this intent; None → no LLM call."""
     # if intent is factual -> minimal expansion
     if intent == "factual":
-        prompt = f"""
+        return f"""
         Expand this query with ONLY essential keywords.
         Do NOT add new facts.
         Do NOT broaden scope.
@@ -37,17 +21,10 @@ def rewrite_node(state: QueryState) -> QueryState:
         Return JSON:
         {{"expanded_query": "..."}}
         """
-        response = llm.invoke(prompt)
-        try:
-            data = json.loads(response.content)
-            rewrites["keyword_expansion"] = data["expanded_query"]
-            risk_flags["recall_boost"] = True
-        except Exception:
-            pass
 
     # If intent is analytical -> expansion + HyDE
-    elif intent == "analytical":
-        prompt = f"""
+    if intent == "analytical":
+        return f"""
         Generate:
         1. A keyword-expanded query
         2. A hypothetical answer (HyDE)
@@ -65,19 +42,9 @@ def rewrite_node(state: QueryState) -> QueryState:
         }}
         """
 
-        response = llm.invoke(prompt)
-        try:
-            data = json.loads(response.content)
-            rewrites["keyword_expansion"] = data["expanded_query"]
-            rewrites["hyde"] = data["hyde"]
-            risk_flags["recall_boost"] = True
-            risk_flags["precision_risk"] = True
-        except Exception:
-            pass
-    
     # if intent is multi-hop -> decomposition
-    elif intent == "multi_hop":
-        prompt = f"""
+    if intent == "multi_hop":
+        return f"""
         Decompose this query into minimal sub-questions.
 
         Rules:
@@ -89,14 +56,62 @@ def rewrite_node(state: QueryState) -> QueryState:
         Return JSON:
         {{"sub_questions": ["...", "..."]}}
         """
-        response = llm.invoke(prompt)
+
+    return None
+
+
+def parse_rewrite(content: Optional[str]) -> Optional[dict]:
+    try:
+        return json.loads(content)
+    except Exception:
+        return None
+
+
+def apply_rewrite(state: QueryState, data: Optional[dict]) -> QueryState:
+    """
+    data: parsed LLM output (None when no call was made or it was not JSON).
+    Only the fields that belong to the state's intent are used.
+    """
+    query = state["user_query"]
+    intent = state["intent"]
+
+    # default outputs
+    rewrites = {
+        "original": query,
+        "keyword_expansion": None,
+        "hyde": None,
+        "sub_questions": None
+    }
+
+    risk_flags = {
+        "recall_boost": False,
+        "precision_risk": False
+    }
+
+    if intent == "factual":
+        try:
+            rewrites["keyword_expansion"] = data["expanded_query"]
+            risk_flags["recall_boost"] = True
+        except Exception:
+            pass
+
+    elif intent == "analytical":
+        try:
+            rewrites["keyword_expansion"] = data["expanded_query"]
+            rewrites["hyde"] = data["hyde"]
+            risk_flags["recall_boost"] = True
+            risk_flags["precision_risk"] = True
+        except Exception:
+            pass
+
+    elif intent == "multi_hop":
         try:
-            data = json.loads(response.content)
             rewrites["sub_questions"] = data["sub_questions"]
             risk_flags["recall_boost"] = True
             risk_flags["precision_risk"] = True
         except Exception:
             pass
+
     elif intent == "unknown":
         # Conservative fallback: no LLM call
         rewrites["keyword_expansion"] = query
@@ -111,4 +126,35 @@ def rewrite_node(state: QueryState) -> QueryState:
         **state,
         "rewritten_queries": rewrites,
         "rewrite_risk": risk_flags
-    }
\ No newline at end of file
+    }
+
+
+def rewrite_node(state: QueryState) -> QueryState:
+    # refusal status check
+    if state["should_refuse"]:
+        return state
+
+    prompt = rewrite_prompt(state["intent"], state["user_query"])
+    if prompt is not None and not has_budget(state, "rewrite"):
+        # retrieve with user_query alone
+        return {**apply_rewrite(state, None), **skipped(state, "rewrite")}
+
+    content = None
+    if prompt is not None:
+        llm = get_control_llm()
+        content = llm.invoke(prompt).content
+    return apply_rewrite(state, parse_rewrite(content))
+
+
+async def rewrite_node_async(state: QueryState) -> QueryState:
+    if state["should_refuse"]:
+        return state
+
+    prompt = rewrite_prompt(state["intent"], state["user_query"])
+    if prompt is not None and not has_budget(state, "rewrite"):
+        return {**apply_rewrite(state, None), **skipped(state, "rewrite")}
+
+    content = None
+    if prompt is not None:
+        content = (await ainvoke_llm(prompt, get_control_llm())).content
+    return apply_rewrite(state, parse_rewrite(content))
@@ -1,28 +1,50 @@
 # state.py
-from typing import TypedDict, Optional, List, Dict
+from typing import TypedDict, Optional, List, Dict, Annotated
+
+
+def merge_dicts(left: Optional[Dict], right: Optional[Dict]) -> Dict:
+    # reducer: parallel branches each add their own keys
+    return {**(left or {}), **(right or {})}
 
 class RetrievedChunk(TypedDict):
     chunk_id: str
     text: str
     source: str
+    modality: str      # "text" | "image"
 
 class QueryState(TypedDict):
     user_query: str
 
+    # latency budget (utils/deadline.py): time.monotonic() deadline, None → unbounded
+    deadline: Optional[float]
+    skipped_stages: Annotated[Dict[str, float], merge_dicts]   # stage -> ms left when skipped
+
     # intent understanding
     intent: Optional[str]
     intent_confidence: Optional[float]
     intent_reason: Optional[str]
+    intent_source: Optional[str]     # "llm" | "local" (agents/intent_classifier.py)
     should_refuse: bool
 
     # rewrite
     rewritten_queries: Optional[Dict[str, object]]
     rewrite_risk: Optional[Dict[str, bool]]
 
+    # retrieval scope (MetadataFilter.from_dict), None → whole corpus
+    metadata_filter: Optional[Dict[str, object]]
+
     # retrieval output
     retrieved_chunks: Optional[List[RetrievedChunk]]
     retrieval_scores: Optional[List[float]]
     top_k: Optional[int]
+    retrieval_queries: Optional[List[str]]
+    retrieval_latency_ms: Optional[Dict[str, float]]
+    degraded_signals: Optional[List[str]]
+    index_generation: Optional[object]     # int, or per-shard tuple when sharded
+    retrieval_cache_hit: Optional[bool]
+
+    # optional cross-encoder rerank (agents/rerank.py)
+    rerank_report: Optional[Dict[str, object]]
 
     # validation result
     retrieval_valid: Optional[bool]
@@ -34,4 +56,12 @@ class QueryState(TypedDict):
     # answer validation
     answer_text: Optional[str]
     answer_citations: List[str]
-    answer_supported: bool
\ No newline at end of file
+    answer_supported: bool
+    answer_cache_hit: Optional[bool]
+    answer_context: Optional[Dict[str, int]]    # build_context packing report + prompt_tokens sent
+    answer_timing: Optional[Dict[str, float]]   # streaming: first_token_ms / first_text_ms / total_ms
+    sub_answers: Optional[List[Dict[str, object]]]   # multi_hop map-reduce (agents/multi_hop.py)
+
+    # end-to-end graph (agents/graphs/main_graph.py)
+    final_answer: Optional[str]
+    stage_latency_ms: Annotated[Dict[str, float], merge_dicts]
\ No newline at end of file
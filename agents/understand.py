@@ -0,0 +1,73 @@
+# understand.py
+from agents.state import QueryState
+from agents.intent_check import apply_intent
+from agents.rewrite import apply_rewrite
+from utils.llm import get_control_llm, ainvoke_llm
+from utils.json import extract_json
+
+SYSTEM_PROMPT = """
+        You are the query planner for a retrieval system.
+        In ONE response, classify the query and prepare it for retrieval.
+
+        Allowed intents:
+        - factual: expand with ONLY essential keywords
+        - analytical: keyword-expanded query + a hypothetical answer (HyDE)
+        - multi_hop: decompose into minimal sub-questions
+        - unanswerable: nothing else needed
+
+        Rules:
+        - Do NOT add new facts to expansions or sub-questions
+        - HyDE may fabricate but must stay on-topic
+        - Each sub-question must be answerable independently
+        - Use null for fields that do not apply to the intent
+
+        You MUST respond with ONLY valid JSON.
+        No markdown.
+        No explanation.
+        No extra text.
+
+        JSON schema:
+        {
+        "intent": "factual | analytical | multi_hop | unanswerable",
+        "confidence": number,
+        "reason": string,
+        "expanded_query": string | null,
+        "hyde": string | null,
+        "sub_questions": [string] | null
+        }
+    """
+
+
+def understand_prompt(query: str) -> str:
+    user_prompt = f"""
+    Query: "{query}"
+    """
+    return SYSTEM_PROMPT + user_prompt
+
+
+def parse_understanding(state: QueryState, content: str) -> QueryState:
+    """
+    Same QueryState fields as intent_check_node followed by rewrite_node,
+    so everything downstream is unaffected by which mode produced them.
+    """
+    try:
+        parsed = extract_json(content)
+    except Exception:
+        parsed = None
+
+    state = apply_intent(state, parsed)
+    if state["should_refuse"]:
+        return state
+    return apply_rewrite(state, parsed if isinstance(parsed, dict) else None)
+
+
+def understand_node(state: QueryState) -> QueryState:
+    """Intent + rewrite in one LLM round-trip (replaces INTENT_CHECK → REWRITE)."""
+    llm = get_control_llm()
+    response = llm.invoke(understand_prompt(state["user_query"]))
+    return parse_understanding(state, response.content)
+
+
+async def understand_node_async(state: QueryState) -> QueryState:
+    response = await ainvoke_llm(understand_prompt(state["user_query"]), get_control_llm())
+    return parse_understanding(state, response.content)
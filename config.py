@@ -9,3 +9,27 @@ DB_CONFIG = {
     "password": os.getenv("DB_PASSWORD"),
     "port": int(os.getenv("DB_PORT", 5432)),
 }
+
+# distributed ingestion
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+INGEST_TOPIC = os.getenv("INGEST_TOPIC", "ingest-jobs")
+INGEST_GROUP_ID = os.getenv("INGEST_GROUP_ID", "ingest-workers")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./vector_store")
+
+# sharded indexes (storage.shards / retrieval.sharding)
+NUM_SHARDS = int(os.getenv("NUM_SHARDS", 1))
+# comma-separated "host:port" or Unix socket paths; empty → local unsharded store
+SHARD_ENDPOINTS = [e.strip() for e in os.getenv("SHARD_ENDPOINTS", "").split(",") if e.strip()]
+# shared secret for shard RPC; required for any non-loopback TCP endpoint
+SHARD_AUTHKEY = os.getenv("SHARD_AUTHKEY", "").encode("utf-8") or None
+
+# one LLM call for intent + rewrite (agents/understand.py) instead of two
+COMBINED_UNDERSTANDING = os.getenv("COMBINED_UNDERSTANDING", "0").lower() in {"1", "true", "yes"}
+
+# local intent classifier (agents/intent_classifier.py)
+# JSONL of LLM intent labels, appended by intent_check_node when set
+INTENT_LABEL_LOG = os.getenv("INTENT_LABEL_LOG")
+INTENT_CLASSIFIER_PATH = os.getenv("INTENT_CLASSIFIER_PATH", "./models/intent_centroids.npz")
+
+# multi_hop: answer sub-questions separately and combine (agents/multi_hop.py)
+MULTI_HOP_MAP_REDUCE = os.getenv("MULTI_HOP_MAP_REDUCE", "1").lower() in {"1", "true", "yes"}
@@ -0,0 +1,172 @@
+# chunking.py
+from typing import List
+
+import tiktoken
+from langchain_core.documents import Document
+
+# BGE truncates at 512 wordpieces; cl100k tokens run a little shorter,
+# so stay well under that to avoid silently cut-off chunks.
+MAX_CHUNK_TOKENS = 384
+CHUNK_OVERLAP_TOKENS = 48
+
+# elements that open a new section (they start a chunk, never end one).
+# unstructured's "Header" is a running page header, not a section heading.
+SECTION_ELEMENT_TYPES = {"Title", "SectionHeader"}
+
+SEPARATOR = "\n\n"
+
+_encoding = tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding.encode(text or ""))
+
+
+def _merged_doc(parts: List[Document], texts: List[str], seq: int) -> Document:
+    first = parts[0].metadata
+    return Document(
+        page_content=SEPARATOR.join(texts),
+        metadata={
+            **first,
+            "chunk_id": f"{first.get('doc_id')}_m{seq}",
+            "element_type": "Text",
+            "merged_elements": len(parts)
+        }
+    )
+
+
+def assemble_chunks(docs: List[Document], max_tokens: int = MAX_CHUNK_TOKENS,
+                    overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[Document]:
+    """
+    Merge adjacent text elements from load_documents into chunks of up
+    to `max_tokens` tiktoken tokens.
+
+    Rules:
+    - A new source file, page or section title always starts a new chunk
+    - Inside a section, a chunk that fills up is continued in the next one
+      with the last `overlap_tokens` tokens repeated, unless the overlap
+      and the next element together would exceed `max_tokens`
+    - Images, tables and other non-text elements pass through unchanged
+    - A single element larger than the budget is split into token windows
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    assembled = []
+    parts, texts = [], []
+    # tokens of SEPARATOR.join(texts), kept as elements are added instead
+    # of re-encoding the join per element; merges across a boundary can
+    # only save tokens in practice, so the running sum errs on the safe side
+    used = 0
+    separator_tokens = count_tokens(SEPARATOR)
+    seq = 0
+
+    def flush():
+        nonlocal parts, texts, used, seq
+        if parts:
+            assembled.append(_merged_doc(parts, texts, seq))
+            seq += 1
+        parts, texts, used = [], [], 0
+
+    def fits(current_tokens: int, n_tokens: int) -> bool:
+        # the merged page_content, separators included, is what gets embedded
+        return current_tokens + separator_tokens + n_tokens <= max_tokens
+
+    def overlap_tail() -> str:
+        if not overlap_tokens or not texts:
+            return ""
+        tokens = _encoding.encode(SEPARATOR.join(texts))
+        return _encoding.decode(tokens[-overlap_tokens:])
+
+    prev_meta = None
+    for doc in docs:
+        meta = doc.metadata or {}
+
+        if meta.get("element_type") != "Text":
+            flush()
+            assembled.append(doc)
+            prev_meta = None
+            continue
+
+        boundary = (
+            prev_meta is None
+            or meta.get("source") != prev_meta.get("source")
+            or meta.get("page_number") != prev_meta.get("page_number")
+            or meta.get("raw_element_type") in SECTION_ELEMENT_TYPES
+        )
+        if boundary:
+            flush()
+        prev_meta = meta
+
+        tokens = _encoding.encode(doc.page_content)
+
+        # oversized element → fixed windows with overlap
+        if len(tokens) > max_tokens:
+            flush()
+            step = max_tokens - overlap_tokens
+            for start in range(0, len(tokens), step):
+                window = _encoding.decode(tokens[start:start + max_tokens])
+                assembled.append(_merged_doc([doc], [window], seq))
+                seq += 1
+                if start + max_tokens >= len(tokens):
+                    break
+            continue
+
+        if texts and not fits(used, len(tokens)):
+            tail = overlap_tail()
+            carry = parts[-1]
+            flush()
+            # the overlap is dropped when tail + element would not fit either
+            tail_tokens = count_tokens(tail)
+            if tail and fits(tail_tokens, len(tokens)):
+                parts, texts, used = [carry], [tail], tail_tokens
+
+        parts.append(doc)
+        texts.append(doc.page_content)
+        used += (separator_tokens if len(texts) > 1 else 0) + len(tokens)
+
+    flush()
+    return assembled
+
+
+def index_size_report(before: List[Document], after: List[Document],
+                      text_dim: int = 768, image_dim: int = 512) -> dict:
+    """
+    Vector count and index bytes for the same corpus before / after assembly.
+    FAISS bytes are exact for IndexFlatIP (float32 per dimension);
+    BM25 size is the number of (term, chunk) postings.
+    """
+    def measure(docs):
+        text_docs = [d for d in docs if (d.metadata or {}).get("element_type") != "Image"]
+        images = len(docs) - len(text_docs)
+        postings = sum(
+            len(set(t for t in d.page_content.lower().split() if t.isalnum()))
+            for d in text_docs
+        )
+        return {
+            "vectors": len(docs),
+            "faiss_bytes": len(text_docs) * text_dim * 4 + images * image_dim * 4,
+            "bm25_postings": postings
+        }
+
+    return {"before": measure(before), "after": measure(after)}
+
+
+def print_index_size_report(report: dict):
+    b, a = report["before"], report["after"]
+    print(
+        f"[CHUNKING] vectors {b['vectors']} → {a['vectors']} | "
+        f"faiss {b['faiss_bytes'] / 1024:.1f}KB → {a['faiss_bytes'] / 1024:.1f}KB | "
+        f"bm25 postings {b['bm25_postings']} → {a['bm25_postings']}"
+    )
+
+
+if __name__ == "__main__":
+    from collections import Counter
+    from ingestion.load import load_documents
+
+    docs = load_documents(["./data/raw/doc_pdf.pdf", "./data/raw/doc_docx.docx"])
+    chunks = assemble_chunks(docs)
+
+    print_index_size_report(index_size_report(docs, chunks))
+    print(Counter(c.metadata.get("merged_elements", 1) for c in chunks))
@@ -0,0 +1,206 @@
+# dedup.py
+import os
+import re
+import json
+import uuid
+import hashlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+NUM_PERM = 128
+NUM_BANDS = 16             # 16 bands x 8 rows → candidates from ~0.7 Jaccard up
+SHINGLE_WORDS = 3
+SIMILARITY_THRESHOLD = 0.8
+DEDUP_MODE = "link"        # "link" → keep row, point to canonical, don't embed | "skip" → drop
+
+_PRIME = (1 << 31) - 1
+
+
+def _shingles(text: str) -> List[str]:
+    # digits collapsed so dates / page numbers don't make a chunk look new
+    tokens = re.findall(r"\w+", re.sub(r"\d+", "0", text.lower()))
+    if len(tokens) <= SHINGLE_WORDS:
+        return [" ".join(tokens)] if tokens else []
+    return [" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)]
+
+
+class NearDuplicateIndex:
+    """
+    MinHash signatures + LSH banding over every canonical chunk in the corpus.
+    A lookup only compares against chunks that share at least one band,
+    so cost grows with the number of near-matches, not the corpus size.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = SIMILARITY_THRESHOLD,
+                 num_perm: int = NUM_PERM, num_bands: int = NUM_BANDS, seed: int = 7):
+        if num_perm % num_bands:
+            raise ValueError("num_perm must be divisible by num_bands")
+
+        self.path = path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        self.rows = num_perm // num_bands
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets = defaultdict(set)    # (band, band_bytes) -> chunk_ids
+
+        if path and os.path.exists(path):
+            self._load()
+
+    # -------------------------
+    # Signatures
+    # -------------------------
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        shingles = _shingles(text)
+        if not shingles:
+            return None
+
+        hashed = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") % _PRIME
+             for s in shingles],
+            dtype=np.uint64
+        )
+        # (a * x + b) mod p for every permutation / shingle pair, min per permutation
+        perms = (np.outer(self._a, hashed) + self._b[:, None]) % _PRIME
+        return perms.min(axis=1).astype(np.uint32)
+
+    def _bands(self, sig: np.ndarray):
+        for band in range(self.num_bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    # -------------------------
+    # Index operations
+    # -------------------------
+    def query(self, sig: np.ndarray, exclude=()) -> Optional[str]:
+        """Most similar indexed chunk_id with estimated Jaccard >= threshold."""
+        candidates = set()
+        for key in self._bands(sig):
+            candidates |= self.buckets.get(key, set())
+        candidates -= set(exclude)
+
+        best_id, best_sim = None, self.threshold
+        for cid in candidates:
+            sim = float(np.mean(self.signatures[cid] == sig))
+            if sim >= best_sim:
+                best_id, best_sim = cid, sim
+        return best_id
+
+    def add(self, chunk_id: str, sig: np.ndarray):
+        self.signatures[chunk_id] = sig
+        for key in self._bands(sig):
+            self.buckets[key].add(chunk_id)
+
+    def remove(self, chunk_ids):
+        for cid in chunk_ids:
+            sig = self.signatures.pop(cid, None)
+            if sig is None:
+                continue
+            for key in self._bands(sig):
+                self.buckets[key].discard(cid)
+                if not self.buckets[key]:
+                    del self.buckets[key]
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, "w") as f:
+            json.dump({
+                "num_perm": self.num_perm,
+                "num_bands": self.num_bands,
+                "signatures": {cid: sig.tolist() for cid, sig in self.signatures.items()}
+            }, f)
+
+    def _load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+
+        if data["num_perm"] != self.num_perm or data["num_bands"] != self.num_bands:
+            raise ValueError(
+                f"MinHash index at {self.path} was built with "
+                f"num_perm={data['num_perm']}, num_bands={data['num_bands']}"
+            )
+        for cid, sig in data["signatures"].items():
+            self.add(cid, np.array(sig, dtype=np.uint32))
+
+
+# --------------------------------------------------
+# Ingestion stage
+# --------------------------------------------------
+def deduplicate_chunks(chunks: List[dict], index: NearDuplicateIndex, mode: str = DEDUP_MODE, exclude=()):
+    """
+    Runs on prepare_chunks output, before insert_chunks.
+
+    Every chunk gets its chunk_id here so duplicates can point at it.
+    - skip: near-duplicates are dropped
+    - link: near-duplicates keep a row with canonical_chunk_id set and
+            are not embedded
+
+    `exclude` holds chunk_ids that are about to be retired, so a new
+    version of a document never links to its own previous version.
+
+    Returns (chunks, stats); stats["added"] lists ids added to the index,
+    which must be removed again if the transaction rolls back.
+    """
+    if mode not in {"link", "skip"}:
+        raise ValueError(f"Unknown dedup mode: {mode}")
+
+    kept = []
+    stats = {"duplicates": 0, "added": []}
+
+    for chunk in chunks:
+        chunk.setdefault("chunk_id", str(uuid.uuid4()))
+
+        if chunk["element_type"] == "Image":
+            kept.append(chunk)
+            continue
+
+        sig = index.signature(chunk["cleaned_text"])
+        if sig is None:
+            kept.append(chunk)
+            continue
+
+        canonical = index.query(sig, exclude=exclude)
+        if canonical is None:
+            index.add(chunk["chunk_id"], sig)
+            stats["added"].append(chunk["chunk_id"])
+            kept.append(chunk)
+            continue
+
+        stats["duplicates"] += 1
+        if mode == "link":
+            chunk["canonical_chunk_id"] = canonical
+            kept.append(chunk)
+
+    return kept, stats
+
+
+def relink_orphans(pg, index: NearDuplicateIndex, retired_chunk_ids: List[str]) -> List[dict]:
+    """
+    Duplicates whose canonical chunk is being retired are pointed at
+    another near-duplicate if one exists, otherwise promoted to canonical.
+    Returns the promoted chunks; they have no vectors yet and must be embedded.
+    """
+    promoted = []
+    retired = set(retired_chunk_ids)
+
+    for orphan in pg.get_duplicates_of(retired_chunk_ids):
+        sig = index.signature(orphan["cleaned_text"])
+        canonical = index.query(sig, exclude=retired) if sig is not None else None
+
+        pg.set_canonical(orphan["chunk_id"], canonical)
+        if canonical is None:
+            if sig is not None:
+                index.add(orphan["chunk_id"], sig)
+            promoted.append(orphan)
+
+    return promoted
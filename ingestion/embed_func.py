@@ -1,5 +1,7 @@
 # embed_func.py
 import torch
+import numpy as np
+from typing import List
 from PIL import Image
 from langchain_community.vectorstores import FAISS
 
@@ -38,6 +40,57 @@ def embed_text(text: str):
         embeddings = outputs.last_hidden_state.mean(dim=1)
     return embeddings[0].cpu().numpy()
 
+# function for creating many text embeddings in one forward pass
+def embed_texts(texts: List[str], batch_size: int = 32) -> np.ndarray:
+    """
+    Batched version of embed_text.
+    Padding is masked out of the mean pooling so every row matches
+    what embed_text returns for the same text on its own.
+    """
+    if not texts:
+        return np.zeros((0, text_model.config.hidden_size), dtype="float32")
+
+    batches = []
+    for start in range(0, len(texts), batch_size):
+        inputs = text_tokenizer(
+            texts[start:start + batch_size],
+            return_tensors="pt",
+            padding = True,
+            truncation = True,
+            max_length = 512
+        )
+
+        with torch.inference_mode():
+            outputs = text_model(**inputs)
+            mask = inputs["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+            summed = (outputs.last_hidden_state * mask).sum(dim=1)
+            embeddings = summed / mask.sum(dim=1).clamp(min=1)
+        batches.append(embeddings.cpu().numpy())
+    return np.vstack(batches)
+
+# function for creating CLIP-space query embeddings (text → image search)
+def embed_texts_for_image_search(texts: List[str]) -> np.ndarray:
+    """
+    Encode queries with CLIP's text tower so they can be searched
+    against image.index (same 512d space as embed_image).
+    CLIP's context is 77 tokens; longer queries are truncated.
+    """
+    if not texts:
+        return np.zeros((0, clip_model.config.projection_dim), dtype="float32")
+
+    inputs = clip_processor(
+        text=texts,
+        return_tensors="pt",
+        padding=True,
+        truncation=True
+    )
+    with torch.inference_mode():
+        features = clip_model.get_text_features(**inputs)
+    return features.cpu().numpy()
+
+def embed_text_for_image_search(text: str):
+    return embed_texts_for_image_search([text])[0]
+
 # function for creating image embedidng
 def embed_image(pil_image: Image.Image):
     """create image embeddings using CLIP"""
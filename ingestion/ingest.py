@@ -1,21 +1,20 @@
 # ingest.py
-from ingestion.embed_func import embed_text, embed_image
+from ingestion.embed_func import embed_text, embed_texts, embed_image
 from ingestion.clean import clean_text
+from ingestion.chunking import assemble_chunks, index_size_report, print_index_size_report
+from ingestion.dedup import deduplicate_chunks, relink_orphans, DEDUP_MODE
 
 from typing import List
 from PIL import Image
 
 import os
 import hashlib
-import psycopg2
 
 from storage.postgres import PostgresStore
 from storage.vector_store import VectorStore
+from storage.shards import ShardSet, route, owns
 
-# DB connection
 from config import DB_CONFIG
-conn = psycopg2.connect(**DB_CONFIG)
-cursor = conn.cursor()
 
 def prepare_chunks(docs):
     """
@@ -64,40 +63,239 @@ def prepare_chunks(docs):
 
 
 
-def ingest_pipeline(docs, source_path, source_type, raw_file_bytes, vector_store):
+def file_checksum(file_path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file, read in blocks so large files never sit in memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def plan_version(pg, source_path, checksum, vector_store=None):
+    """
+    Decide what to do with a file before doing any work on it.
+
+    Returns:
+    - None → latest version has the same checksum, skip the file
+    - {"version": n, "previous_document_id": id | None} → ingest as version n
+
+    With vector_store given, an unchanged file whose chunks never reached
+    the index (crash between Postgres commit and index save) is re-ingested.
+    """
+    latest = pg.get_latest_document(source_path)
+
+    if latest is None:
+        return {"version": 1, "previous_document_id": None}
+
+    if latest["checksum"] == checksum and latest["is_active"]:
+        if vector_store is None:
+            return None
+        if vector_store.has_chunks(pg.get_chunk_ids(latest["document_id"], canonical_only=True)):
+            return None
+
+    return {
+        "version": latest["version"] + 1,
+        "previous_document_id": latest["document_id"] if latest["is_active"] else None
+    }
+
+
+def reconcile_index(pg, vector_store, bm25_store=None, dedup_index=None) -> dict:
+    """
+    Bring the index back in line with Postgres after a crash or a failed job.
+
+    Postgres commits a new version (and retires the old one) before the
+    index holding it is saved, so an interrupted writer can leave both
+    the old version searchable and the new one unembedded. Every index
+    writer runs this on startup; both steps are idempotent:
+    - chunks of retired versions still in the index are dropped
+    - canonical chunks of active documents missing from the index (new
+      versions, promoted duplicates) are embedded again
+    """
+    report = _drop_retired(pg, vector_store, bm25_store, dedup_index)
+    report.update(_restore_missing(pg, vector_store, bm25_store))
+
+    if report["stale_vectors"] or report["stale_terms"] or report["restored"]:
+        vector_store.save()
+        if bm25_store is not None:
+            bm25_store.save()
+    if report["stale_signatures"]:
+        dedup_index.save()
+
+    print(
+        f"[RECONCILE] Retired still indexed: vectors={report['stale_vectors']} bm25={report['stale_terms']} "
+        f"minhash={report['stale_signatures']} | re-embedded: {report['restored']} | failed: {report['failed']}"
+    )
+    return report
+
+
+def _drop_retired(pg, vector_store, bm25_store, dedup_index) -> dict:
+    retired = pg.get_retired_chunk_ids()
+    report = {"stale_vectors": 0, "stale_terms": 0, "stale_signatures": 0}
+    if not retired:
+        return report
+
+    bm25_stores = vector_store.bm25_stores if isinstance(vector_store, ShardSet) else [bm25_store]
+    report["stale_terms"] = sum(b.remove(retired) for b in bm25_stores if b is not None)
+    report["stale_vectors"] = vector_store.remove(retired)
+    if dedup_index is not None:
+        report["stale_signatures"] = sum(cid in dedup_index.signatures for cid in retired)
+        dedup_index.remove(retired)
+    return report
+
+
+def _indexed_chunk_ids(vector_store) -> set:
+    stores = vector_store.vector_stores if isinstance(vector_store, ShardSet) else [vector_store]
+    indexed = set()
+    for vs in stores:
+        indexed.update(vs.text_id_map)
+        indexed.update(vs.image_id_map)
+    return indexed
+
+
+def _restore_missing(pg, vector_store, bm25_store, batch_size: int = 32) -> dict:
+    indexed = _indexed_chunk_ids(vector_store)
+    # a writer of some shards restores only the files it owns
+    missing = [
+        r["chunk_id"] for r in pg.get_active_chunk_refs()
+        if r["chunk_id"] not in indexed and owns(vector_store, r["source_path"])
+    ]
+    chunks = pg.get_chunks_for_indexing(missing)
+
+    restored, failed = 0, 0
+    texts = [c for c in chunks if c["element_type"] != "Image"]
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        vectors = embed_texts([c["cleaned_text"] for c in batch], batch_size=batch_size)
+        for chunk, vec in zip(batch, vectors):
+            target_vs, target_bm25 = route(vector_store, bm25_store, chunk["source_path"])
+            target_vs.add_text(vec, chunk["chunk_id"])
+            if target_bm25 is not None:
+                target_bm25.add(chunk["chunk_id"], chunk["cleaned_text"])
+            restored += 1
+
+    for chunk in (c for c in chunks if c["element_type"] == "Image"):
+        try:
+            vec = embed_image(Image.open(chunk["image_path"]).convert("RGB"))
+        except (OSError, ValueError) as e:
+            # a vanished image must not keep every writer from starting
+            print(f"[RECONCILE] Cannot re-embed image chunk {chunk['chunk_id']}: {e!r}")
+            failed += 1
+            continue
+        target_vs, _ = route(vector_store, bm25_store, chunk["source_path"])
+        target_vs.add_image(vec, chunk["chunk_id"])
+        restored += 1
+
+    return {"restored": restored, "failed": failed}
+
+
+def ingest_pipeline(docs, source_path, source_type, raw_file_bytes, vector_store, checksum=None,
+                    verify_index=False, dedup_index=None, dedup_mode=DEDUP_MODE, bm25_store=None):
     pg = PostgresStore(DB_CONFIG)
 
     embedded_text = 0
     embedded_images = 0
+    duplicates = 0
+    dedup_added = []
  
     try:
+        if checksum is None:
+            checksum = (
+                hashlib.sha256(raw_file_bytes).hexdigest()
+                if raw_file_bytes is not None
+                else file_checksum(source_path)
+            )
+
+        # Unchanged since last ingestion → nothing to do
+        plan = plan_version(
+            pg, source_path, checksum,
+            vector_store=vector_store if verify_index else None
+        )
+        if plan is None:
+            print(f"[SKIP] Unchanged checksum: {source_path}")
+            return None
+
+        # Merge element fragments into token-budgeted chunks
+        assembled = assemble_chunks(docs)
+        print_index_size_report(index_size_report(docs, assembled))
+
         # Prepare chunk payloads
-        chunks = prepare_chunks(docs=docs)
+        chunks = prepare_chunks(docs=assembled)
         # print("[DEBUG] prepare_chunks count:", len(chunks))
         # print("[DEBUG] sample chunk:", chunks[0] if chunks else None)
 
         if not chunks:
             raise RuntimeError("No valid chunks produced")
+
+        # Previous version (excluded from dedup matching, retired below)
+        retired_chunk_ids = []
+        if plan["previous_document_id"]:
+            retired_chunk_ids = pg.get_chunk_ids(plan["previous_document_id"])
+
+        # Near-duplicate elimination
+        if dedup_index is not None:
+            chunks, dedup_stats = deduplicate_chunks(
+                chunks, dedup_index, mode=dedup_mode, exclude=retired_chunk_ids
+            )
+            duplicates = dedup_stats["duplicates"]
+            dedup_added = dedup_stats["added"]
+            print(f"[VERIFY] Near-duplicate chunks ({dedup_mode}): {duplicates}")
         
         # Insert document metadata
-        checksum = hashlib.sha256(raw_file_bytes).hexdigest()
         document_id = pg.insert_document(
             source_path=source_path,
             source_type=source_type,
-            checksum=checksum
+            checksum=checksum,
+            version=plan["version"]
         )
 
         # Insert chunk metadata before embedding(no embeddings)
         chunk_ids = pg.insert_chunks(document_id=document_id, chunks=chunks)
 
+        # Retire previous version
+        promoted = []
+        if plan["previous_document_id"]:
+            pg.retire_document(plan["previous_document_id"])
+            if dedup_index is not None:
+                promoted = relink_orphans(pg, dedup_index, retired_chunk_ids)
+                dedup_added += [p["chunk_id"] for p in promoted]
+
         # COMMIT TO DATABASE
+        # (a crash or error after this point leaves retired vectors indexed
+        # and new chunks unembedded; reconcile_index repairs both on the next start)
         pg.commit()
 
+        if retired_chunk_ids:
+            removed = vector_store.remove(retired_chunk_ids)
+            if bm25_store is not None:
+                bm25_store.remove(retired_chunk_ids)
+            if dedup_index is not None:
+                dedup_index.remove(retired_chunk_ids)
+            print(f"[VERIFY] Retired v{plan['version'] - 1} vectors: {removed}")
+
+        # duplicates of retired chunks that became canonical
+        for orphan in promoted:
+            if not owns(vector_store, orphan["source_path"]):
+                # another writer's shard: its reconcile_index embeds it
+                continue
+            orphan_vs, orphan_bm25 = route(vector_store, bm25_store, orphan["source_path"])
+            orphan_vs.add_text(embed_text(orphan["cleaned_text"]), orphan["chunk_id"])
+            if orphan_bm25 is not None:
+                orphan_bm25.add(orphan["chunk_id"], orphan["cleaned_text"])
+            embedded_text += 1
+
+        # sharded stores: every version lives on the shard owning source_path
+        vector_store, bm25_store = route(vector_store, bm25_store, source_path)
+
         # Embed + Store
         for chunk, chunk_id in zip(chunks, chunk_ids):
         # for i, (chunk, chunk_id) in enumerate(zip(chunks, chunk_ids)):
             # print(f"[DEBUG] Loop {i} | type={chunk['element_type']}")
 
+            # ---- NEAR-DUPLICATE (canonical chunk already embedded) ----
+            if chunk.get("canonical_chunk_id"):
+                continue
+
             # ---- IMAGE ----
             if chunk["element_type"] == "Image":
                 img = Image.open(chunk["image_path"]).convert("RGB")
@@ -111,19 +309,25 @@ def ingest_pipeline(docs, source_path, source_type, raw_file_bytes, vector_store
                 vec = embed_text(chunk["cleaned_text"])
                 # print("[DEBUG] embed_text returned", type(vec), vec.shape)
                 vector_store.add_text(vec, str(chunk_id))
+                if bm25_store is not None:
+                    bm25_store.add(str(chunk_id), chunk["cleaned_text"])
                 embedded_text += 1
 
         print(f"[VERIFY] Embedded text chunks: {embedded_text}")
         print(f"[VERIFY] Embedded image chunks: {embedded_images}")
         print(f"[VERIFY] FAISS text vectors: {vector_store.text_index.ntotal}")
         print(f"[VERIFY] FAISS image vectors: {vector_store.image_index.ntotal}")
-        if embedded_text == 0 and embedded_images == 0:
+        if embedded_text == 0 and embedded_images == 0 and duplicates == 0:
             raise RuntimeError("Ingestion failed: no embeddings created")
         assert vector_store.text_index.ntotal > 0 or vector_store.image_index.ntotal > 0, \
         "FAISS EMPTY — embeddings never added"
 
+        return document_id
+
     except Exception:
         pg.rollback()
+        if dedup_index is not None:
+            dedup_index.remove(dedup_added)
         raise
     finally:
         pg.close()
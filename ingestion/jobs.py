@@ -0,0 +1,411 @@
+# jobs.py
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from collections import defaultdict, namedtuple
+from typing import Callable, List, Optional
+
+# kafka, the loaders / embedders (ingestion.load, ingestion.ingest) and
+# psycopg2 are imported where they are used, so the broker stand-in and
+# the worker's commit logic load without them (tests/test_jobs.py)
+from storage.vector_store import VectorStore
+from storage.bm25_store import BM25Store
+from storage.shards import ShardSet, shard_for, writer_locks
+from storage.generations import publish_stores
+from ingestion.dedup import NearDuplicateIndex
+from config import (
+    DB_CONFIG,
+    KAFKA_BOOTSTRAP_SERVERS,
+    INGEST_TOPIC,
+    INGEST_GROUP_ID,
+    VECTOR_STORE_PATH,
+    NUM_SHARDS
+)
+
+Record = namedtuple("Record", ["topic", "partition", "offset", "key", "value"])
+
+# serving generations are published at most this often (each publish copies the index)
+PUBLISH_INTERVAL_S = 30.0
+
+
+# --------------------------------------------------
+# Kafka clients
+# --------------------------------------------------
+def kafka_producer(bootstrap_servers: str = KAFKA_BOOTSTRAP_SERVERS):
+    from kafka import KafkaProducer
+
+    return KafkaProducer(
+        bootstrap_servers=bootstrap_servers,
+        key_serializer=lambda k: k.encode("utf-8"),
+        value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+        acks="all"
+    )
+
+
+def kafka_consumer(partitions: Optional[List[int]] = None, topic: str = INGEST_TOPIC,
+                   group_id: str = INGEST_GROUP_ID,
+                   bootstrap_servers: str = KAFKA_BOOTSTRAP_SERVERS):
+    """
+    partitions given → manually assigned, no group membership or rebalancing
+    (an ingest worker reads exactly the partitions of the shards it writes);
+    None → subscribes to the topic as a member of group_id.
+    Offsets are committed to group_id either way, by the worker, never automatically.
+    """
+    from kafka import KafkaConsumer, TopicPartition
+
+    consumer = KafkaConsumer(
+        bootstrap_servers=bootstrap_servers,
+        group_id=group_id,
+        enable_auto_commit=False,
+        auto_offset_reset="earliest",
+        key_deserializer=lambda k: k.decode("utf-8") if k else None,
+        value_deserializer=lambda v: json.loads(v.decode("utf-8"))
+    )
+    if partitions is None:
+        consumer.subscribe([topic])
+    else:
+        consumer.assign([TopicPartition(topic, p) for p in partitions])
+    return consumer
+
+
+# --------------------------------------------------
+# In-process stand-in (same calls the producer / worker use)
+# --------------------------------------------------
+class InMemoryBroker:
+    """
+    In-process replacement for a Kafka cluster.
+
+    Records are spread over num_partitions by key, and the partitions of
+    a topic are split across the consumers of a group (rebalanced when a
+    consumer joins or closes). Offsets are committed per group and
+    partition, so a record its consumer never committed is redelivered to
+    whichever consumer owns the partition next. A consumer created with
+    explicit partitions reads just those and never joins the group
+    (KafkaConsumer.assign).
+    """
+
+    def __init__(self, num_partitions: int = 1):
+        self.num_partitions = num_partitions
+        self.topics = defaultdict(lambda: [[] for _ in range(num_partitions)])
+        self.committed = {}                # (topic, group_id, partition) -> next offset
+        self.members = defaultdict(list)   # (topic, group_id) -> consumers in join order
+        self.lock = threading.Lock()
+
+    def producer(self):
+        return InMemoryProducer(self)
+
+    def consumer(self, topic: str = INGEST_TOPIC, group_id: str = INGEST_GROUP_ID,
+                 partitions: Optional[List[int]] = None):
+        return InMemoryConsumer(self, topic, group_id, partitions)
+
+    def partition_for(self, key) -> int:
+        # stable across processes, like Kafka's key hashing (hash() is salted)
+        if key is None:
+            return 0
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.num_partitions
+
+    def assignment(self, consumer) -> List[int]:
+        if consumer.assigned is not None:
+            return consumer.assigned
+        members = self.members[(consumer.topic, consumer.group_id)]
+        slot = members.index(consumer)
+        return [p for p in range(self.num_partitions) if p % len(members) == slot]
+
+
+class InMemoryProducer:
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+
+    def send(self, topic, value=None, key=None, partition=None):
+        if partition is None:
+            partition = self.broker.partition_for(key)
+        with self.broker.lock:
+            log = self.broker.topics[topic][partition]
+            log.append(Record(topic, partition, len(log), key, value))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class InMemoryConsumer:
+    def __init__(self, broker: InMemoryBroker, topic: str, group_id: str,
+                 partitions: Optional[List[int]] = None):
+        self.broker = broker
+        self.topic = topic
+        self.group_id = group_id
+        self.assigned = None if partitions is None else sorted(partitions)
+        self.positions = {}                # assigned partition -> next offset to fetch
+        if self.assigned is None:
+            with broker.lock:
+                broker.members[(topic, group_id)].append(self)
+
+    def _committed(self, partition: int) -> int:
+        return self.broker.committed.get((self.topic, self.group_id, partition), 0)
+
+    def poll(self, timeout_ms: int = 0, max_records: int = None):
+        batch = {}
+        with self.broker.lock:
+            # after a rebalance, newly assigned partitions resume from the group's commit
+            self.positions = {
+                p: self.positions[p] if p in self.positions else self._committed(p)
+                for p in self.broker.assignment(self)
+            }
+            for partition, position in self.positions.items():
+                if max_records is not None and max_records <= 0:
+                    break
+                log = self.broker.topics[self.topic][partition]
+                end = len(log) if max_records is None else min(len(log), position + max_records)
+                if end > position:
+                    batch[(self.topic, partition)] = log[position:end]
+                    self.positions[partition] = end
+                    if max_records is not None:
+                        max_records -= end - position
+
+        if not batch:
+            time.sleep(timeout_ms / 1000)
+        return batch
+
+    def commit(self):
+        with self.broker.lock:
+            for partition, position in self.positions.items():
+                self.broker.committed[(self.topic, self.group_id, partition)] = position
+
+    def close(self):
+        # leaving the group hands its partitions (and uncommitted records) to the others
+        with self.broker.lock:
+            members = self.broker.members[(self.topic, self.group_id)]
+            if self in members:
+                members.remove(self)
+
+
+# --------------------------------------------------
+# Producer side
+# --------------------------------------------------
+class IngestJobProducer:
+    """
+    Enqueues one job per file.
+    The key is the source path and the partition is shard_for(source_path),
+    so every version of a file is ingested in order, by the one worker
+    that writes the file's shard. The topic needs num_partitions
+    partitions (NUM_SHARDS).
+    """
+
+    def __init__(self, producer, topic: str = INGEST_TOPIC, num_partitions: int = NUM_SHARDS):
+        self.producer = producer
+        self.topic = topic
+        self.num_partitions = num_partitions
+
+    def enqueue(self, file_path: str):
+        job = {
+            "source_path": file_path,
+            "source_type": file_path.split(".")[-1].lower(),
+            "enqueued_at": time.time()
+        }
+        self.producer.send(
+            self.topic, key=file_path, value=job,
+            partition=shard_for(file_path, self.num_partitions)
+        )
+
+    def enqueue_many(self, file_paths: List[str]):
+        for file_path in file_paths:
+            self.enqueue(file_path)
+        self.producer.flush()
+
+
+# --------------------------------------------------
+# Worker side
+# --------------------------------------------------
+class IngestWorker:
+    """
+    Ingest worker: load_documents + ingest_pipeline per job.
+
+    Offsets are committed only after the Postgres transaction is committed
+    and the vector store is saved, so a crash at any point leads to
+    redelivery (at-least-once). Redelivered jobs are cheap: unchanged files
+    are skipped by checksum unless their vectors never reached the index.
+
+    Partition i carries the jobs of shard i, and each shard has exactly
+    one writer: run() takes writer_lock() on every shard the worker owns
+    (ShardSet.owned; an unsharded store is shard 0) and only then calls
+    connect(partitions) for a consumer assigned those partitions. Workers
+    owning disjoint shards run in parallel; a second worker for the same
+    shards waits on the lock without holding any partition, and takes
+    over from the offsets the first one committed once it dies.
+
+    Publishing a serving generation copies the whole index, so saved jobs
+    are published together, at most every publish_interval_s and whenever
+    the topic runs dry. The first publish happens even without new jobs,
+    so changes a crashed predecessor saved but never published go out too.
+    """
+
+    def __init__(self, connect: Callable[[List[int]], object], vector_store: VectorStore,
+                 dedup_index: NearDuplicateIndex = None, bm25_store: BM25Store = None,
+                 publish_interval_s: float = PUBLISH_INTERVAL_S):
+        self.connect = connect
+        self.consumer = None
+        self.vector_store = vector_store
+        self.dedup_index = dedup_index
+        self.bm25_store = bm25_store
+        self.publish_interval_s = publish_interval_s
+        self.processed = 0
+        self.skipped = 0
+        # saved by a previous writer, maybe never published
+        self.unpublished = 1
+        self.published_at = time.monotonic()
+
+    def handle(self, job: dict):
+        from ingestion.load import load_documents
+        from ingestion.ingest import ingest_pipeline, file_checksum, plan_version
+        from storage.postgres import PostgresStore
+
+        source_path = job["source_path"]
+
+        if not os.path.exists(source_path):
+            print(f"❌ File not found: {source_path}")
+            self.skipped += 1
+            return
+
+        checksum = file_checksum(source_path)
+
+        # cheap pre-check so unchanged files never get partitioned
+        pg = PostgresStore(DB_CONFIG)
+        try:
+            plan = plan_version(pg, source_path, checksum, vector_store=self.vector_store)
+        finally:
+            pg.close()
+
+        if plan is None:
+            print(f"   ⏭️ Unchanged, skipping file: {source_path}")
+            self.skipped += 1
+            return
+
+        docs = load_documents([source_path])
+        if not docs:
+            print(f"   ⚠️ No valid chunks found, skipping file: {source_path}")
+            self.skipped += 1
+            return
+
+        ingest_pipeline(
+            docs=docs,
+            source_path=source_path,
+            source_type=job.get("source_type") or source_path.split(".")[-1].lower(),
+            raw_file_bytes=None,
+            vector_store=self.vector_store,
+            checksum=checksum,
+            verify_index=True,
+            dedup_index=self.dedup_index,
+            bm25_store=self.bm25_store
+        )
+
+        # index durable before the offset moves
+        self.vector_store.save()
+        if self.bm25_store is not None:
+            self.bm25_store.save()
+        if self.dedup_index is not None:
+            self.dedup_index.save()
+        self.unpublished += 1
+        self.processed += 1
+
+    def publish(self, force: bool = False):
+        """New serving generation for the jobs saved since the last one."""
+        if not self.unpublished:
+            return
+        if not force and time.monotonic() - self.published_at < self.publish_interval_s:
+            return
+        publish_stores(self.vector_store)
+        self.unpublished = 0
+        self.published_at = time.monotonic()
+
+    @property
+    def partitions(self) -> List[int]:
+        if isinstance(self.vector_store, ShardSet):
+            return list(self.vector_store.owned)
+        return [0]
+
+    def run(self, max_jobs: int = None, poll_timeout_ms: int = 1000, stop_when_idle: bool = False):
+        """
+        Process one record per poll and commit it before fetching the next.
+        A failing job raises without committing; the record is redelivered
+        once the worker is restarted.
+        """
+        from ingestion.ingest import reconcile_index
+        from storage.postgres import PostgresStore
+
+        with writer_locks(self.vector_store):
+            # Postgres changes a crashed writer committed but never got into the index
+            pg = PostgresStore(DB_CONFIG)
+            try:
+                reconcile_index(pg, self.vector_store, self.bm25_store, self.dedup_index)
+            finally:
+                pg.close()
+
+            self.consumer = self.connect(self.partitions)
+            try:
+                self._consume(max_jobs, poll_timeout_ms, stop_when_idle)
+            finally:
+                self.consumer.close()
+
+        return {"processed": self.processed, "skipped": self.skipped}
+
+    def _consume(self, max_jobs, poll_timeout_ms, stop_when_idle):
+        handled = 0
+        while max_jobs is None or handled < max_jobs:
+            batch = self.consumer.poll(timeout_ms=poll_timeout_ms, max_records=1)
+
+            if not batch:
+                # caught up: whatever is saved becomes visible now
+                self.publish(force=True)
+                if stop_when_idle:
+                    break
+                continue
+
+            for records in batch.values():
+                for record in records:
+                    print(f"📄 Job offset={record.offset}: {record.value['source_path']}")
+                    self.handle(record.value)
+                    self.consumer.commit()
+                    handled += 1
+            self.publish()
+
+        self.publish(force=True)
+
+
+if __name__ == "__main__":
+    # python -m ingestion.jobs produce ./data/raw/a.pdf ./data/raw/b.docx
+    # python -m ingestion.jobs worker            (every shard)
+    # python -m ingestion.jobs worker 0 2        (shards / partitions 0 and 2 only)
+    if len(sys.argv) < 2 or sys.argv[1] not in {"produce", "worker"}:
+        print("usage: python -m ingestion.jobs produce FILE... | worker [SHARD...]")
+        sys.exit(1)
+
+    if sys.argv[1] == "produce":
+        producer = kafka_producer()
+        IngestJobProducer(producer).enqueue_many(sys.argv[2:])
+        producer.close()
+        print(f"✅ Enqueued {len(sys.argv[2:])} jobs on {INGEST_TOPIC}")
+    else:
+        owned = [int(a) for a in sys.argv[2:]] or None
+        dedup_index = None
+        # near-duplicates are found across the whole corpus, so only a
+        # writer of every shard keeps the MinHash index
+        if owned is None or set(owned) == set(range(NUM_SHARDS)):
+            dedup_index = NearDuplicateIndex(path=os.path.join(VECTOR_STORE_PATH, "minhash_lsh.json"))
+
+        if NUM_SHARDS > 1:
+            # ShardSet routes by source_path and holds a BM25Store per owned shard
+            worker = IngestWorker(kafka_consumer, ShardSet(VECTOR_STORE_PATH, NUM_SHARDS, owned=owned), dedup_index)
+        else:
+            worker = IngestWorker(
+                kafka_consumer,
+                VectorStore(base_path=VECTOR_STORE_PATH),
+                dedup_index,
+                BM25Store(base_path=VECTOR_STORE_PATH)
+            )
+        worker.run()
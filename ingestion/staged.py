@@ -0,0 +1,378 @@
+# staged.py
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List
+
+from PIL import Image
+
+from ingestion.load import load_documents
+from ingestion.ingest import prepare_chunks, file_checksum, plan_version
+from ingestion.chunking import assemble_chunks, index_size_report, print_index_size_report
+from ingestion.dedup import deduplicate_chunks, relink_orphans, DEDUP_MODE
+from ingestion.embed_func import embed_texts, embed_image
+from storage.postgres import PostgresStore
+from storage.shards import ShardSet, route, owns
+from config import DB_CONFIG
+
+# end-of-stream marker passed down the queues
+_DONE = object()
+POLL_SECONDS = 0.1
+
+
+class StageStats:
+    """
+    Counters for one pipeline stage.
+    busy_seconds only covers time spent inside the stage function,
+    not time blocked on a full downstream queue.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self._depth_total = 0
+
+    def observe_queue(self, depth: int):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self._depth_total += depth
+
+    def as_dict(self, wall_seconds: float) -> dict:
+        return {
+            "stage": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "throughput_per_sec": round(self.items_in / wall_seconds, 2) if wall_seconds else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_queue_depth": round(self._depth_total / self.items_in, 2) if self.items_in else 0.0
+        }
+
+
+class Stage:
+    """
+    One step of a staged pipeline.
+    `fn(item)` returns an iterable (usually a generator) of items for the next stage.
+    """
+
+    def __init__(self, name: str, fn: Callable, queue_size: int = 4):
+        self.name = name
+        self.fn = fn
+        self.queue_size = queue_size
+
+
+class StagedPipeline:
+    """
+    Runs every stage on its own thread, connected by bounded queues.
+    A full queue blocks the producer, so a slow stage throttles the
+    stages in front of it instead of letting work pile up in memory.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        if not stages:
+            raise ValueError("StagedPipeline needs at least one stage")
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=s.queue_size) for s in stages]
+        self.stats = [StageStats(s.name) for s in stages]
+        self._abort = threading.Event()
+        self._error = None
+
+    # -------------------------
+    # Queue helpers (abort-aware)
+    # -------------------------
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, exc: Exception):
+        if self._error is None:
+            self._error = exc
+        self._abort.set()
+
+    # -------------------------
+    # Threads
+    # -------------------------
+    def _feed(self, source: Iterable):
+        try:
+            for item in source:
+                if not self._put(self.queues[0], item):
+                    return
+            self._put(self.queues[0], _DONE)
+        except Exception as e:
+            self._fail(e)
+
+    def _work(self, idx: int):
+        stage = self.stages[idx]
+        stats = self.stats[idx]
+        in_q = self.queues[idx]
+        out_q = self.queues[idx + 1] if idx + 1 < len(self.queues) else None
+
+        try:
+            while True:
+                stats.observe_queue(in_q.qsize())
+                item = self._get(in_q)
+                if item is _DONE:
+                    break
+                stats.items_in += 1
+
+                outputs = iter(stage.fn(item) or ())
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        out = next(outputs)
+                    except StopIteration:
+                        stats.busy_seconds += time.perf_counter() - started
+                        break
+                    stats.busy_seconds += time.perf_counter() - started
+                    stats.items_out += 1
+
+                    if out_q is not None and not self._put(out_q, out):
+                        return
+
+            if out_q is not None:
+                self._put(out_q, _DONE)
+        except Exception as e:
+            self._fail(e)
+
+    def run(self, source: Iterable) -> dict:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self._feed, args=(source,), daemon=True)]
+        threads += [
+            threading.Thread(target=self._work, args=(i,), name=f"stage-{s.name}", daemon=True)
+            for i, s in enumerate(self.stages)
+        ]
+
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if self._error is not None:
+            raise self._error
+
+        wall = time.perf_counter() - started
+        return {
+            "wall_seconds": round(wall, 4),
+            "stages": [s.as_dict(wall) for s in self.stats]
+        }
+
+
+# --------------------------------------------------
+# Ingestion stages
+# --------------------------------------------------
+def build_ingestion_stages(vector_store, pg: PostgresStore, lookup_pg: PostgresStore, batch_size: int = 32,
+                           queue_size: int = 4, dedup_index=None, dedup_mode: str = DEDUP_MODE,
+                           bm25_store=None) -> List[Stage]:
+    """
+    partition -> persist -> embed -> index
+
+    - partition: checksum check, unstructured + assemble_chunks + prepare_chunks (CPU bound)
+    - persist:   near-duplicate check, document + chunk rows in Postgres (I/O bound)
+    - embed:     BGE / CLIP forward passes in batches of `batch_size`
+    - index:     FAISS + BM25 add / retire, the only stage that touches the indexes
+
+    partition and persist each get their own connection because a
+    PostgresStore cursor must not be shared between threads.
+    """
+
+    def partition(file_path):
+        # Unchanged files are dropped before the expensive partition call,
+        # unless their chunks never reached the index (crash before the save)
+        checksum = file_checksum(file_path)
+        plan = plan_version(lookup_pg, file_path, checksum, vector_store=vector_store)
+        if plan is None:
+            print(f"   ⏭️ Unchanged, skipping file: {file_path}")
+            return
+
+        docs = load_documents([file_path])
+        assembled = assemble_chunks(docs)
+        print_index_size_report(index_size_report(docs, assembled))
+
+        chunks = prepare_chunks(docs=assembled)
+        if not chunks:
+            print(f"   ⚠️ No valid chunks found, skipping file: {file_path}")
+            return
+
+        yield {
+            "source_path": file_path,
+            "source_type": file_path.split(".")[-1].lower(),
+            "checksum": checksum,
+            "plan": plan,
+            "chunks": chunks
+        }
+
+    def persist(job):
+        plan = job["plan"]
+        chunks = job["chunks"]
+        retired_chunk_ids = []
+        promoted = []
+        dedup_added = []
+
+        try:
+            if plan["previous_document_id"]:
+                retired_chunk_ids = pg.get_chunk_ids(plan["previous_document_id"])
+
+            if dedup_index is not None:
+                chunks, dedup_stats = deduplicate_chunks(
+                    chunks, dedup_index, mode=dedup_mode, exclude=retired_chunk_ids
+                )
+                dedup_added = dedup_stats["added"]
+
+            document_id = pg.insert_document(
+                source_path=job["source_path"],
+                source_type=job["source_type"],
+                checksum=job["checksum"],
+                version=plan["version"]
+            )
+            chunk_ids = pg.insert_chunks(document_id=document_id, chunks=chunks)
+
+            if plan["previous_document_id"]:
+                pg.retire_document(plan["previous_document_id"])
+                if dedup_index is not None:
+                    promoted = relink_orphans(pg, dedup_index, retired_chunk_ids)
+                    dedup_added += [o["chunk_id"] for o in promoted]
+
+            pg.commit()
+        except Exception:
+            pg.rollback()
+            if dedup_index is not None:
+                dedup_index.remove(dedup_added)
+            raise
+
+        if retired_chunk_ids:
+            if dedup_index is not None:
+                dedup_index.remove(retired_chunk_ids)
+            yield {"modality": "Retire", "chunk_ids": retired_chunk_ids}
+
+        # near-duplicates are stored but never embedded
+        pending = [
+            (chunk, chunk_id, job["source_path"]) for chunk, chunk_id in zip(chunks, chunk_ids)
+            if not chunk.get("canonical_chunk_id")
+        ]
+        # promoted orphans belong to their own (older) files; another
+        # writer's shard embeds them in its reconcile_index
+        pending += [
+            ({"element_type": "Text", "cleaned_text": o["cleaned_text"]}, o["chunk_id"], o["source_path"])
+            for o in promoted if owns(vector_store, o["source_path"])
+        ]
+
+        # batches never mix files, so the index stage can route each to its shard
+        batches = {}
+        for chunk, chunk_id, owner in pending:
+            modality = "Image" if chunk["element_type"] == "Image" else "Text"
+            payload = chunk["image_path"] if modality == "Image" else chunk["cleaned_text"]
+            items = batches.setdefault((modality, str(owner)), [])
+            items.append((str(chunk_id), payload))
+
+            if len(items) >= batch_size:
+                yield {"modality": modality, "source_path": owner, "items": items}
+                batches[(modality, str(owner))] = []
+
+        for (modality, owner), items in batches.items():
+            if items:
+                yield {"modality": modality, "source_path": owner, "items": items}
+
+    def embed(batch):
+        if batch["modality"] == "Retire":
+            yield batch
+            return
+
+        chunk_ids = [cid for cid, _ in batch["items"]]
+        texts = None
+
+        if batch["modality"] == "Image":
+            vectors = [
+                embed_image(Image.open(path).convert("RGB"))
+                for _, path in batch["items"]
+            ]
+        else:
+            texts = [text for _, text in batch["items"]]
+            vectors = embed_texts(texts, batch_size=batch_size)
+
+        yield {
+            "modality": batch["modality"],
+            "source_path": batch["source_path"],
+            "chunk_ids": chunk_ids,
+            "vectors": vectors,
+            "texts": texts
+        }
+
+    def index(batch):
+        if batch["modality"] == "Retire":
+            vector_store.remove(batch["chunk_ids"])
+            if bm25_store is not None:
+                bm25_store.remove(batch["chunk_ids"])
+            return ()
+
+        target_vs, target_bm25 = route(vector_store, bm25_store, batch["source_path"])
+
+        add = target_vs.add_image if batch["modality"] == "Image" else target_vs.add_text
+        for vec, chunk_id in zip(batch["vectors"], batch["chunk_ids"]):
+            add(vec, chunk_id)
+
+        if target_bm25 is not None and batch["texts"]:
+            for chunk_id, text in zip(batch["chunk_ids"], batch["texts"]):
+                target_bm25.add(chunk_id, text)
+        return ()
+
+    stages = [
+        Stage("partition", partition, queue_size=queue_size),
+        Stage("persist", persist, queue_size=queue_size),
+        Stage("embed", embed, queue_size=queue_size),
+        Stage("index", index, queue_size=queue_size),
+    ]
+    return stages
+
+
+def run_staged_ingestion(file_paths: List[str], vector_store, batch_size: int = 32, queue_size: int = 4,
+                         dedup_index=None, dedup_mode: str = DEDUP_MODE, bm25_store=None) -> dict:
+    """
+    Ingest files with partitioning, Postgres writes, embedding and FAISS
+    adds running concurrently. Returns per-stage throughput / queue depth.
+    """
+    pg = PostgresStore(DB_CONFIG)
+    lookup_pg = PostgresStore(DB_CONFIG)
+    stages = build_ingestion_stages(
+        vector_store, pg, lookup_pg,
+        batch_size=batch_size, queue_size=queue_size,
+        dedup_index=dedup_index, dedup_mode=dedup_mode,
+        bm25_store=bm25_store
+    )
+    pipeline = StagedPipeline(stages)
+
+    try:
+        report = pipeline.run(p for p in file_paths if os.path.exists(p))
+    finally:
+        pg.close()
+        lookup_pg.close()
+
+    print(f"[VERIFY] FAISS text vectors: {vector_store.text_index.ntotal}")
+    print(f"[VERIFY] FAISS image vectors: {vector_store.image_index.ntotal}")
+    if bm25_store is not None:
+        print(f"[VERIFY] BM25 documents: {bm25_store.N}")
+    if isinstance(vector_store, ShardSet):
+        for s in vector_store.shard_sizes():
+            print(f"[SHARD] {s['shard']:02d} | text={s['text_vectors']} | image={s['image_vectors']} | bm25={s['bm25_documents']}")
+    for s in report["stages"]:
+        print(
+            f"[STAGE] {s['stage']:<9} | in={s['items_in']} | out={s['items_out']} | "
+            f"busy={s['busy_seconds']}s | {s['throughput_per_sec']}/s | "
+            f"max_queue={s['max_queue_depth']}"
+        )
+    return report
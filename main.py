@@ -1,52 +1,63 @@
-from ingestion.load import load_documents
-from ingestion.ingest import ingest_pipeline
+from ingestion.staged import run_staged_ingestion
 from typing import List
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 from storage.vector_store import VectorStore
+from storage.bm25_store import BM25Store
+from storage.shards import ShardSet, writer_locks
+from storage.generations import publish_stores
+from ingestion.dedup import NearDuplicateIndex
+from ingestion.ingest import reconcile_index
+from storage.postgres import PostgresStore
+from config import NUM_SHARDS, VECTOR_STORE_PATH, DB_CONFIG
 
-vs = VectorStore()
-def run_ingestion(file_paths):
+# NUM_SHARDS > 1 → one VectorStore + BM25Store per shard, routed by source_path
+if NUM_SHARDS > 1:
+    vs = ShardSet(base_path=VECTOR_STORE_PATH, num_shards=NUM_SHARDS)
+    bm25 = None
+else:
+    vs = VectorStore(base_path=VECTOR_STORE_PATH)
+    bm25 = BM25Store(base_path=vs.base_path)
+dedup_index = NearDuplicateIndex(path=os.path.join(vs.base_path, "minhash_lsh.json"))
+def run_ingestion(file_paths, batch_size: int = 32, queue_size: int = 4):
     print("🚀 Starting ingestion pipeline...\n")
 
+    existing = []
     for file_path in file_paths:
-        print(f"📄 Processing file: {file_path}")
-
         if not os.path.exists(file_path):
             print(f"❌ File not found: {file_path}")
             continue
+        existing.append(file_path)
 
-        # 1️⃣ Read raw bytes (document-level)
-        with open(file_path, "rb") as f:
-            raw_file_bytes = f.read()
-
-        # 2️⃣ Load + chunk document
-        docs = load_documents([file_path])
-        print(f"   ➜ Extracted {len(docs)} chunks")
+    # same single-writer rule as the Kafka workers (ingestion/jobs.py)
+    with writer_locks(vs):
+        # Postgres changes an earlier run committed but never got into the index
+        pg = PostgresStore(DB_CONFIG)
+        try:
+            reconcile_index(pg, vs, bm25, dedup_index)
+        finally:
+            pg.close()
 
-        if not docs:
-            print("   ⚠️ No valid chunks found, skipping file\n")
-            continue
-
-        # 3️⃣ Derive metadata
-        source_path = file_path
-        source_type = file_path.split(".")[-1].lower()
-
-        # 4️⃣ Ingest pipeline
-        ingest_pipeline(
-            docs=docs,
-            source_path=source_path,
-            source_type=source_type,
-            raw_file_bytes=raw_file_bytes,
-            vector_store=vs
+        # partition -> persist -> embed -> index, each stage on its own thread
+        report = run_staged_ingestion(
+            file_paths=existing,
+            vector_store=vs,
+            batch_size=batch_size,
+            queue_size=queue_size,
+            dedup_index=dedup_index,
+            bm25_store=bm25
         )
-
-        print(f"   ✅ Successfully ingested: {file_path}\n")
-    vs.save()
+        vs.save()
+        if bm25 is not None:
+            bm25.save()
+        dedup_index.save()
+        # serving processes pick the new generation up without a restart
+        publish_stores(vs)
 
     print("🎉 Ingestion pipeline completed for all files.")
+    return report
 
 if __name__ == "__main__":
     FILES_TO_INGEST = ["./data/raw/doc_pdf.pdf", "./data/raw/doc_pdf_img.pdf", "./data/raw/doc_docx.docx", "./data/raw/doc_ppt.pptx", "./data/raw/scaned_pdf.pdf", "./data/raw/img.png"]
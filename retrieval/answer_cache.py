@@ -0,0 +1,239 @@
+# answer_cache.py
+import time
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Iterable, Optional, Set
+
+import faiss
+import numpy as np
+
+ANSWER_SIMILARITY_THRESHOLD = 0.95     # cosine between BGE query embeddings
+ANSWER_CACHE_MAX_ENTRIES = 10_000
+ANSWER_CACHE_TTL_SECONDS = 24 * 3600
+NEIGHBOURS = 8                         # candidates checked for a matching evidence set
+HNSW_M = 32
+HNSW_EF_SEARCH = 32
+
+
+class AnswerCache:
+    """
+    Generated answers, found by query-embedding similarity and matched on
+    the exact set of chunk_ids the answer was generated from.
+
+    A near-identical question only reuses an answer when retrieval handed
+    the answer node the same evidence, so a different context always gets
+    a fresh answer. Chunk ids are never reused for new content, so an
+    answer stays valid until one of its documents is retired
+    (re-ingested or deleted). That is checked whenever the index
+    generation changes, and invalidate_documents() drops entries directly.
+
+    The ANN index is HNSW over unit query vectors (~0.35 ms per lookup at
+    10k entries on one core; a flat scan is ~3 ms). HNSW cannot delete,
+    so dropped entries are tombstones skipped at lookup, and the graph
+    is rebuilt in a background thread once they outnumber live entries.
+    """
+
+    def __init__(self, dim: int = 768, threshold: float = ANSWER_SIMILARITY_THRESHOLD,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS):
+        self.dim = dim
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.index = self._new_index()
+        self._positions = []                   # index row -> entry id
+        self._entries = OrderedDict()          # id -> entry, LRU order
+        self._by_document = defaultdict(set)   # document_id -> entry ids
+        self._next_id = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._epoch = 0                        # bumped by clear(); stale rebuilds are dropped
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidations = 0
+        self._lookup_ms_total = 0.0
+
+    def _new_index(self):
+        index = faiss.IndexHNSWFlat(self.dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    @staticmethod
+    def _unit(query_embedding) -> np.ndarray:
+        vec = np.asarray(query_embedding, dtype="float32").reshape(1, -1)
+        return vec / max(float(np.linalg.norm(vec)), 1e-12)
+
+    # -------------------------
+    # Lookups
+    # -------------------------
+    def lookup(self, query_embedding, evidence: Iterable[str]) -> Optional[Dict]:
+        started = time.perf_counter()
+        evidence = frozenset(evidence)
+
+        with self._lock:
+            answer = None
+            if self._entries:
+                # extra neighbours leave room for tombstones
+                k = min(2 * NEIGHBOURS, self.index.ntotal)
+                sims, rows = self.index.search(self._unit(query_embedding), k)
+                now = time.monotonic()
+                for sim, row in zip(sims[0], rows[0]):
+                    if row < 0 or sim < self.threshold:
+                        break
+                    entry_id = self._positions[row]
+                    entry = self._entries.get(entry_id)
+                    if entry is None:
+                        continue
+                    if entry["expires_at"] < now:
+                        self._drop(entry_id)
+                        self.expired += 1
+                        continue
+                    if entry["evidence"] == evidence:
+                        self._entries.move_to_end(entry_id)
+                        answer = entry["answer"]
+                        break
+                self._maybe_rebuild()
+
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._lookup_ms_total += (time.perf_counter() - started) * 1000
+            return answer
+
+    def put(self, query_embedding, evidence: Iterable[str], document_ids: Iterable[str], answer: Dict):
+        unit = self._unit(query_embedding)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            documents = set(document_ids)
+            self._entries[entry_id] = {
+                "unit": unit,
+                "evidence": frozenset(evidence),
+                "documents": documents,
+                "answer": answer,
+                "expires_at": time.monotonic() + self.ttl_seconds
+            }
+            for document_id in documents:
+                self._by_document[document_id].add(entry_id)
+            self.index.add(unit)
+            self._positions.append(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            self._maybe_rebuild()
+
+    # -------------------------
+    # Invalidation
+    # -------------------------
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for document_id in entry["documents"]:
+            ids = self._by_document[document_id]
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_document[document_id]
+
+    def _maybe_rebuild(self):
+        # called with the lock held
+        if self._rebuilding or self.index.ntotal - len(self._entries) <= max(len(self._entries), NEIGHBOURS):
+            return
+        self._rebuilding = True
+        ids = list(self._entries)
+        units = [self._entries[i]["unit"] for i in ids]
+        threading.Thread(
+            target=self._rebuild, args=(ids, units, self.index.ntotal, self._epoch),
+            name="answer-cache-rebuild", daemon=True
+        ).start()
+
+    def _rebuild(self, ids, units, rows_seen, epoch):
+        # the HNSW build runs outside the lock; lookups keep using the old graph
+        index = self._new_index()
+        if units:
+            index.add(np.vstack(units))
+
+        # catch up on entries added while building, outside the lock until few remain
+        while True:
+            with self._lock:
+                if epoch != self._epoch:
+                    self._rebuilding = False
+                    return
+                late = [i for i in self._positions[rows_seen:] if i in self._entries]
+                rows_seen = len(self._positions)
+                units = [self._entries[i]["unit"] for i in late]
+                if len(late) <= NEIGHBOURS:
+                    if late:
+                        index.add(np.vstack(units))
+                    self.index = index
+                    self._positions = ids + late
+                    self._rebuilding = False
+                    return
+            index.add(np.vstack(units))
+            ids = ids + late
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        with self._lock:
+            dropped = set()
+            for document_id in document_ids:
+                dropped |= self._by_document.get(document_id, set())
+            for entry_id in dropped:
+                self._drop(entry_id)
+            self._maybe_rebuild()
+            self.invalidations += len(dropped)
+            return len(dropped)
+
+    def observe_generation(self, generation, retired_documents: Callable[[Set[str]], Set[str]]) -> int:
+        """
+        First call after an index generation change asks retired_documents
+        (e.g. ChunksRetriever.retired_documents) which cited documents are
+        no longer active and drops their answers.
+        """
+        with self._lock:
+            if generation == self._generation:
+                return 0
+            first = self._generation is None
+            self._generation = generation
+            cited = set(self._by_document)
+
+        if first or not cited:
+            return 0
+        return self.invalidate_documents(retired_documents(cited))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_document.clear()
+            self.index = self._new_index()
+            self._positions = []
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "mean_lookup_ms": round(self._lookup_ms_total / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "invalidations": self.invalidations
+            }
+
+
+_answer_cache = None
+
+def get_answer_cache() -> AnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    return _answer_cache
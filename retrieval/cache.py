@@ -0,0 +1,171 @@
+# cache.py
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+CACHE_TTL_SECONDS = 15 * 60
+
+
+def normalize_query(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _is_older(generation, current) -> bool:
+    """generation is strictly behind current (ints, or per-shard tuples compared shard by shard)."""
+    if current is None or generation == current:
+        return False
+    if isinstance(generation, tuple) and isinstance(current, tuple):
+        return len(generation) == len(current) and all(g <= c for g, c in zip(generation, current))
+    try:
+        return generation < current
+    except TypeError:
+        return False
+
+
+def _estimate_bytes(obj) -> int:
+    """Approximate deep size of the cached structures (dicts / lists / scalars)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_estimate_bytes(k) + _estimate_bytes(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_estimate_bytes(v) for v in obj)
+    return size
+
+
+class RetrievalCache:
+    """
+    LRU cache of fused retrieval results, bounded by estimated bytes,
+    with a TTL per entry.
+
+    Every entry is tagged with the index generation it was computed on.
+    A lookup against a different generation is a miss, and the first
+    lookup with a newer generation drops everything older, so a
+    published re-ingestion invalidates the cache without extra wiring.
+    Only lookups move the generation forward; a put for any other
+    generation than the current one is ignored.
+    """
+
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict()    # key -> (generation, expires_at, size, value)
+        self._bytes = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(variants: List[str], top_k: int, intent: Optional[str] = None,
+                 metadata_filter: Optional[Dict] = None) -> tuple:
+        # intent picks the fusion config and filters change the scope, so both are part of the key
+        return (
+            tuple(normalize_query(v) for v in variants),
+            top_k,
+            intent,
+            repr(sorted(metadata_filter.items())) if metadata_filter else None
+        )
+
+    # -------------------------
+    # Lookups
+    # -------------------------
+    def get(self, key: tuple, generation) -> Optional[dict]:
+        with self._lock:
+            # a request that read the generation just before a reload must not roll it back
+            if _is_older(generation, self._generation):
+                self.misses += 1
+                return None
+            self._observe_generation(generation)
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry_generation, expires_at, _, value = entry
+            if entry_generation != generation or expires_at < time.monotonic():
+                if expires_at < time.monotonic():
+                    self.expired += 1
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, generation, value: dict):
+        size = _estimate_bytes(key) + _estimate_bytes(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            # a search that straddled a reload belongs to an outdated generation
+            if generation != self._generation:
+                return
+
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = (generation, time.monotonic() + self.ttl_seconds, size, value)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    # -------------------------
+    # Invalidation
+    # -------------------------
+    def _observe_generation(self, generation):
+        if generation == self._generation:
+            return
+        if self._generation is not None and self._entries:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        self._generation = generation
+
+    def _drop(self, key):
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "invalidations": self.invalidations
+            }
+
+
+_cache = None
+
+def get_retrieval_cache() -> RetrievalCache:
+    global _cache
+    if _cache is None:
+        _cache = RetrievalCache()
+    return _cache
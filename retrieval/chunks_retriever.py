@@ -25,6 +25,8 @@ class ChunksRetriever:
                     chunk_index,
                     page_number,
                     cleaned_text,
+                    element_type,
+                    image_path,
                     created_at
                 FROM chunks
                 WHERE chunk_id = %s
@@ -43,21 +45,84 @@ class ChunksRetriever:
             "chunk_index": row["chunk_index"],
             "page_number": row["page_number"],
             "text": row["cleaned_text"],
+            "element_type": row["element_type"],
+            "image_path": row["image_path"],
             "created_at": row["created_at"]
         }
 
     # --------------------------------------------------
-    # Fetch ALL chunks (used for indexing / Step-4 setup)
+    # Fetch MANY chunks in one round trip (rerank)
     # --------------------------------------------------
-    def get_all_chunks(self):
+    def get_many(self, chunk_ids) -> dict:
+        if not chunk_ids:
+            return {}
+
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(
                 """
                 SELECT
                     chunk_id,
-                    cleaned_text
+                    document_id,
+                    page_number,
+                    cleaned_text,
+                    element_type
                 FROM chunks
-                ORDER BY created_at ASC
+                WHERE chunk_id = ANY(%s::uuid[])
+                """,
+                ([str(cid) for cid in chunk_ids],)
+            )
+            rows = cur.fetchall()
+
+        return {
+            str(r["chunk_id"]): {
+                "chunk_id": str(r["chunk_id"]),
+                "document_id": str(r["document_id"]),
+                "page_number": r["page_number"],
+                "text": r["cleaned_text"],
+                "element_type": r["element_type"]
+            }
+            for r in rows
+        }
+
+    # --------------------------------------------------
+    # Documents no longer served (answer cache invalidation)
+    # --------------------------------------------------
+    def retired_documents(self, document_ids) -> set:
+        """Subset of document_ids that are inactive (re-ingested) or gone."""
+        document_ids = {str(d) for d in document_ids}
+        if not document_ids:
+            return set()
+
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT document_id
+                FROM documents
+                WHERE document_id = ANY(%s::uuid[])
+                  AND is_active
+                """,
+                (list(document_ids),)
+            )
+            active = {str(r[0]) for r in cur.fetchall()}
+
+        return document_ids - active
+
+    # --------------------------------------------------
+    # Fetch ALL chunks (used for indexing / Step-4 setup)
+    # --------------------------------------------------
+    def get_all_chunks(self):
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT
+                    c.chunk_id,
+                    c.cleaned_text
+                FROM chunks c
+                JOIN documents d ON d.document_id = c.document_id
+                WHERE d.is_active
+                  AND c.canonical_chunk_id IS NULL
+                  AND c.element_type <> 'Image'
+                ORDER BY c.created_at ASC
                 """
             )
 
@@ -0,0 +1,122 @@
+# concurrency.py
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from typing import Callable, Dict, Optional
+
+# FAISS releases the GIL during search, so threads give real overlap
+SIGNAL_WORKERS = 8
+# pure-Python BM25 holds the GIL; its own small pool keeps a sparse
+# backlog off the threads dense / image searches run on
+SPARSE_WORKERS = 2
+# CLIP text-tower forward passes for image search; a model call is far
+# slower than a FAISS search and must not occupy the retrieval threads
+CLIP_WORKERS = 2
+
+POOL_WORKERS = {"retrieval": SIGNAL_WORKERS, "sparse": SPARSE_WORKERS, "clip": CLIP_WORKERS}
+SIGNAL_POOLS = {"sparse": "sparse", "clip": "clip"}    # everything else → "retrieval"
+
+# queued + running jobs per signal, across requests; past this a request
+# degrades the signal at once instead of queueing behind abandoned work
+MAX_IN_FLIGHT = {"dense": 16, "sparse": 4, "image": 16, "clip": 4}
+DEFAULT_MAX_IN_FLIGHT = 16
+
+_executors = {}
+_in_flight = {}
+_lock = threading.Lock()
+_signal = threading.local()
+
+def get_executor(pool: str = "retrieval") -> ThreadPoolExecutor:
+    """Process-wide pools: "retrieval" for dense / image signals, "sparse" for BM25."""
+    with _lock:
+        if pool not in _executors:
+            _executors[pool] = ThreadPoolExecutor(max_workers=POOL_WORKERS[pool], thread_name_prefix=pool)
+        return _executors[pool]
+
+
+def _slots(name: str) -> threading.BoundedSemaphore:
+    with _lock:
+        if name not in _in_flight:
+            _in_flight[name] = threading.BoundedSemaphore(MAX_IN_FLIGHT.get(name, DEFAULT_MAX_IN_FLIGHT))
+        return _in_flight[name]
+
+
+def submit_bounded(name: str, fn: Callable, *args) -> Optional[Future]:
+    """
+    fn(*args) on the pool of signal `name`, or None when `name` already
+    has MAX_IN_FLIGHT jobs queued or running.
+    """
+    slots = _slots(name)
+    if not slots.acquire(blocking=False):
+        return None
+    future = get_executor(SIGNAL_POOLS.get(name, "retrieval")).submit(fn, *args)
+    # released when the job finishes or is cancelled, not when the caller stops waiting
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def signal_deadline() -> Optional[float]:
+    """perf_counter() deadline of the signal running on this thread, None outside run_signals."""
+    return getattr(_signal, "deadline", None)
+
+
+def _timed(fn: Callable, deadline: float):
+    started = time.perf_counter()
+    # picked up from the queue after the caller gave up → skip the work
+    if started > deadline:
+        raise FuturesTimeout()
+    # blocking calls inside the signal (shard RPCs) give up at the same deadline
+    _signal.deadline = deadline
+    try:
+        value = fn()
+    finally:
+        _signal.deadline = None
+    return value, (time.perf_counter() - started) * 1000
+
+
+def run_signals(tasks: Dict[str, Callable], timeouts_ms: Dict[str, float]):
+    """
+    Run independent retrieval signals concurrently, each with its own deadline.
+
+    Returns (results, latency_ms, degraded):
+    - results:    name -> value for signals that finished in time
+    - latency_ms: name -> execution time (or time waited, for missed deadlines)
+    - degraded:   name -> "timeout" | "overloaded" | error repr, for signals left out
+
+    A signal that misses its deadline is cancelled if it is still queued;
+    one already running finishes in the pool but its result is dropped.
+    Each signal holds at most MAX_IN_FLIGHT jobs, so abandoned work cannot
+    pile up and starve new requests. If every signal raised, the first
+    error is re-raised.
+    """
+    started = time.perf_counter()
+    futures, degraded, latency_ms = {}, {}, {}
+
+    for name, fn in tasks.items():
+        future = submit_bounded(name, _timed, fn, started + timeouts_ms[name] / 1000)
+        if future is None:
+            degraded[name] = "overloaded"
+            latency_ms[name] = 0.0
+            continue
+        futures[name] = future
+
+    results = {}
+    errors = []
+
+    for name, future in futures.items():
+        remaining = timeouts_ms[name] / 1000 - (time.perf_counter() - started)
+        try:
+            results[name], latency_ms[name] = future.result(timeout=max(remaining, 0.0))
+        except FuturesTimeout:
+            future.cancel()
+            latency_ms[name] = (time.perf_counter() - started) * 1000
+            degraded[name] = "timeout"
+        except Exception as e:
+            latency_ms[name] = (time.perf_counter() - started) * 1000
+            degraded[name] = repr(e)
+            errors.append(e)
+
+    if errors and len(errors) == len(tasks):
+        raise errors[0]
+
+    return results, latency_ms, degraded
@@ -0,0 +1,137 @@
+# filters.py
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, List, Optional, Set
+
+from psycopg2.extras import RealDictCursor
+
+# chunk_ids held by ResolvedFilterCache across all cached filters
+MAX_CACHED_CHUNK_IDS = 2_000_000
+
+
+class MetadataFilter:
+    """
+    Retrieval scope over documents / chunks columns.
+    Every field is optional; set fields are AND-ed, values within a field OR-ed.
+
+    - document_ids: documents.document_id
+    - source_types: documents.source_type ("pdf", "docx", ...)
+    - source_paths: documents.source_path
+    - page_range:   (first, last) inclusive on chunks.page_number
+    """
+
+    def __init__(self, document_ids: Optional[List[str]] = None, source_types: Optional[List[str]] = None,
+                 source_paths: Optional[List[str]] = None, page_range: Optional[tuple] = None):
+        self.document_ids = list(document_ids) if document_ids else None
+        self.source_types = [t.lower() for t in source_types] if source_types else None
+        self.source_paths = list(source_paths) if source_paths else None
+        self.page_range = tuple(page_range) if page_range else None
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["MetadataFilter"]:
+        """QueryState carries filters as a plain dict; None / {} → no filter."""
+        if not data:
+            return None
+        return cls(
+            document_ids=data.get("document_ids"),
+            source_types=data.get("source_types"),
+            source_paths=data.get("source_paths"),
+            page_range=data.get("page_range")
+        )
+
+    def key(self) -> tuple:
+        """Hashable identity: filters with the same scope share a key."""
+        return (
+            tuple(sorted(str(d) for d in self.document_ids)) if self.document_ids else None,
+            tuple(sorted(self.source_types)) if self.source_types else None,
+            tuple(sorted(self.source_paths)) if self.source_paths else None,
+            self.page_range
+        )
+
+    def is_empty(self) -> bool:
+        return not (self.document_ids or self.source_types or self.source_paths or self.page_range)
+
+    def to_sql(self):
+        """WHERE clause (without the keyword) + params, same scope as get_all_chunks."""
+        clauses = ["d.is_active", "c.canonical_chunk_id IS NULL"]
+        params = []
+
+        if self.document_ids:
+            clauses.append("d.document_id = ANY(%s::uuid[])")
+            params.append([str(d) for d in self.document_ids])
+        if self.source_types:
+            clauses.append("lower(d.source_type) = ANY(%s)")
+            params.append(self.source_types)
+        if self.source_paths:
+            clauses.append("d.source_path = ANY(%s)")
+            params.append(self.source_paths)
+        if self.page_range:
+            clauses.append("c.page_number BETWEEN %s AND %s")
+            params.extend(self.page_range)
+
+        return " AND ".join(clauses), params
+
+    def resolve(self, conn) -> Set[str]:
+        """chunk_ids that pass the filter (indexed chunks only)."""
+        where, params = self.to_sql()
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"SELECT c.chunk_id FROM chunks c JOIN documents d ON d.document_id = c.document_id WHERE {where}", params)
+            return {str(r["chunk_id"]) for r in cur.fetchall()}
+
+    def __repr__(self):
+        fields = {k: v for k, v in vars(self).items() if v}
+        return f"MetadataFilter({fields})"
+
+
+class ResolvedFilterCache:
+    """
+    MetadataFilter.resolve results per (filter, index generation).
+
+    The chunks a filter matches only change through ingestion, which
+    publishes a new generation, so a repeated scope skips the Postgres
+    scan of every matching chunk_id. Entries for other generations are
+    dropped once a newer one is stored; beyond max_chunk_ids held in
+    total, the least recently used filters go.
+    """
+
+    def __init__(self, max_chunk_ids: int = MAX_CACHED_CHUNK_IDS):
+        self.max_chunk_ids = max_chunk_ids
+        self._entries = OrderedDict()    # (filter key, generation) -> frozenset of chunk_ids
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_resolve(self, filters: MetadataFilter, generation, resolve: Callable[[], Set[str]]) -> FrozenSet[str]:
+        key = (filters.key(), generation)
+        with self._lock:
+            allowed = self._entries.get(key)
+            if allowed is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return allowed
+            self.misses += 1
+
+        allowed = frozenset(resolve())
+        with self._lock:
+            if key in self._entries or len(allowed) > self.max_chunk_ids:
+                return allowed
+            for old in [k for k in self._entries if k[1] != generation]:
+                self._size -= len(self._entries.pop(old))
+            self._entries[key] = allowed
+            self._size += len(allowed)
+            while self._size > self.max_chunk_ids:
+                _, dropped = self._entries.popitem(last=False)
+                self._size -= len(dropped)
+        return allowed
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "chunk_ids": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,141 @@
+# fusion_engine.py
+from itertools import chain
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RRF_K = 60
+
+# strategy: "weighted" (normalized scores x weights) | "rrf" (weights / (RRF_K + rank))
+# normalization (weighted only): "none" | "minmax" | "zscore"
+# "image" (CLIP text → image.index) only takes part when images are searched;
+# kept low because min-max always lifts its best hit to 1.0
+DEFAULT_FUSION = {
+    "strategy": "weighted",
+    "normalization": "minmax",
+    "weights": {"dense": 0.6, "sparse": 0.4, "image": 0.2}
+}
+
+FUSION_BY_INTENT = {
+    # exact terms (names, ids, numbers) matter → give BM25 an equal vote
+    "factual": {
+        "strategy": "weighted",
+        "normalization": "minmax",
+        "weights": {"dense": 0.5, "sparse": 0.5, "image": 0.2}
+    },
+    # paraphrase-heavy, HyDE variants → lean on dense
+    "analytical": {
+        "strategy": "weighted",
+        "normalization": "zscore",
+        "weights": {"dense": 0.7, "sparse": 0.3, "image": 0.2}
+    },
+    # many sub-question variants, score scales vary wildly → ranks only
+    "multi_hop": {
+        "strategy": "rrf",
+        "weights": {"dense": 1.0, "sparse": 1.0, "image": 0.5}
+    },
+    "unknown": {
+        "strategy": "rrf",
+        "weights": {"dense": 1.0, "sparse": 1.0, "image": 0.5}
+    }
+}
+
+
+def fusion_config(intent: Optional[str] = None, overrides: Optional[Dict[str, dict]] = None) -> dict:
+    table = {**FUSION_BY_INTENT, **(overrides or {})}
+    return table.get(intent, DEFAULT_FUSION)
+
+
+def normalize(scores: np.ndarray, method: str) -> np.ndarray:
+    """
+    Map one signal's scores onto a comparable scale.
+    minmax → [0, 1]; zscore is shifted so the weakest candidate sits at 0,
+    otherwise a chunk missing from the signal (contributes 0) would
+    outrank one that was retrieved with a below-average score.
+    """
+    if scores.size == 0 or method == "none":
+        return scores
+
+    if method == "minmax":
+        lo, hi = scores.min(), scores.max()
+        if hi == lo:
+            return np.ones_like(scores)
+        return (scores - lo) / (hi - lo)
+
+    if method == "zscore":
+        std = scores.std()
+        if std == 0:
+            return np.ones_like(scores)
+        z = (scores - scores.mean()) / std
+        return z - z.min()
+
+    raise ValueError(f"Unknown normalization: {method}")
+
+
+def fuse(signals: Dict[str, Tuple[Sequence[str], np.ndarray]], config: dict = DEFAULT_FUSION,
+         top_k: int = 10) -> List[Dict]:
+    """
+    Fuse per-signal candidates held as (chunk_ids, scores) arrays.
+    chunk_ids must be unique within a signal (merge_variants guarantees it).
+
+    Every output row carries each signal's raw score as "<name>_score"
+    (0.0 when that signal did not retrieve the chunk) plus the fused "score".
+    """
+    strategy = config.get("strategy", "weighted")
+    weights = config.get("weights", {})
+    present = [(name, ids, np.asarray(raw, dtype=np.float64)) for name, (ids, raw) in signals.items() if len(ids)]
+
+    if not present:
+        return []
+
+    # chunk_id -> column; dict construction stays in C
+    column = dict.fromkeys(chain.from_iterable(ids for _, ids, _ in present))
+    column = dict(zip(column, range(len(column))))
+    chunk_ids = list(column)
+
+    n = len(column)
+    fused = np.zeros(n)
+    raw_matrix = {name: np.zeros(n) for name in signals}
+
+    for name, ids, raw in present:
+        cols = np.fromiter(map(column.__getitem__, ids), dtype=np.int64, count=len(ids))
+        raw_matrix[name][cols] = raw
+        weight = weights.get(name, 1.0)
+
+        if strategy == "rrf":
+            # rank 1 = best raw score within this signal
+            ranks = np.empty(len(raw), dtype=np.int64)
+            ranks[np.argsort(-raw, kind="stable")] = np.arange(1, len(raw) + 1)
+            fused[cols] += weight / (RRF_K + ranks)
+        elif strategy == "weighted":
+            fused[cols] += weight * normalize(raw, config.get("normalization", "none"))
+        else:
+            raise ValueError(f"Unknown fusion strategy: {strategy}")
+
+    k = min(top_k, n)
+    top = np.argpartition(-fused, k - 1)[:k]
+    top = top[np.argsort(-fused[top], kind="stable")]
+
+    return [
+        {
+            "chunk_id": chunk_ids[i],
+            **{f"{name}_score": float(raw_matrix[name][i]) for name in signals},
+            "score": float(fused[i])
+        }
+        for i in top
+    ]
+
+
+def fuse_results(signals: Dict[str, List[Dict]], config: dict = DEFAULT_FUSION, top_k: int = 10) -> List[Dict]:
+    """fuse() for retrieval_signal style result dicts carrying "<name>_score"."""
+    return fuse(
+        signals={
+            name: (
+                [r["chunk_id"] for r in results],
+                np.fromiter((r[f"{name}_score"] for r in results), dtype=np.float64, count=len(results))
+            )
+            for name, results in signals.items()
+        },
+        config=config,
+        top_k=top_k
+    )
@@ -1,27 +1,30 @@
 # hybrid_fusion.py
 from typing import List, Dict
+from retrieval.fusion_engine import fuse_results
 
-def hybrid_fusion(dense_results: List[Dict], sparse_results: List[Dict], top_k: int = 10) -> List[Dict]:
-    combined = {}
+# raw score sum, kept for callers that relied on the original 0.6 / 0.4 blend
+RAW_WEIGHTED = {
+    "strategy": "weighted",
+    "normalization": "none",
+    "weights": {"dense": 0.6, "sparse": 0.4}
+}
 
-    for r in dense_results + sparse_results:
-        cid = r["chunk_id"]
-        combined.setdefault(cid, {
-            "chunk_id": cid,
-            "dense_score": 0.0,
-            "sparse_score": 0.0
-        })
-        combined[cid]["dense_score"] += r.get("dense_score", 0.0)
-        combined[cid]["sparse_score"] += r.get("sparse_score", 0.0)
+def hybrid_fusion(dense_results: List[Dict], sparse_results: List[Dict], top_k: int = 10, config: Dict = None) -> List[Dict]:
+    return fuse_results(
+        signals={"dense": dense_results, "sparse": sparse_results},
+        config=config or RAW_WEIGHTED,
+        top_k=top_k
+    )
 
-    fused = []
-    for v in combined.values():
-        fused.append({
-            "chunk_id": v["chunk_id"],
-            "dense_score": v["dense_score"],
-            "sparse_score": v["sparse_score"],
-            "score": 0.6 * v["dense_score"] + 0.4 * v["sparse_score"]
-        })
-    fused.sort(key=lambda x: x["score"], reverse=True)
-    return fused[:top_k]
-    
\ No newline at end of file
+def evidence_score(result: Dict) -> float:
+    """
+    Absolute relevance of one fused row, on the raw 0.6 / 0.4 scale that
+    retrieval_validation thresholds were tuned on. Fused "score" is only
+    meaningful within one query (min-max / z-score / RRF are relative).
+    Image hits have neither text score and count with their CLIP cosine.
+    """
+    return (
+        0.6 * result.get("dense_score", 0.0)
+        + 0.4 * result.get("sparse_score", 0.0)
+        + result.get("image_score", 0.0)
+    )
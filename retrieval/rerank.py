@@ -0,0 +1,178 @@
+# rerank.py
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from retrieval.cache import normalize_query
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_BATCH_SIZE = 8
+RERANK_BUDGET_MS = 150
+RERANK_TOP_N = 5              # chunks kept for validation / answer after a rerank
+MAX_PAIR_TOKENS = 256
+SCORE_CACHE_SIZE = 50_000     # (query, chunk_id) scores; chunk ids are immutable
+
+
+# --------------------------------------------------
+# Model (loaded on first use, like utils.llm)
+# --------------------------------------------------
+_model = None
+_model_lock = threading.Lock()
+
+def _load_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            import torch
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+            tokenizer = AutoTokenizer.from_pretrained(RERANK_MODEL)
+            model = AutoModelForSequenceClassification.from_pretrained(RERANK_MODEL)
+            model.eval()
+            _model = (torch, tokenizer, model)
+    return _model
+
+
+def cross_encoder_scores(query: str, texts: List[str]) -> List[float]:
+    """One CPU forward pass over (query, text) pairs; higher = more relevant."""
+    torch, tokenizer, model = _load_model()
+    inputs = tokenizer(
+        [query] * len(texts),
+        texts,
+        return_tensors="pt",
+        padding=True,
+        truncation="only_second",
+        max_length=MAX_PAIR_TOKENS
+    )
+    with torch.inference_mode():
+        logits = model(**inputs).logits
+    return logits[:, 0].cpu().tolist()
+
+
+# --------------------------------------------------
+# Reranker
+# --------------------------------------------------
+class CrossEncoderReranker:
+    """
+    Cascaded rerank of fused candidates under a latency budget.
+
+    Candidates are scored in fused order, batch by batch. Before each
+    batch the expected cost (running ms-per-pair estimate) is checked
+    against what is left of budget_ms; once it does not fit, scoring
+    stops. Only the positions that were scored are reordered, everything
+    else (unscored tail, image chunks) keeps its fused position, so an
+    exhausted budget degrades to the plain fused order.
+    """
+
+    def __init__(self, budget_ms: float = RERANK_BUDGET_MS, batch_size: int = RERANK_BATCH_SIZE,
+                 cache_size: int = SCORE_CACHE_SIZE,
+                 score_pairs: Callable[[str, List[str]], List[float]] = cross_encoder_scores):
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.score_pairs = score_pairs
+
+        self._cache = OrderedDict()      # (normalized query, chunk_id) -> score
+        self._lock = threading.Lock()
+        self._ms_per_pair = None         # running estimate, seeded by warm_up()
+
+    def warm_up(self):
+        # loads weights and seeds the cost estimate before the first real query
+        started = time.perf_counter()
+        self.score_pairs("warm up", ["warm up"] * self.batch_size)
+        self._ms_per_pair = (time.perf_counter() - started) * 1000 / self.batch_size
+        return self
+
+    # -------------------------
+    # Score cache
+    # -------------------------
+    def _cached(self, key) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, keys, scores):
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _observe(self, pairs: int, elapsed_ms: float):
+        per_pair = elapsed_ms / pairs
+        self._ms_per_pair = per_pair if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * per_pair
+
+    # -------------------------
+    # Rerank
+    # -------------------------
+    def rerank(self, query: str, candidates: List[Dict], budget_ms: float = None) -> Tuple[List[int], dict]:
+        """
+        candidates: fused order, each {"chunk_id", "text"} (text None → not scorable).
+        Returns (new order as indices into candidates, report).
+        """
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        started = time.perf_counter()
+        qkey = normalize_query(query)
+
+        scores = {}
+        pending = []
+        for i, c in enumerate(candidates):
+            if not c.get("text"):
+                continue
+            cached = self._cached((qkey, c["chunk_id"]))
+            if cached is None:
+                pending.append(i)
+            else:
+                scores[i] = cached
+        cached_hits = len(scores)
+
+        exhausted = False
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            elapsed = (time.perf_counter() - started) * 1000
+            expected = (self._ms_per_pair or 0.0) * len(batch)
+            if elapsed + expected > budget_ms:
+                exhausted = True
+                break
+
+            batch_started = time.perf_counter()
+            batch_scores = self.score_pairs(query, [candidates[i]["text"] for i in batch])
+            self._observe(len(batch), (time.perf_counter() - batch_started) * 1000)
+
+            self._store([(qkey, candidates[i]["chunk_id"]) for i in batch], batch_scores)
+            scores.update(zip(batch, batch_scores))
+
+        # scored candidates trade places among the slots they occupy
+        order = list(range(len(candidates)))
+        slots = sorted(scores)
+        for slot, i in zip(slots, sorted(slots, key=lambda i: scores[i], reverse=True)):
+            order[slot] = i
+
+        report = {
+            "candidates": len(candidates),
+            "scored": len(scores) - cached_hits,
+            "cached": cached_hits,
+            "unscored": len(candidates) - len(scores),
+            "budget_exhausted": exhausted,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            "scores": {candidates[i]["chunk_id"]: float(s) for i, s in scores.items()}
+        }
+        return order, report
+
+
+_reranker = None
+
+def get_reranker() -> CrossEncoderReranker:
+    """
+    Process-wide reranker, warmed up before it is handed out: without a
+    cost estimate the first query would score a batch unchecked, model
+    load included.
+    """
+    global _reranker
+    if _reranker is None:
+        _reranker = CrossEncoderReranker().warm_up()
+    return _reranker
@@ -1,17 +1,150 @@
-from retrieval.retrieval_signal import dense_retrieve_text, sparse_retrieve
-from retrieval.hybrid_fusion import hybrid_fusion
+import time
+from typing import Dict, List, Set
+from retrieval.retrieval_signal import dense_retrieve_text_batch, sparse_retrieve_batch, dense_retrieve_image_batch
+from retrieval.fusion_engine import fuse_results, DEFAULT_FUSION
+from concurrent.futures import TimeoutError as FuturesTimeout
+from retrieval.concurrency import run_signals
+
+DENSE_TIMEOUT_MS = 250
+SPARSE_TIMEOUT_MS = 250
+# includes waiting for the CLIP text encoding, started before BGE embedding
+IMAGE_TIMEOUT_MS = 250
+
+# per-signal candidates handed to fusion; normalized fusion needs a real
+# pool to rank against, while FAISS flat / BM25 cost barely depends on it
+CANDIDATE_POOL = 100
+
+def merge_variants(result_lists: List[List[Dict]], score_key: str) -> List[Dict]:
+    """De-duplicate per-variant results by chunk_id, keeping each chunk's best score."""
+    best = {}
+    for results in result_lists:
+        for r in results:
+            current = best.get(r["chunk_id"])
+            if current is None or r[score_key] > current[score_key]:
+                best[r["chunk_id"]] = r
+    return list(best.values())
+
+def _resolve(embeddings, deadline: float):
+    # image query embeddings may still be encoding on the "clip" pool
+    if hasattr(embeddings, "result"):
+        try:
+            return embeddings.result(timeout=max(deadline - time.perf_counter(), 0.0))
+        except FuturesTimeout:
+            # still queued → never encode it
+            embeddings.cancel()
+            raise
+    return embeddings
+
+def multi_query_pipeline(queries: List[str], query_embeddings, vector_index, bm25_index, top_k: int = 10,
+                         dense_timeout_ms: float = DENSE_TIMEOUT_MS, sparse_timeout_ms: float = SPARSE_TIMEOUT_MS,
+                         fusion: Dict = None, candidate_k: int = CANDIDATE_POOL, allowed: Set[str] = None,
+                         image_query_embeddings=None, image_timeout_ms: float = IMAGE_TIMEOUT_MS):
+    """
+    Hybrid retrieval for several phrasings of one question.
+    All variants go through a single FAISS call and a single BM25 pass,
+    so extra variants cost little more than the first one.
+
+    allowed: chunk_ids in scope (MetadataFilter.resolve); every signal
+    searches only those chunks instead of over-fetching and post-filtering.
+
+    image_query_embeddings: CLIP text-tower vectors (array or Future) for
+    the same variants. image.index is then searched as a third signal,
+    concurrently with dense / sparse; results carry a "modality" tag.
+    """
+    candidate_k = max(candidate_k, top_k)
+    started = time.perf_counter()
+
+    tasks = {
+        "dense": lambda: dense_retrieve_text_batch(query_embeddings=query_embeddings, vector_index=vector_index, top_k=candidate_k, allowed=allowed),
+        "sparse": lambda: sparse_retrieve_batch(queries=queries, bm25_index=bm25_index, top_k=candidate_k, allowed=allowed)
+    }
+    timeouts_ms = {"dense": dense_timeout_ms, "sparse": sparse_timeout_ms}
+
+    if image_query_embeddings is not None:
+        image_deadline = started + image_timeout_ms / 1000
+        tasks["image"] = lambda: dense_retrieve_image_batch(
+            query_embeddings=_resolve(image_query_embeddings, image_deadline),
+            vector_store=vector_index,
+            top_k=candidate_k,
+            allowed=allowed
+        )
+        timeouts_ms["image"] = image_timeout_ms
+
+    # signals are independent → run together, each with its own deadline
+    results, latency_ms, degraded = run_signals(tasks=tasks, timeouts_ms=timeouts_ms)
+
+    # a missed deadline degrades fusion to the remaining signals
+    signals = {
+        "dense": merge_variants(results.get("dense", []), "dense_score"),
+        "sparse": merge_variants(results.get("sparse", []), "sparse_score")
+    }
+    if "image" in tasks:
+        signals["image"] = merge_variants(results.get("image", []), "image_score")
+
+    hybrid = fuse_results(signals=signals, config=fusion or DEFAULT_FUSION, top_k=top_k)
+
+    image_ids = {r["chunk_id"] for r in signals.get("image", [])}
+    for r in hybrid:
+        r["modality"] = "image" if r["chunk_id"] in image_ids else "text"
 
-def retrieval_pipeline(query: str, query_embedding, vector_index, bm25_index, top_k: int = 10):
-    dense = dense_retrieve_text(query_embedding=query_embedding, vector_index=vector_index, top_k=top_k)
-    sparse = sparse_retrieve(query=query, bm25_index=bm25_index, top_k=top_k)
+    return {
+        "query": queries[0],
+        "query_variants": queries,
+        "retrieval_results": hybrid,
+        "signal_latency_ms": latency_ms,
+        "degraded_signals": degraded
+    }
 
-    hybrid = hybrid_fusion(dense_results=dense, sparse_results=sparse, top_k=top_k)
+def per_query_pipeline(queries: List[str], query_embeddings, vector_index, bm25_index, top_k: int = 10,
+                       dense_timeout_ms: float = DENSE_TIMEOUT_MS, sparse_timeout_ms: float = SPARSE_TIMEOUT_MS,
+                       fusion: Dict = None, candidate_k: int = CANDIDATE_POOL, allowed: Set[str] = None):
+    """
+    Hybrid retrieval for several independent questions (multi_hop
+    sub-questions). Same single FAISS call and BM25 pass as
+    multi_query_pipeline, but each query is fused on its own and gets
+    its own top_k. Text signals only.
+    """
+    candidate_k = max(candidate_k, top_k)
+
+    tasks = {
+        "dense": lambda: dense_retrieve_text_batch(query_embeddings=query_embeddings, vector_index=vector_index, top_k=candidate_k, allowed=allowed),
+        "sparse": lambda: sparse_retrieve_batch(queries=queries, bm25_index=bm25_index, top_k=candidate_k, allowed=allowed)
+    }
+    results, latency_ms, degraded = run_signals(
+        tasks=tasks,
+        timeouts_ms={"dense": dense_timeout_ms, "sparse": sparse_timeout_ms}
+    )
+
+    dense = results.get("dense") or [[] for _ in queries]
+    sparse = results.get("sparse") or [[] for _ in queries]
+    per_query = []
+    for i in range(len(queries)):
+        hybrid = fuse_results(signals={"dense": dense[i], "sparse": sparse[i]}, config=fusion or DEFAULT_FUSION, top_k=top_k)
+        for r in hybrid:
+            r["modality"] = "text"
+        per_query.append(hybrid)
 
     return {
-        "query": query,
-        "retrieval_results": hybrid
+        "queries": queries,
+        "retrieval_results": per_query,
+        "signal_latency_ms": latency_ms,
+        "degraded_signals": degraded
     }
 
+def retrieval_pipeline(query: str, query_embedding, vector_index, bm25_index, top_k: int = 10,
+                       dense_timeout_ms: float = DENSE_TIMEOUT_MS, sparse_timeout_ms: float = SPARSE_TIMEOUT_MS,
+                       fusion: Dict = None):
+    return multi_query_pipeline(
+        queries=[query],
+        query_embeddings=None if query_embedding is None else [query_embedding],
+        vector_index=vector_index,
+        bm25_index=bm25_index,
+        top_k=top_k,
+        dense_timeout_ms=dense_timeout_ms,
+        sparse_timeout_ms=sparse_timeout_ms,
+        fusion=fusion
+    )
+
 if __name__ == "__main__":
     from storage.vector_store import VectorStore
     from storage.bm25_store import BM25Store
@@ -5,7 +5,9 @@ import numpy as np
 def dense_retrieve_text(query_embedding, vector_index, top_k: int = 10) -> List[Dict]:
     if query_embedding is None:
         return []
-    
+
+    # state carries embeddings as plain lists
+    query_embedding = np.asarray(query_embedding, dtype="float32")
     results = vector_index.search_text(query_embedding, top_k)
     return [
         {
@@ -16,6 +18,25 @@ def dense_retrieve_text(query_embedding, vector_index, top_k: int = 10) -> List[
         for r in results
     ]
 
+def dense_retrieve_text_batch(query_embeddings, vector_index, top_k: int = 10, allowed=None) -> List[List[Dict]]:
+    if query_embeddings is None or len(query_embeddings) == 0:
+        return []
+
+    query_embeddings = np.asarray(query_embeddings, dtype="float32")
+    # allowed chunk_ids → ordinal bitmap for FAISS' IDSelector
+    bitmap = None if allowed is None else vector_index.text_bitmap(allowed)
+    return [
+        [
+            {
+                "chunk_id": r["chunk_id"],
+                "dense_score": float(r["score"]),
+                "sparse_score": 0.0
+            }
+            for r in results
+        ]
+        for results in vector_index.search_text_batch(query_embeddings, top_k, allowed=bitmap)
+    ]
+
 def sparse_retrieve(query: str, bm25_index, top_k: int = 0) -> List[Dict]:
     results = bm25_index.search(query, top_k)
     return [
@@ -27,6 +48,19 @@ def sparse_retrieve(query: str, bm25_index, top_k: int = 0) -> List[Dict]:
         for r in results
     ]
 
+def sparse_retrieve_batch(queries: List[str], bm25_index, top_k: int = 10, allowed=None) -> List[List[Dict]]:
+    return [
+        [
+            {
+                "chunk_id": r["chunk_id"],
+                "dense_score": 0.0,
+                "sparse_score": float(r["score"])
+            }
+            for r in results
+        ]
+        for results in bm25_index.search_batch(queries, top_k, allowed=allowed)
+    ]
+
 def dense_retrieve_image(
     query_embedding,
     vector_store,
@@ -39,6 +73,7 @@ def dense_retrieve_image(
     if query_embedding is None:
         return []
 
+    query_embedding = np.asarray(query_embedding, dtype="float32")
     results = vector_store.search_image(
         query_embedding=query_embedding,
         top_k=top_k
@@ -53,3 +88,26 @@ def dense_retrieve_image(
         }
         for r in results
     ]
+
+def dense_retrieve_image_batch(query_embeddings, vector_store, top_k: int = 10, allowed=None) -> List[List[Dict]]:
+    """
+    CLIP text-tower query embeddings (embed_texts_for_image_search)
+    against image.index. Scored as its own "image" signal in fusion:
+    CLIP text-image cosines sit on a much lower scale than BGE's.
+    """
+    if query_embeddings is None or len(query_embeddings) == 0:
+        return []
+
+    query_embeddings = np.asarray(query_embeddings, dtype="float32")
+    bitmap = None if allowed is None else vector_store.image_bitmap(allowed)
+    return [
+        [
+            {
+                "chunk_id": r["chunk_id"],
+                "image_score": float(r["score"]),
+                "modality": "image"
+            }
+            for r in results
+        ]
+        for results in vector_store.search_image_batch(query_embeddings, top_k, allowed=bitmap)
+    ]
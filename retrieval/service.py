@@ -0,0 +1,334 @@
+# service.py
+import threading
+import time
+
+import numpy as np
+import psycopg2
+
+from storage.vector_store import VectorStore
+from storage.bm25_store import BM25Store
+from storage.generations import generation_path, IndexGeneration, GenerationHolder, GenerationWatcher
+from retrieval.retrieval_pipeline import multi_query_pipeline, per_query_pipeline, DENSE_TIMEOUT_MS, SPARSE_TIMEOUT_MS, IMAGE_TIMEOUT_MS
+from retrieval.fusion_engine import fusion_config
+from retrieval.filters import MetadataFilter, ResolvedFilterCache
+from retrieval.sharding import ShardedIndex
+from config import DB_CONFIG, VECTOR_STORE_PATH, SHARD_ENDPOINTS
+
+TOP_K = 10
+RELOAD_POLL_SECONDS = 5.0
+
+
+class RetrievalService:
+    """
+    Owns the retrieval indexes for the lifetime of the serving process.
+    FAISS indexes, id maps and BM25 are read from disk once; every
+    request after that only pays search cost.
+
+    Indexes are served as generations (storage.generations): reload()
+    loads and warms a newly published generation next to the live one,
+    then swaps the reference. Queries in flight finish on the generation
+    they started with; it is released when the last of them is done.
+    Shard processes swap on their own: a sharded query reports the
+    generation each shard answered from instead.
+
+    state: cold -> loading -> warming -> ready   (or failed)
+    """
+
+    def __init__(self, base_path: str = VECTOR_STORE_PATH, warm_embeddings: bool = True,
+                 fusion_by_intent: dict = None, shard_endpoints: list = None):
+        self.base_path = base_path
+        # shard processes to scatter to; empty → the local store at base_path
+        self.shard_endpoints = SHARD_ENDPOINTS if shard_endpoints is None else shard_endpoints
+        self.warm_embeddings = warm_embeddings
+        # per-intent overrides on top of fusion_engine.FUSION_BY_INTENT
+        self.fusion_by_intent = fusion_by_intent
+
+        self.generations = GenerationHolder()
+        self._sharded = None
+        self._watcher = None
+        # read-only connection, opened on the first filtered search
+        self._conn = None
+        self.filter_cache = ResolvedFilterCache()
+
+        self.state = "cold"
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+
+    # -------------------------
+    # Lifecycle
+    # -------------------------
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def vector_store(self):
+        current = self.generations.current
+        return current.vector_store if current else None
+
+    @property
+    def bm25_store(self):
+        current = self.generations.current
+        return current.bm25_store if current else None
+
+    @property
+    def index_generation(self):
+        current = self.generations.current
+        return current.generation if current else None
+
+    def start(self):
+        """Load + warm up. Idempotent; concurrent callers wait for the first one."""
+        with self._lock:
+            if self.ready:
+                return self
+
+            try:
+                self.state = "loading"
+                self.generations.swap(self._load_generation())
+                self.error = None
+                self.state = "ready"
+            except Exception as e:
+                self.state = "failed"
+                self.error = repr(e)
+                raise
+        return self
+
+    def start_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.start, name="retrieval-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _load_generation(self) -> IndexGeneration:
+        started = time.perf_counter()
+        if self.shard_endpoints:
+            # shards reload themselves; the coordinator only re-reads their generations
+            if self._sharded is None:
+                self._sharded = ShardedIndex(self.shard_endpoints)
+            self._sharded.refresh()
+            gen = IndexGeneration(self._sharded.generation, None, self._sharded, self._sharded)
+        else:
+            generation, path = generation_path(self.base_path)
+            gen = IndexGeneration(
+                generation, path,
+                VectorStore(base_path=path),
+                BM25Store(base_path=path)
+            )
+        self.load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        self._warm_up(gen)
+        self.warmup_seconds = time.perf_counter() - started
+        return gen
+
+    def _current_on_disk(self):
+        if self.shard_endpoints:
+            return tuple(c.call("status")["generation"] for c in self._sharded.clients)
+        return generation_path(self.base_path)[0]
+
+    def reload(self) -> bool:
+        """
+        Swap in the newest published generation, if it is not the one
+        being served. Loading and warm-up happen off the request path;
+        a failed load leaves the current generation serving.
+        """
+        if not self.ready:
+            self.start()
+            return True
+
+        with self._reload_lock:
+            if self._current_on_disk() == self.index_generation:
+                return False
+
+            new = self._load_generation()
+            old = self.generations.swap(new)
+            self.reloads += 1
+            print(f"[GENERATION] Serving gen {new.generation} (was {old.generation if old else None})")
+            return True
+
+    def reload_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.reload, name="retrieval-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def watch(self, interval_s: float = RELOAD_POLL_SECONDS) -> GenerationWatcher:
+        """Poll for newly published generations and reload them automatically."""
+        if self._watcher is None:
+            self._watcher = GenerationWatcher(self.reload, interval_s, name="retrieval-reload").start()
+        return self._watcher
+
+    def _warm_up(self, gen: IndexGeneration):
+        # first searches fault in index pages and FAISS / BLAS thread pools
+        probe = np.zeros(gen.vector_store.text_index.d, dtype="float32")
+        probe[0] = 1.0
+        gen.vector_store.search_text(probe, 1)
+
+        if gen.vector_store.image_index.ntotal:
+            probe = np.zeros(gen.vector_store.image_index.d, dtype="float32")
+            probe[0] = 1.0
+            gen.vector_store.search_image(probe, 1)
+
+        gen.bm25_store.search("warm up", 1)
+
+        if self.warm_embeddings:
+            # importing embed_func loads BGE / CLIP weights
+            from ingestion.embed_func import embed_text
+            embed_text("warm up")
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "error": self.error,
+            "index_generation": self.index_generation,
+            "reloads": self.reloads,
+            "text_vectors": self.vector_store.text_index.ntotal if self.vector_store else 0,
+            "image_vectors": self.vector_store.image_index.ntotal if self.vector_store else 0,
+            "bm25_documents": self.bm25_store.N if self.bm25_store else 0,
+            "image_search": self.has_images,
+            "shards": len(self.shard_endpoints),
+            "filter_cache": self.filter_cache.stats(),
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds
+        }
+
+    @property
+    def has_images(self) -> bool:
+        # no CLIP query encoding when there is nothing to search it against
+        return bool(self.vector_store and self.vector_store.image_index.ntotal)
+
+    # -------------------------
+    # Search
+    # -------------------------
+    def search(self, query: str, query_embedding, top_k: int = TOP_K, intent: str = None,
+               filters: MetadataFilter = None, image_query_embedding=None) -> dict:
+        """retrieval_pipeline output: fused results + per-signal latency / degradation."""
+        return self.search_many(
+            queries=[query],
+            query_embeddings=None if query_embedding is None else [query_embedding],
+            top_k=top_k,
+            intent=intent,
+            filters=filters,
+            image_query_embeddings=None if image_query_embedding is None else [image_query_embedding]
+        )
+
+    def search_many(self, queries, query_embeddings, top_k: int = TOP_K, intent: str = None,
+                    filters: MetadataFilter = None, image_query_embeddings=None,
+                    dense_timeout_ms: float = DENSE_TIMEOUT_MS, sparse_timeout_ms: float = SPARSE_TIMEOUT_MS,
+                    image_timeout_ms: float = IMAGE_TIMEOUT_MS) -> dict:
+        """
+        Query variants of one question, searched in one batch and fused.
+        The *_timeout_ms are per-signal deadlines (a request's remaining
+        budget may cut them, see utils.deadline.clamp_timeouts).
+        """
+        if not self.ready:
+            self.start()
+
+        # pinned for the whole query, even if a reload swaps generations meanwhile
+        gen = self.generations.acquire()
+        vector_index, bm25_index = self._query_indexes(gen)
+        try:
+            allowed = self.resolve_filter(filters, gen.generation)
+            output = multi_query_pipeline(
+                queries=queries,
+                query_embeddings=query_embeddings,
+                vector_index=vector_index,
+                bm25_index=bm25_index,
+                top_k=top_k,
+                fusion=fusion_config(intent, self.fusion_by_intent),
+                allowed=allowed,
+                image_query_embeddings=image_query_embeddings if gen.vector_store.image_index.ntotal else None,
+                dense_timeout_ms=dense_timeout_ms,
+                sparse_timeout_ms=sparse_timeout_ms,
+                image_timeout_ms=image_timeout_ms
+            )
+        finally:
+            self.generations.release(gen)
+
+        output["index_generation"] = self._served_generation(gen, vector_index)
+        return output
+
+    def search_each(self, queries, query_embeddings, top_k: int = TOP_K, intent: str = None,
+                    filters: MetadataFilter = None, dense_timeout_ms: float = DENSE_TIMEOUT_MS,
+                    sparse_timeout_ms: float = SPARSE_TIMEOUT_MS) -> dict:
+        """Independent questions searched in one batch; retrieval_results holds one fused list per query."""
+        if not self.ready:
+            self.start()
+
+        gen = self.generations.acquire()
+        vector_index, bm25_index = self._query_indexes(gen)
+        try:
+            allowed = self.resolve_filter(filters, gen.generation)
+            output = per_query_pipeline(
+                queries=queries,
+                query_embeddings=query_embeddings,
+                vector_index=vector_index,
+                bm25_index=bm25_index,
+                top_k=top_k,
+                fusion=fusion_config(intent, self.fusion_by_intent),
+                allowed=allowed,
+                dense_timeout_ms=dense_timeout_ms,
+                sparse_timeout_ms=sparse_timeout_ms
+            )
+        finally:
+            self.generations.release(gen)
+
+        output["index_generation"] = self._served_generation(gen, vector_index)
+        return output
+
+    @staticmethod
+    def _query_indexes(gen: IndexGeneration):
+        """(vector index, BM25 index) one query searches."""
+        if isinstance(gen.vector_store, ShardedIndex):
+            view = gen.vector_store.for_query()
+            return view, view
+        return gen.vector_store, gen.bm25_store
+
+    @staticmethod
+    def _served_generation(gen: IndexGeneration, vector_index):
+        if isinstance(vector_index, ShardedIndex):
+            return vector_index.served_generation()
+        return gen.generation
+
+    def resolve_filter(self, filters: MetadataFilter, generation):
+        """
+        Filter predicates → chunk_ids in scope, via the documents / chunks
+        tables; None when there is nothing to filter. Cached per index
+        generation, so a repeated scope costs no query.
+        """
+        if filters is None or filters.is_empty():
+            return None
+        return self.filter_cache.get_or_resolve(filters, generation, lambda: filters.resolve(self._connection()))
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(**DB_CONFIG)
+            self._conn.set_session(readonly=True, autocommit=True)
+        return self._conn
+
+
+_service = None
+
+def get_retrieval_service() -> RetrievalService:
+    global _service
+    if _service is None:
+        _service = RetrievalService()
+    return _service
+
+
+if __name__ == "__main__":
+    service = get_retrieval_service().start()
+    service.watch()
+    print(service.status())
+
+    from ingestion.embed_func import embed_text, embed_text_for_image_search
+
+    query = "what are the skills?"
+    output = service.search(query, embed_text(query), top_k=5,
+                            image_query_embedding=embed_text_for_image_search(query))
+    print(output["signal_latency_ms"], output["degraded_signals"])
+    for r in output["retrieval_results"]:
+        print(r)
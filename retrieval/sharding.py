@@ -0,0 +1,470 @@
+# sharding.py
+import os
+import sys
+import copy
+import time
+import json
+import heapq
+import queue
+import ipaddress
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from itertools import chain
+from multiprocessing.connection import Listener, Client
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from storage.vector_store import VectorStore
+from storage.bm25_store import BM25Store
+from storage.shards import IndexInfo, shard_path
+from storage.generations import generation_path, IndexGeneration, GenerationHolder, GenerationWatcher
+from retrieval.concurrency import signal_deadline
+from config import SHARD_AUTHKEY
+
+CONNECT_TIMEOUT_S = 30
+# per RPC, when not running inside a retrieval signal with its own deadline
+CALL_TIMEOUT_S = 10.0
+RELOAD_POLL_SECONDS = 5.0
+
+
+def parse_address(endpoint: str):
+    """"host:port" → TCP, anything else → Unix socket path."""
+    host, sep, port = endpoint.rpartition(":")
+    if sep and port.isdigit():
+        return (host, int(port))
+    return endpoint
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def check_endpoint(address, authkey: Optional[bytes]):
+    """
+    Unix sockets and loopback TCP may run without a key; anything
+    reachable from another host must be authenticated (SHARD_AUTHKEY).
+    """
+    if authkey is None and isinstance(address, tuple) and not _is_loopback(address[0]):
+        raise ValueError(f"Shard endpoint {address[0]}:{address[1]} is not loopback; set SHARD_AUTHKEY")
+
+
+# --------------------------------------------------
+# Wire format
+# --------------------------------------------------
+# plain JSON over send_bytes / recv_bytes: nothing a peer sends is unpickled
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Not serializable over shard RPC: {type(value).__name__}")
+
+
+def send_message(conn, message: dict):
+    conn.send_bytes(json.dumps(message, default=_to_json).encode("utf-8"))
+
+
+def recv_message(conn) -> dict:
+    message = json.loads(conn.recv_bytes().decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("Shard RPC message must be a JSON object")
+    return message
+
+
+# --------------------------------------------------
+# Shard process
+# --------------------------------------------------
+class ShardServer:
+    """
+    Serves one shard directory (VectorStore + BM25Store) over
+    multiprocessing.connection, as JSON messages (never pickle), with
+    the HMAC handshake when an authkey is set. Each client connection gets a thread;
+    FAISS releases the GIL, so concurrent searches overlap.
+
+    Like RetrievalService, the shard serves published generations and
+    swaps to a new one in the background (reload_interval_s). Search
+    responses carry the generation that answered them.
+    """
+
+    def __init__(self, path: str, address, authkey: Optional[bytes] = SHARD_AUTHKEY,
+                 reload_interval_s: float = RELOAD_POLL_SECONDS):
+        check_endpoint(address, authkey)
+        self.path = path
+        self.generations = GenerationHolder()
+        self.generations.swap(self._load())
+        self.listener = Listener(address, authkey=authkey)
+        self._reload_lock = threading.Lock()
+        if reload_interval_s:
+            GenerationWatcher(self.reload, reload_interval_s, name="shard-reload").start()
+
+    def _load(self) -> IndexGeneration:
+        generation, path = generation_path(self.path)
+        return IndexGeneration(generation, path, VectorStore(base_path=path), BM25Store(base_path=path))
+
+    def reload(self) -> bool:
+        with self._reload_lock:
+            if generation_path(self.path)[0] == self.generations.current.generation:
+                return False
+            self.generations.swap(self._load())
+            return True
+
+    def _run(self, fn) -> dict:
+        gen = self.generations.acquire()
+        try:
+            return {"generation": gen.generation, "results": fn(gen.vector_store, gen.bm25_store)}
+        finally:
+            self.generations.release(gen)
+
+    # -------------------------
+    # RPC methods
+    # -------------------------
+    def status(self) -> dict:
+        gen = self.generations.current
+        return {
+            "path": self.path,
+            "generation": gen.generation,
+            "text_dim": gen.vector_store.text_index.d,
+            "image_dim": gen.vector_store.image_index.d,
+            "text_vectors": gen.vector_store.text_index.ntotal,
+            "image_vectors": gen.vector_store.image_index.ntotal,
+            "bm25_documents": gen.bm25_store.N
+        }
+
+    def search_text(self, query_embeddings, top_k, allowed=None):
+        query_embeddings = np.asarray(query_embeddings, dtype="float32")
+        allowed = None if allowed is None else set(allowed)
+
+        def run(vs, _):
+            # the filter's bitmap is built here, against this shard's ordinals
+            bitmap = None if allowed is None else vs.text_bitmap(allowed)
+            return vs.search_text_batch(query_embeddings, top_k, allowed=bitmap)
+        return self._run(run)
+
+    def search_image(self, query_embeddings, top_k, allowed=None):
+        query_embeddings = np.asarray(query_embeddings, dtype="float32")
+        allowed = None if allowed is None else set(allowed)
+
+        def run(vs, _):
+            bitmap = None if allowed is None else vs.image_bitmap(allowed)
+            return vs.search_image_batch(query_embeddings, top_k, allowed=bitmap)
+        return self._run(run)
+
+    def term_stats(self, queries):
+        return self._run(lambda _, bm25: bm25.term_stats(queries))
+
+    def search_sparse(self, queries, top_k, allowed=None, stats=None):
+        allowed = None if allowed is None else set(allowed)
+        return self._run(lambda _, bm25: bm25.search_batch(queries, top_k, allowed=allowed, stats=stats))
+
+    _methods = {"status", "search_text", "search_image", "term_stats", "search_sparse"}
+
+    # -------------------------
+    # Serving loop
+    # -------------------------
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = recv_message(conn)
+                except (EOFError, OSError, ValueError):
+                    return
+
+                try:
+                    method = request.get("method")
+                    if method not in self._methods:
+                        raise ValueError(f"Unknown shard method: {method}")
+                    send_message(conn, {"status": "ok", "value": getattr(self, method)(**request.get("kwargs", {}))})
+                except Exception as e:
+                    send_message(conn, {"status": "error", "value": repr(e)})
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except (multiprocessing.AuthenticationError, OSError, EOFError) as e:
+                # a peer without the key (or one that hung up mid-handshake) is dropped
+                print(f"[SHARD] Rejected connection: {e!r}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+def serve_shard(path: str, address, authkey: Optional[bytes] = SHARD_AUTHKEY):
+    ShardServer(path, address, authkey).serve_forever()
+
+
+# --------------------------------------------------
+# Client side
+# --------------------------------------------------
+class ShardError(RuntimeError):
+    pass
+
+
+class ShardClient:
+    """
+    RPC client for one shard. Connections are pooled so dense, sparse
+    and image calls for the same query reach the shard concurrently.
+    A call that gets no reply within its timeout closes its connection
+    (a late reply must not be read by the next call) and raises
+    concurrent.futures.TimeoutError.
+    """
+
+    def __init__(self, address, authkey: Optional[bytes] = SHARD_AUTHKEY):
+        check_endpoint(address, authkey)
+        self.address = address
+        self.authkey = authkey
+        self._pool = queue.LifoQueue()
+
+    def _connect(self):
+        return Client(self.address, authkey=self.authkey)
+
+    def call(self, method: str, timeout: float = CALL_TIMEOUT_S, **kwargs):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+
+        try:
+            send_message(conn, {"method": method, "kwargs": kwargs})
+            if not conn.poll(max(timeout, 0.0)):
+                raise FuturesTimeout(f"{self.address}: no reply to {method} within {timeout:.3f}s")
+            response = recv_message(conn)
+        except Exception:
+            conn.close()
+            raise
+
+        self._pool.put(conn)
+        if response["status"] == "error":
+            raise ShardError(f"{self.address}: {response['value']}")
+        return response["value"]
+
+    def wait_ready(self, timeout_s: float = CONNECT_TIMEOUT_S) -> dict:
+        deadline = time.monotonic() + timeout_s
+        while True:
+            try:
+                return self.call("status")
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+def _merge_top_k(per_shard: List[List[List[Dict]]], top_k: int) -> List[List[Dict]]:
+    """Per-shard result lists (one per query row) → global top_k per query row."""
+    rows = zip(*per_shard)
+    return [
+        heapq.nlargest(top_k, chain.from_iterable(row), key=lambda r: r["score"])
+        for row in rows
+    ]
+
+
+class ShardedIndex:
+    """
+    Scatter-gather over shard processes, with the read API of both
+    VectorStore (search_text_batch / search_image_batch / *_bitmap)
+    and BM25Store (search / search_batch), so retrieval_pipeline and
+    RetrievalService use it in place of the local stores.
+
+    Dense scores are cosine similarities and merge as-is. BM25 first
+    collects term statistics from every shard, so each shard scores
+    with global idf / avgdl and the merged ranking matches one index.
+
+    Shards swap generations on their own, so nothing is pinned from
+    here; for_query() gives a view that records the generation each
+    shard answered from, for the query to report.
+    """
+
+    def __init__(self, endpoints: List[str], authkey: Optional[bytes] = SHARD_AUTHKEY):
+        if not endpoints:
+            raise ValueError("ShardedIndex needs at least one endpoint")
+
+        self.clients = [ShardClient(parse_address(e), authkey) for e in endpoints]
+        # own pool: scatter runs inside retrieval signals, which already
+        # occupy the shared retrieval executor
+        self._executor = ThreadPoolExecutor(
+            max_workers=4 * len(self.clients), thread_name_prefix="shard-scatter"
+        )
+        # generations each shard answered from; only views from for_query() record them
+        self.served = None
+        self.refresh()
+
+    def _scatter(self, method: str, **kwargs) -> list:
+        # inside a retrieval signal every shard gets what is left of its deadline
+        deadline = signal_deadline()
+        if deadline is None:
+            deadline = time.perf_counter() + CALL_TIMEOUT_S
+
+        futures = [
+            self._executor.submit(c.call, method, timeout=deadline - time.perf_counter(), **kwargs)
+            for c in self.clients
+        ]
+        try:
+            responses = [f.result(timeout=max(deadline - time.perf_counter(), 0.0)) for f in futures]
+        except Exception:
+            for f in futures:
+                f.cancel()
+            raise
+        if self.served is not None:
+            for served, response in zip(self.served, responses):
+                served.add(response["generation"])
+        return [response["results"] for response in responses]
+
+    def for_query(self) -> "ShardedIndex":
+        """Same shards, connections and pool, recording the generations that answer one query."""
+        view = copy.copy(self)
+        view.served = [set() for _ in self.clients]
+        return view
+
+    def served_generation(self) -> tuple:
+        """
+        Per shard, the generation that answered this view's searches; the
+        oldest one if the shard reloaded mid-query, the last refreshed one
+        if it was never asked.
+        """
+        return tuple(
+            min(served) if served else refreshed
+            for served, refreshed in zip(self.served, self.generation)
+        )
+
+    def refresh(self):
+        """Shard sizes / dims / generations, as exposed through text_index / image_index / N."""
+        self.shard_status = [c.wait_ready() for c in self.clients]
+        # shards swap generations independently; this is the last observed set
+        self.generation = tuple(s["generation"] for s in self.shard_status)
+        first = self.shard_status[0]
+        self.text_index = IndexInfo(first["text_dim"], sum(s["text_vectors"] for s in self.shard_status))
+        self.image_index = IndexInfo(first["image_dim"], sum(s["image_vectors"] for s in self.shard_status))
+        self.N = sum(s["bm25_documents"] for s in self.shard_status)
+        return self.shard_status
+
+    # -------------------------
+    # Dense
+    # -------------------------
+    def text_bitmap(self, chunk_ids):
+        # bitmaps are per-shard ordinals; shards build their own
+        return set(chunk_ids)
+
+    def search_text_batch(self, query_embeddings, top_k: int = 5, allowed=None):
+        query_embeddings = np.asarray(query_embeddings, dtype="float32")
+        return _merge_top_k(
+            self._scatter("search_text", query_embeddings=query_embeddings, top_k=top_k, allowed=allowed),
+            top_k
+        )
+
+    def search_text(self, query_embedding, top_k: int = 5):
+        return self.search_text_batch(np.asarray(query_embedding).reshape(1, -1), top_k)[0]
+
+    def image_bitmap(self, chunk_ids):
+        return set(chunk_ids)
+
+    def search_image_batch(self, query_embeddings, top_k: int = 3, allowed=None):
+        query_embeddings = np.asarray(query_embeddings, dtype="float32")
+        return _merge_top_k(
+            self._scatter("search_image", query_embeddings=query_embeddings, top_k=top_k, allowed=allowed),
+            top_k
+        )
+
+    def search_image(self, query_embedding, top_k: int = 3):
+        return self.search_image_batch(np.asarray(query_embedding).reshape(1, -1), top_k)[0]
+
+    # -------------------------
+    # Sparse
+    # -------------------------
+    def search_batch(self, queries: List[str], top_k: int = 5, allowed=None):
+        per_shard = self._scatter("term_stats", queries=queries)
+
+        stats = {"N": 0, "total_len": 0, "df": {}}
+        for s in per_shard:
+            stats["N"] += s["N"]
+            stats["total_len"] += s["total_len"]
+            for term, df in s["df"].items():
+                stats["df"][term] = stats["df"].get(term, 0) + df
+
+        if stats["N"] == 0:
+            return [[] for _ in queries]
+
+        return _merge_top_k(
+            self._scatter("search_sparse", queries=queries, top_k=top_k, allowed=allowed, stats=stats),
+            top_k
+        )
+
+    def search(self, query: str, top_k: int = 5, allowed=None):
+        return self.search_batch([query], top_k, allowed)[0]
+
+    def close(self):
+        for c in self.clients:
+            c.close()
+        self._executor.shutdown(wait=False)
+
+
+# --------------------------------------------------
+# Local shard processes
+# --------------------------------------------------
+def start_local_shards(base_path: str, num_shards: int, authkey: Optional[bytes] = SHARD_AUTHKEY):
+    """
+    One process per shard directory (ShardSet layout), listening on a
+    Unix socket. Returns (processes, endpoints) once every shard answers.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    sock_dir = tempfile.mkdtemp(prefix="rag-shards-")
+
+    processes, endpoints = [], []
+    for i in range(num_shards):
+        endpoint = os.path.join(sock_dir, f"shard-{i:02d}.sock")
+        p = ctx.Process(
+            target=serve_shard,
+            args=(shard_path(base_path, i), endpoint, authkey),
+            name=f"shard-{i:02d}",
+            daemon=True
+        )
+        p.start()
+        processes.append(p)
+        endpoints.append(endpoint)
+
+    for endpoint in endpoints:
+        ShardClient(endpoint, authkey).wait_ready()
+
+    return processes, endpoints
+
+
+def stop_local_shards(processes):
+    for p in processes:
+        p.terminate()
+    for p in processes:
+        p.join()
+
+
+if __name__ == "__main__":
+    # python -m retrieval.sharding serve ./vector_store/shard-00 127.0.0.1:7100
+    # python -m retrieval.sharding local ./vector_store 4
+    if len(sys.argv) != 4 or sys.argv[1] not in {"serve", "local"}:
+        print("usage: python -m retrieval.sharding serve SHARD_DIR HOST:PORT | local BASE_PATH NUM_SHARDS")
+        sys.exit(1)
+
+    if sys.argv[1] == "serve":
+        print(f"✅ Serving {sys.argv[2]} on {sys.argv[3]}")
+        serve_shard(sys.argv[2], parse_address(sys.argv[3]))
+    else:
+        processes, endpoints = start_local_shards(sys.argv[2], int(sys.argv[3]))
+        index = ShardedIndex(endpoints)
+        for s in index.shard_status:
+            print(s)
+        print(f"✅ {len(endpoints)} shards ready: {','.join(endpoints)}")
+        try:
+            for p in processes:
+                p.join()
+        except KeyboardInterrupt:
+            stop_local_shards(processes)
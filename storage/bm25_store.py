@@ -1,19 +1,30 @@
 # bm25_store.py
+import os
+import json
 import math
 from collections import Counter, defaultdict
-from typing import Dict, List
+from typing import Dict, List, Set
 
 
 class BM25Store:
-    def __init__(self, k1: float = 1.5, b: float = 0.75):
+    def __init__(self, k1: float = 1.5, b: float = 0.75, base_path: str = None):
         self.k1 = k1
         self.b = b
+        # in-memory only unless base_path is given (same directory as VectorStore)
+        self.path = os.path.join(base_path, "bm25.json") if base_path else None
 
         self.documents = {}          # chunk_id -> token list
         self.doc_len = {}            # chunk_id -> length
         self.df = defaultdict(int)   # term -> document frequency
         self.N = 0
         self.avgdl = 0.0
+        self._total_len = 0
+
+        # load persisted index (token lists only, statistics are rebuilt)
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                for chunk_id, tokens in json.load(f).items():
+                    self._add_tokens(chunk_id, tokens)
 
     # -------------------------
     # Index construction
@@ -24,6 +35,12 @@ class BM25Store:
         if not tokens:
             return
 
+        self._add_tokens(chunk_id, tokens)
+
+    def _add_tokens(self, chunk_id: str, tokens: List[str]):
+        if chunk_id in self.documents:
+            self.remove([chunk_id])
+
         self.documents[chunk_id] = tokens
         self.doc_len[chunk_id] = len(tokens)
 
@@ -31,52 +48,119 @@ class BM25Store:
             self.df[term] += 1
 
         self.N += 1
-        self.avgdl = sum(self.doc_len.values()) / self.N
+        self._total_len += len(tokens)
+        self.avgdl = self._total_len / self.N
+
+    def remove(self, chunk_ids) -> int:
+        removed = 0
+        for chunk_id in chunk_ids:
+            tokens = self.documents.pop(chunk_id, None)
+            if tokens is None:
+                continue
+
+            self._total_len -= self.doc_len.pop(chunk_id)
+            for term in set(tokens):
+                self.df[term] -= 1
+                if self.df[term] == 0:
+                    del self.df[term]
+            removed += 1
+
+        self.N = len(self.documents)
+        self.avgdl = self._total_len / self.N if self.N else 0.0
+        return removed
 
     # -------------------------
-    # Search
+    # Persistence
     # -------------------------
-    def search(self, query: str, top_k: int = 5) -> List[Dict]:
-        if not query or self.N == 0:
-            return []
-
-        query_terms = self._tokenize(query)
-        scores = {}
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, "w") as f:
+            json.dump(self.documents, f)
 
-        for chunk_id, tokens in self.documents.items():
+    # -------------------------
+    # Search
+    # -------------------------
+    def search(self, query: str, top_k: int = 5, allowed: Set[str] = None) -> List[Dict]:
+        return self.search_batch([query], top_k, allowed)[0]
+
+    def term_stats(self, queries: List[str]) -> Dict:
+        """Corpus statistics for the query terms; shards' stats are summed into global ones."""
+        terms = set().union(*(self._tokenize(q) for q in queries if q))
+        return {
+            "N": self.N,
+            "total_len": self._total_len,
+            "df": {term: self.df.get(term, 0) for term in terms}
+        }
+
+    def search_batch(self, queries: List[str], top_k: int = 5, allowed: Set[str] = None,
+                     stats: Dict = None) -> List[List[Dict]]:
+        """
+        Score several queries in a single pass over the documents:
+        each document's term counts are built once and shared by every query.
+
+        allowed: chunk_ids in scope; only those documents are visited,
+        idf / avgdl stay corpus-wide so scores match unfiltered search.
+        stats: term_stats() summed over every shard, so a shard scores
+        with global idf / avgdl and results merge across shards.
+        """
+        if self.N == 0:
+            return [[] for _ in queries]
+
+        query_terms = [self._tokenize(q) if q else [] for q in queries]
+        all_terms = set().union(*query_terms)
+
+        if stats is None:
+            idf = {term: self._idf(term) for term in all_terms}
+            avgdl = self.avgdl
+        else:
+            idf = {term: self._idf(term, stats["df"].get(term, 0), stats["N"]) for term in all_terms}
+            avgdl = stats["total_len"] / stats["N"]
+        scores = [{} for _ in queries]
+
+        if allowed is None:
+            candidates = self.documents.items()
+        else:
+            candidates = ((cid, self.documents[cid]) for cid in allowed if cid in self.documents)
+
+        for chunk_id, tokens in candidates:
             tf = Counter(tokens)
-            score = 0.0
-
-            for term in query_terms:
-                if term not in tf:
-                    continue
-
-                idf = self._idf(term)
-                freq = tf[term]
-                dl = self.doc_len[chunk_id]
-
-                denom = freq + self.k1 * (1 - self.b + self.b * dl / self.avgdl)
-                score += idf * (freq * (self.k1 + 1)) / denom
-
-            if score > 0:
-                scores[chunk_id] = score
-
-        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
-
-        return [
-            {
-                "chunk_id": cid,
-                "score": float(score)
-            }
-            for cid, score in ranked
-        ]
+            if all_terms.isdisjoint(tf):
+                continue
+
+            dl = self.doc_len[chunk_id]
+            norm = self.k1 * (1 - self.b + self.b * dl / avgdl)
+
+            for qi, terms in enumerate(query_terms):
+                score = 0.0
+                for term in terms:
+                    freq = tf.get(term)
+                    if not freq:
+                        continue
+                    score += idf[term] * (freq * (self.k1 + 1)) / (freq + norm)
+
+                if score > 0:
+                    scores[qi][chunk_id] = score
+
+        results = []
+        for per_query in scores:
+            ranked = sorted(per_query.items(), key=lambda x: x[1], reverse=True)[:top_k]
+            results.append([
+                {
+                    "chunk_id": cid,
+                    "score": float(score)
+                }
+                for cid, score in ranked
+            ])
+        return results
 
     # -------------------------
     # Helpers
     # -------------------------
-    def _idf(self, term: str) -> float:
-        df = self.df.get(term, 0)
-        return math.log(1 + (self.N - df + 0.5) / (df + 0.5))
+    def _idf(self, term: str, df: int = None, N: int = None) -> float:
+        df = self.df.get(term, 0) if df is None else df
+        N = self.N if N is None else N
+        return math.log(1 + (N - df + 0.5) / (df + 0.5))
 
     def _tokenize(self, text: str) -> List[str]:
         return [
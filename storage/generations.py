@@ -0,0 +1,219 @@
+# generations.py
+import os
+import json
+import time
+import fcntl
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple
+
+MANIFEST = "manifest.json"
+GENERATIONS_DIR = "generations"
+INDEX_FILES = ("text.index", "text_id_map.json", "image.index", "image_id_map.json", "bm25.json")
+WRITER_LOCK = ".writer.lock"
+PUBLISH_LOCK = ".publish.lock"
+
+# older generations are kept on disk so a slow reader is never left
+# without its files mid-load
+KEEP_GENERATIONS = 3
+
+
+# --------------------------------------------------
+# Manifest (writer side)
+# --------------------------------------------------
+def read_manifest(base_path: str) -> Optional[dict]:
+    path = os.path.join(base_path, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def generation_path(base_path: str) -> Tuple[int, str]:
+    """
+    (generation, directory) serving processes should load.
+    Stores that were never published are served from base_path as generation 0.
+    """
+    manifest = read_manifest(base_path)
+    if manifest is None:
+        return 0, base_path
+    return manifest["generation"], os.path.join(base_path, manifest["path"])
+
+
+def publish_generation(base_path: str, keep: int = KEEP_GENERATIONS) -> dict:
+    """
+    Snapshot the index files the writer just saved in base_path into
+    generations/gen-N and point manifest.json at it.
+
+    The snapshot directory is complete before it gets its final name, and
+    the manifest is swapped with os.replace, so a reader sees either the
+    old generation or the new one, never a half-written index. Publishers
+    of one base_path take turns on PUBLISH_LOCK, so two of them never
+    claim the same generation number.
+    """
+    os.makedirs(base_path, exist_ok=True)
+    with open(os.path.join(base_path, PUBLISH_LOCK), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return _publish(base_path, keep)
+
+
+def _publish(base_path: str, keep: int) -> dict:
+    previous = read_manifest(base_path)
+    generation = (previous["generation"] if previous else 0) + 1
+
+    gen_root = os.path.join(base_path, GENERATIONS_DIR)
+    os.makedirs(gen_root, exist_ok=True)
+    rel_path = os.path.join(GENERATIONS_DIR, f"gen-{generation:06d}")
+
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=gen_root)
+    files = []
+    for name in INDEX_FILES:
+        src = os.path.join(base_path, name)
+        if os.path.exists(src):
+            shutil.copy2(src, os.path.join(staging, name))
+            files.append(name)
+    os.replace(staging, os.path.join(base_path, rel_path))
+
+    manifest = {
+        "generation": generation,
+        "path": rel_path,
+        "files": files,
+        "published_at": time.time()
+    }
+    tmp = os.path.join(base_path, f".{MANIFEST}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(base_path, MANIFEST))
+
+    _prune(gen_root, keep)
+    print(f"[GENERATION] Published {base_path} gen {generation}")
+    return manifest
+
+
+def publish_stores(vector_store) -> list:
+    """Publish whatever the writer owns: one store directory or every shard of a ShardSet."""
+    if hasattr(vector_store, "publish"):
+        return vector_store.publish()
+    return [publish_generation(vector_store.base_path)]
+
+
+def _prune(gen_root: str, keep: int):
+    published = sorted(d for d in os.listdir(gen_root) if d.startswith("gen-"))
+    for name in published[:-keep]:
+        shutil.rmtree(os.path.join(gen_root, name), ignore_errors=True)
+
+
+# --------------------------------------------------
+# Single writer per index directory
+# --------------------------------------------------
+@contextmanager
+def writer_lock(base_path: str, blocking: bool = True):
+    """
+    Exclusive lock for the one process allowed to write (and publish) the
+    index under base_path. Two writers would each save their own in-memory
+    copy over the other's, so a second one waits here (blocking) or gets a
+    RuntimeError. flock is dropped by the kernel when the holder dies, so
+    a waiting worker takes over after a crash.
+    """
+    os.makedirs(base_path, exist_ok=True)
+    with open(os.path.join(base_path, WRITER_LOCK), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not blocking:
+                raise RuntimeError(f"{base_path} already has a writer")
+            print(f"[WRITER] Waiting for the writer lock on {base_path}")
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# --------------------------------------------------
+# Loaded generations (serving side)
+# --------------------------------------------------
+class IndexGeneration:
+    """One loaded index snapshot plus the number of queries using it."""
+
+    def __init__(self, generation: int, path: str, vector_store, bm25_store):
+        self.generation = generation
+        self.path = path
+        self.vector_store = vector_store
+        self.bm25_store = bm25_store
+        self.refs = 0
+        self.retired = False
+
+    def close(self):
+        # last reference to the FAISS indexes / BM25 postings → memory is freed
+        self.vector_store = None
+        self.bm25_store = None
+        print(f"[GENERATION] Released gen {self.generation}")
+
+
+class GenerationHolder:
+    """
+    Reference to the generation new queries should use.
+
+    Queries acquire() the current generation and release() it when done;
+    swap() installs a new one. A replaced generation is closed as soon as
+    its last in-flight query releases it, never while one still runs.
+    """
+
+    def __init__(self):
+        self.current: Optional[IndexGeneration] = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> IndexGeneration:
+        with self._lock:
+            if self.current is None:
+                raise RuntimeError("No index generation loaded")
+            self.current.refs += 1
+            return self.current
+
+    def release(self, gen: IndexGeneration):
+        with self._lock:
+            gen.refs -= 1
+            close = gen.retired and gen.refs == 0
+        if close:
+            gen.close()
+
+    def swap(self, new: IndexGeneration) -> Optional[IndexGeneration]:
+        with self._lock:
+            old, self.current = self.current, new
+            close = False
+            if old is not None:
+                old.retired = True
+                close = old.refs == 0
+        if close:
+            old.close()
+        return old
+
+
+class GenerationWatcher:
+    """Calls reload() every interval_s; reload() is a no-op when nothing moved."""
+
+    def __init__(self, reload: Callable[[], object], interval_s: float, name: str = "generation-watcher"):
+        self.reload = reload
+        self.interval_s = interval_s
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.reload()
+            except Exception as e:
+                # a bad generation never takes down serving; the old one stays
+                print(f"[GENERATION] Reload failed: {e!r}")
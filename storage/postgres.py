@@ -26,17 +26,47 @@ class PostgresStore:
             version
         ))
         return document_id
+
+    def get_latest_document(self, source_path):
+        """Highest version stored for source_path, or None if never ingested."""
+        self.cursor.execute("""
+            SELECT document_id, checksum, version, is_active
+            FROM documents
+            WHERE source_path = %s
+            ORDER BY version DESC
+            LIMIT 1
+        """, (source_path,))
+        row = self.cursor.fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "document_id": str(row[0]),
+            "checksum": row[1],
+            "version": row[2],
+            "is_active": row[3]
+        }
+
+    def retire_document(self, document_id):
+        self.cursor.execute("""
+            UPDATE documents
+            SET is_active = FALSE
+            WHERE document_id = %s
+        """, (str(document_id),))
     
     ### CHUNKS
     def insert_chunks(self, document_id, chunks):
         chunk_ids = []
 
         for idx, chunk in enumerate(chunks):
-            chunk_id = uuid.uuid4()
+            chunk_id = chunk.get("chunk_id") or uuid.uuid4()
             chunk_ids.append(chunk_id)
 
+            # image chunks have no text; they are identified by their file
+            content = chunk.get("cleaned_text") or chunk.get("image_path") or ""
             chunk_hash = hashlib.sha256(
-                chunk["cleaned_text"].encode("utf-8")
+                content.encode("utf-8")
             ).hexdigest()
 
             self.cursor.execute("""
@@ -44,20 +74,101 @@ class PostgresStore:
                     chunk_id,
                     document_id,
                     chunk_index,
+                    page_number,
                     raw_text,
                     cleaned_text,
-                    chunk_hash
+                    chunk_hash,
+                    canonical_chunk_id,
+                    element_type,
+                    image_path
                 )
-                VALUES (%s, %s, %s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """, (
                 str(chunk_id),
                 str(document_id),
                 idx,
-                chunk["raw_text"],
-                chunk["cleaned_text"],
-                chunk_hash
+                chunk.get("page_number"),
+                chunk.get("raw_text") or "",
+                chunk.get("cleaned_text") or "",
+                chunk_hash,
+                chunk.get("canonical_chunk_id"),
+                chunk.get("element_type", "Text"),
+                chunk.get("image_path")
             ))
         return chunk_ids
+
+    def get_chunk_ids(self, document_id, canonical_only=False):
+        # canonical_only → skip near-duplicates, which have no vectors
+        self.cursor.execute("""
+            SELECT chunk_id
+            FROM chunks
+            WHERE document_id = %s
+              AND (NOT %s OR canonical_chunk_id IS NULL)
+            ORDER BY chunk_index ASC
+        """, (str(document_id), canonical_only))
+        return [str(r[0]) for r in self.cursor.fetchall()]
+
+    def get_retired_chunk_ids(self):
+        """Chunks of every retired (inactive) document version."""
+        self.cursor.execute("""
+            SELECT c.chunk_id
+            FROM chunks c
+            JOIN documents d ON d.document_id = c.document_id
+            WHERE NOT d.is_active
+        """)
+        return [str(r[0]) for r in self.cursor.fetchall()]
+
+    def get_active_chunk_refs(self):
+        """chunk_id / source_path of every chunk the index should hold (canonical chunks of active documents)."""
+        self.cursor.execute("""
+            SELECT c.chunk_id, d.source_path
+            FROM chunks c
+            JOIN documents d ON d.document_id = c.document_id
+            WHERE d.is_active
+              AND c.canonical_chunk_id IS NULL
+        """)
+        return [{"chunk_id": str(r[0]), "source_path": r[1]} for r in self.cursor.fetchall()]
+
+    def get_chunks_for_indexing(self, chunk_ids):
+        """What embedding needs for each of chunk_ids: source file, element type, text or image path."""
+        if not chunk_ids:
+            return []
+
+        self.cursor.execute("""
+            SELECT c.chunk_id, d.source_path, c.element_type, c.cleaned_text, c.image_path
+            FROM chunks c
+            JOIN documents d ON d.document_id = c.document_id
+            WHERE c.chunk_id = ANY(%s::uuid[])
+        """, ([str(cid) for cid in chunk_ids],))
+        return [
+            {"chunk_id": str(r[0]), "source_path": r[1], "element_type": r[2],
+             "cleaned_text": r[3], "image_path": r[4]}
+            for r in self.cursor.fetchall()
+        ]
+
+    def get_duplicates_of(self, canonical_chunk_ids):
+        """Active near-duplicate chunks linked to any of canonical_chunk_ids."""
+        if not canonical_chunk_ids:
+            return []
+
+        self.cursor.execute("""
+            SELECT c.chunk_id, c.cleaned_text, c.document_id, d.source_path
+            FROM chunks c
+            JOIN documents d ON d.document_id = c.document_id
+            WHERE d.is_active
+              AND c.canonical_chunk_id = ANY(%s::uuid[])
+        """, ([str(cid) for cid in canonical_chunk_ids],))
+        return [
+            {"chunk_id": str(r[0]), "cleaned_text": r[1], "document_id": str(r[2]), "source_path": r[3]}
+            for r in self.cursor.fetchall()
+        ]
+
+    def set_canonical(self, chunk_id, canonical_chunk_id):
+        self.cursor.execute("""
+            UPDATE chunks
+            SET canonical_chunk_id = %s
+            WHERE chunk_id = %s
+        """, (canonical_chunk_id, str(chunk_id)))
     
     ### TRANSACTIONS
     def commit(self):
@@ -15,11 +15,18 @@ def run_schema():
             source_type TEXT NOT NULL,
             checksum TEXT NOT NULL,
             version INTEGER NOT NULL DEFAULT 1,
+            is_active BOOLEAN NOT NULL DEFAULT TRUE,
             ingested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
             UNIQUE (source_path, version)
             );
         """)
 
+        # databases created before versioned re-ingestion
+        cursor.execute("""
+            ALTER TABLE documents
+            ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;
+        """)
+
         ### chunks table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS chunks(
@@ -30,17 +37,52 @@ def run_schema():
                        raw_text TEXT NOT NULL,
                        cleaned_text TEXT NOT NULL,
                        chunk_hash TEXT NOT NULL,
+                       canonical_chunk_id UUID,
                        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
                        );
         """)
 
 
+        # near-duplicate links (canonical_chunk_id IS NULL → chunk is embedded)
+        cursor.execute("""
+            ALTER TABLE chunks
+            ADD COLUMN IF NOT EXISTS canonical_chunk_id UUID;
+        """)
+
+        # image chunks (text columns empty, embedded from image_path)
+        cursor.execute("""
+            ALTER TABLE chunks
+            ADD COLUMN IF NOT EXISTS element_type TEXT NOT NULL DEFAULT 'Text',
+            ADD COLUMN IF NOT EXISTS image_path TEXT;
+        """)
+
         ### INDEXES
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_chunks_document_id
                        ON chunks(document_id);
         """)
 
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_documents_source_path
+            ON documents(source_path, version DESC);
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chunks_canonical_chunk_id
+            ON chunks(canonical_chunk_id);
+        """)
+
+        # metadata filters (source_type / page range scoping)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_documents_source_type
+            ON documents(source_type);
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chunks_page_number
+            ON chunks(document_id, page_number);
+        """)
+
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_chunks_chunk_hash
             ON chunks(chunk_hash);
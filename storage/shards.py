@@ -0,0 +1,160 @@
+# shards.py
+import os
+import hashlib
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from storage.vector_store import VectorStore
+from storage.bm25_store import BM25Store
+from storage.generations import publish_generation, writer_lock
+
+# what callers read from VectorStore.text_index / image_index
+IndexInfo = namedtuple("IndexInfo", ["d", "ntotal"])
+
+
+def shard_for(key, num_shards: int) -> int:
+    """Stable across processes and restarts (unlike hash())."""
+    digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % num_shards
+
+
+def shard_path(base_path: str, shard: int) -> str:
+    return os.path.join(base_path, f"shard-{shard:02d}")
+
+
+class ShardSet:
+    """
+    Write side of a sharded index: N VectorStore + BM25Store pairs,
+    one directory each under base_path. Every version of a file lives on
+    shard_for(source_path), so a shard has exactly one writer: the one
+    that owns it (ingestion/jobs.py sends a file's jobs to the partition
+    of the same number).
+
+    owned: the shards this writer loads and writes (default: all of them).
+    Same save / remove / has_chunks calls as VectorStore, over the owned
+    shards, so ingestion treats it as its vector store and routes adds
+    through for_source.
+    """
+
+    def __init__(self, base_path: str, num_shards: int, text_dim: int = 768, image_dim: int = 512,
+                 owned: Optional[Iterable[int]] = None):
+        if num_shards < 1:
+            raise ValueError("num_shards must be >= 1")
+
+        self.base_path = base_path
+        self.num_shards = num_shards
+        self.owned = sorted(range(num_shards) if owned is None else set(owned))
+        if not self.owned or not all(0 <= i < num_shards for i in self.owned):
+            raise ValueError(f"owned shards must be a non-empty subset of 0..{num_shards - 1}")
+
+        self.vector_stores = [
+            VectorStore(text_dim=text_dim, image_dim=image_dim, base_path=shard_path(base_path, i))
+            for i in self.owned
+        ]
+        self.bm25_stores = [BM25Store(base_path=vs.base_path) for vs in self.vector_stores]
+        self._slot = {shard: slot for slot, shard in enumerate(self.owned)}
+
+    def owns(self, source_path) -> bool:
+        return shard_for(source_path, self.num_shards) in self._slot
+
+    def for_source(self, source_path):
+        """(VectorStore, BM25Store) that holds every version of source_path."""
+        shard = shard_for(source_path, self.num_shards)
+        if shard not in self._slot:
+            raise ValueError(f"{source_path} belongs to shard {shard}, not owned by this writer {self.owned}")
+        slot = self._slot[shard]
+        return self.vector_stores[slot], self.bm25_stores[slot]
+
+    def remove(self, chunk_ids) -> int:
+        chunk_ids = list(chunk_ids)
+        for bm25 in self.bm25_stores:
+            bm25.remove(chunk_ids)
+        return sum(vs.remove(chunk_ids) for vs in self.vector_stores)
+
+    def has_chunks(self, chunk_ids) -> bool:
+        indexed = set()
+        for vs in self.vector_stores:
+            indexed.update(vs.text_id_map)
+            indexed.update(vs.image_id_map)
+        return all(cid in indexed for cid in chunk_ids)
+
+    def save(self):
+        for vs, bm25 in zip(self.vector_stores, self.bm25_stores):
+            vs.save()
+            bm25.save()
+
+    def publish(self) -> List[dict]:
+        """New serving generation on every shard (each shard server reloads its own)."""
+        return [publish_generation(vs.base_path) for vs in self.vector_stores]
+
+    @property
+    def text_index(self) -> IndexInfo:
+        return IndexInfo(self.vector_stores[0].text_index.d, sum(vs.text_index.ntotal for vs in self.vector_stores))
+
+    @property
+    def image_index(self) -> IndexInfo:
+        return IndexInfo(self.vector_stores[0].image_index.d, sum(vs.image_index.ntotal for vs in self.vector_stores))
+
+    def shard_sizes(self) -> List[Dict]:
+        return [
+            {"shard": i, "text_vectors": vs.text_index.ntotal, "image_vectors": vs.image_index.ntotal, "bm25_documents": bm25.N}
+            for i, vs, bm25 in zip(self.owned, self.vector_stores, self.bm25_stores)
+        ]
+
+
+def route(vector_store, bm25_store, source_path):
+    """Stores a file's new chunks are added to (sharded or not)."""
+    if isinstance(vector_store, ShardSet):
+        return vector_store.for_source(source_path)
+    return vector_store, bm25_store
+
+
+def owns(vector_store, source_path) -> bool:
+    """Whether this writer may add source_path's chunks (an unsharded store owns everything)."""
+    return not isinstance(vector_store, ShardSet) or vector_store.owns(source_path)
+
+
+@contextmanager
+def writer_locks(vector_store, blocking: bool = True):
+    """writer_lock on every directory the writer saves: each owned shard, or the store's base_path."""
+    if isinstance(vector_store, ShardSet):
+        paths = [vs.base_path for vs in vector_store.vector_stores]
+    else:
+        paths = [vector_store.base_path]
+
+    with ExitStack() as stack:
+        # always in shard order, so two writers never wait on each other crosswise
+        for path in paths:
+            stack.enter_context(writer_lock(path, blocking))
+        yield
+
+
+def split_store(source: VectorStore, bm25: BM25Store, source_of: Dict[str, str], shards: ShardSet) -> ShardSet:
+    """
+    One-off migration of an unsharded store into `shards`.
+    source_of maps chunk_id -> documents.source_path (chunks joined to
+    documents); IndexFlat keeps raw vectors, so nothing is re-embedded.
+    """
+    for index, id_map, modality in (
+        (source.text_index, source.text_id_map, "text"),
+        (source.image_index, source.image_id_map, "image"),
+    ):
+        if not index.ntotal:
+            continue
+
+        vectors = index.reconstruct_n(0, index.ntotal)
+        for vec, chunk_id in zip(vectors, id_map):
+            vs, _ = shards.for_source(source_of[chunk_id])
+            if modality == "text":
+                vs.add_text(np.asarray(vec), chunk_id)
+            else:
+                vs.add_image(np.asarray(vec), chunk_id)
+
+    for chunk_id, tokens in bm25.documents.items():
+        _, shard_bm25 = shards.for_source(source_of[chunk_id])
+        shard_bm25._add_tokens(chunk_id, tokens)
+
+    return shards
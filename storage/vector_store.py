@@ -43,6 +43,10 @@ class VectorStore:
         else:
             self.image_index = faiss.IndexFlatIP(image_dim)
             self.image_id_map = []
+
+        # chunk_id -> ordinal, rebuilt lazily after adds / removes
+        self._text_ordinals = None
+        self._image_ordinals = None
     
     # add methods
     def add_text(self, embedding: np.ndarray, chunk_id: str):
@@ -51,12 +55,42 @@ class VectorStore:
         vec = self._normalize(embedding)
         self.text_index.add(vec)
         self.text_id_map.append(chunk_id)
+        self._text_ordinals = None
     
     def add_image(self, embedding: np.ndarray, chunk_id: str):
         self._validate_embedding(embedding, self.image_index.d)
         vec = self._normalize(embedding)
         self.image_index.add(vec)
         self.image_id_map.append(chunk_id)
+        self._image_ordinals = None
+
+    # remove methods
+    def remove(self, chunk_ids) -> int:
+        """
+        Drop chunk_ids from both indexes.
+        IndexFlat compacts in order on remove_ids, so filtering the
+        id maps the same way keeps ordinal -> chunk_id aligned.
+        """
+        chunk_ids = set(chunk_ids)
+        removed = 0
+
+        for index, map_attr in ((self.text_index, "text_id_map"), (self.image_index, "image_id_map")):
+            id_map = getattr(self, map_attr)
+            ordinals = [i for i, cid in enumerate(id_map) if cid in chunk_ids]
+            if not ordinals:
+                continue
+
+            index.remove_ids(np.array(ordinals, dtype="int64"))
+            setattr(self, map_attr, [cid for cid in id_map if cid not in chunk_ids])
+            removed += len(ordinals)
+
+        self._text_ordinals = None
+        self._image_ordinals = None
+        return removed
+
+    def has_chunks(self, chunk_ids) -> bool:
+        indexed = set(self.text_id_map) | set(self.image_id_map)
+        return all(cid in indexed for cid in chunk_ids)
 
     # search methods
     def search_text(self, query_embedding: np.ndarray, top_k: int = 5):
@@ -69,6 +103,70 @@ class VectorStore:
             scores, indices, self.text_id_map
         )
     
+    def text_bitmap(self, chunk_ids) -> np.ndarray:
+        """
+        Packed bitmap over text ordinals (bit i set → ordinal i allowed),
+        in the little-endian bit order faiss.IDSelectorBitmap expects.
+        """
+        if self._text_ordinals is None:
+            self._text_ordinals = {cid: i for i, cid in enumerate(self.text_id_map)}
+        return self._bitmap(chunk_ids, self._text_ordinals, self.text_index.ntotal)
+
+    def image_bitmap(self, chunk_ids) -> np.ndarray:
+        """text_bitmap over image.index ordinals."""
+        if self._image_ordinals is None:
+            self._image_ordinals = {cid: i for i, cid in enumerate(self.image_id_map)}
+        return self._bitmap(chunk_ids, self._image_ordinals, self.image_index.ntotal)
+
+    @staticmethod
+    def _bitmap(chunk_ids, ordinals_by_id, ntotal: int) -> np.ndarray:
+        bits = np.zeros(ntotal, dtype=bool)
+        ordinals = [ordinals_by_id[cid] for cid in chunk_ids if cid in ordinals_by_id]
+        bits[ordinals] = True
+        return np.packbits(bits, bitorder="little")
+
+    def search_text_batch(self, query_embeddings: np.ndarray, top_k: int = 5, allowed: np.ndarray = None):
+        """
+        One FAISS call for many queries → one result list per query row.
+        allowed: text_bitmap(...) output; only those ordinals are scored.
+        """
+        if self.text_index.ntotal == 0 or (allowed is not None and not allowed.any()):
+            return [[] for _ in range(len(query_embeddings))]
+
+        mat = self._normalize_rows(query_embeddings)
+
+        if allowed is None:
+            scores, indices = self.text_index.search(mat, top_k)
+        else:
+            # IndexFlat skips the dot product for every ordinal outside the bitmap
+            selector = faiss.IDSelectorBitmap(self.text_index.ntotal, faiss.swig_ptr(allowed))
+            scores, indices = self.text_index.search(mat, top_k, params=faiss.SearchParameters(sel=selector))
+
+        return [
+            self._format_results(scores[i:i + 1], indices[i:i + 1], self.text_id_map)
+            for i in range(mat.shape[0])
+        ]
+
+    def search_image_batch(self, query_embeddings: np.ndarray, top_k: int = 3, allowed: np.ndarray = None):
+        """
+        CLIP text-tower queries against image.index, one result list per row.
+        allowed: image_bitmap(...) output, as for search_text_batch.
+        """
+        if self.image_index.ntotal == 0 or (allowed is not None and not allowed.any()):
+            return [[] for _ in range(len(query_embeddings))]
+
+        mat = self._normalize_rows(query_embeddings, self.image_index.d)
+        if allowed is None:
+            scores, indices = self.image_index.search(mat, top_k)
+        else:
+            selector = faiss.IDSelectorBitmap(self.image_index.ntotal, faiss.swig_ptr(allowed))
+            scores, indices = self.image_index.search(mat, top_k, params=faiss.SearchParameters(sel=selector))
+
+        return [
+            self._format_results(scores[i:i + 1], indices[i:i + 1], self.image_id_map)
+            for i in range(mat.shape[0])
+        ]
+
     def search_image(self, query_embedding: np.ndarray, top_k: int = 3):
         if self.image_index.ntotal == 0:
             return []
@@ -99,6 +197,13 @@ class VectorStore:
             raise ValueError("Zero-norm embedding")
         return (vec / norm).reshape(1, -1)
 
+    def _normalize_rows(self, mat: np.ndarray, dim: int = None) -> np.ndarray:
+        mat = np.asarray(mat, dtype="float32").reshape(-1, dim or self.text_index.d)
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        if np.any(norms == 0):
+            raise ValueError("Zero-norm embedding")
+        return mat / norms
+
     def _validate_embedding(self, vec: np.ndarray, dim: int):
         if vec is None:
             raise ValueError("Embedding is None")
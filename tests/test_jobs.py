@@ -0,0 +1,175 @@
+# test_jobs.py
+"""
+IngestWorker against the in-process broker: at-least-once delivery and
+offsets that only move once the index is on disk. Postgres, loading
+and embedding are replaced by mocks, so this runs without kafka,
+unstructured, torch or a database.
+
+    python -m unittest tests.test_jobs
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ingestion.jobs import InMemoryBroker, IngestJobProducer, IngestWorker
+from storage.generations import writer_lock
+from storage.shards import shard_for
+from config import INGEST_TOPIC, INGEST_GROUP_ID
+
+
+class RecordingStore:
+    """Vector store stand-in that remembers the group's committed offsets at every save()."""
+
+    def __init__(self, base_path: str, broker: InMemoryBroker):
+        self.base_path = base_path
+        self.broker = broker
+        self.committed_at_save = []
+
+    def save(self):
+        self.committed_at_save.append(dict(self.broker.committed))
+
+
+class IngestWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="test-jobs-")
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.files = []
+        for name in ("a.txt", "b.txt"):
+            path = os.path.join(self.tmp, name)
+            with open(path, "w") as f:
+                f.write(name)
+            self.files.append(path)
+
+        self.broker = InMemoryBroker()
+        IngestJobProducer(self.broker.producer()).enqueue_many(self.files)
+        self.store = RecordingStore(os.path.join(self.tmp, "index"), self.broker)
+
+        # Postgres, partitioning and embedding are out of scope here; the
+        # worker imports them lazily, so stand-ins in sys.modules are enough
+        self.ingest = mock.MagicMock()
+        self.ingest.plan_version.return_value = {"version": 1, "previous_document_id": None}
+        self.load = mock.MagicMock()
+        self.load.load_documents.return_value = ["element"]
+        for patcher in (
+            mock.patch.dict(sys.modules, {
+                "ingestion.ingest": self.ingest,
+                "ingestion.load": self.load,
+                "storage.postgres": mock.MagicMock(),
+            }),
+            mock.patch("ingestion.jobs.publish_stores", mock.MagicMock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def committed(self):
+        return self.broker.committed.get((INGEST_TOPIC, INGEST_GROUP_ID, 0), 0)
+
+    def worker(self):
+        return IngestWorker(lambda partitions: self.broker.consumer(partitions=partitions), self.store)
+
+    def test_job_failing_before_commit_is_redelivered(self):
+        first = self.worker()
+        self.ingest.ingest_pipeline.side_effect = RuntimeError("embedder crashed")
+        with self.assertRaises(RuntimeError):
+            first.run(stop_when_idle=True, poll_timeout_ms=0)
+        self.assertEqual(self.committed(), 0)
+
+        second = self.worker()
+        self.ingest.ingest_pipeline.reset_mock(side_effect=True)
+        report = second.run(stop_when_idle=True, poll_timeout_ms=0)
+
+        calls = self.ingest.ingest_pipeline.call_args_list
+        self.assertEqual([c.kwargs["source_path"] for c in calls], self.files)
+        self.assertEqual(report["processed"], 2)
+        self.assertEqual(self.committed(), 2)
+
+    def test_offset_is_committed_only_after_save(self):
+        self.worker().run(stop_when_idle=True, poll_timeout_ms=0)
+
+        # the n-th save happens while only the n-1 earlier jobs are committed
+        committed = [c.get((INGEST_TOPIC, INGEST_GROUP_ID, 0), 0) for c in self.store.committed_at_save]
+        self.assertEqual(committed, [0, 1])
+        self.assertEqual(self.committed(), 2)
+
+    def test_consumer_is_created_only_under_the_writer_lock(self):
+        connected = []
+
+        def connect(partitions):
+            # a standby must not hold partitions while it waits for the lock
+            with self.assertRaises(RuntimeError):
+                with writer_lock(self.store.base_path, blocking=False):
+                    pass
+            connected.append(partitions)
+            return self.broker.consumer(partitions=partitions)
+
+        IngestWorker(connect, self.store).run(stop_when_idle=True, poll_timeout_ms=0)
+        self.assertEqual(connected, [[0]])
+
+    def test_second_writer_is_refused(self):
+        with writer_lock(self.store.base_path):
+            with self.assertRaises(RuntimeError):
+                with writer_lock(self.store.base_path, blocking=False):
+                    pass
+
+
+class ConsumerGroupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.broker = InMemoryBroker(num_partitions=4)
+        producer = self.broker.producer()
+        for i in range(40):
+            producer.send(INGEST_TOPIC, key=f"file-{i}", value=i)
+
+    @staticmethod
+    def drain(consumer):
+        values = []
+        for records in consumer.poll().values():
+            values.extend(r.value for r in records)
+        return values
+
+    def test_partitions_are_split_across_the_group(self):
+        first, second = self.broker.consumer(), self.broker.consumer()
+        a, b = self.drain(first), self.drain(second)
+
+        self.assertFalse(set(a) & set(b))
+        self.assertEqual(sorted(a + b), list(range(40)))
+        self.assertFalse(set(first.positions) & set(second.positions))
+
+    def test_uncommitted_records_move_to_the_remaining_consumer(self):
+        first, second = self.broker.consumer(), self.broker.consumer()
+        a, b = self.drain(first), self.drain(second)
+        second.commit()
+        first.close()
+
+        self.assertEqual(sorted(self.drain(second)), sorted(a))
+        self.assertEqual(self.drain(second), [])
+
+    def test_assigned_consumer_reads_its_partitions_outside_the_group(self):
+        member = self.broker.consumer()
+        assigned = self.broker.consumer(partitions=[1, 3])
+        got = self.drain(assigned)
+
+        self.assertEqual(set(assigned.positions), {1, 3})
+        self.assertEqual(len(got), sum(len(self.broker.topics[INGEST_TOPIC][p]) for p in (1, 3)))
+        # the group member still owns every partition
+        self.assertEqual(sorted(self.drain(member)), list(range(40)))
+
+    def test_jobs_go_to_the_partition_of_their_shard(self):
+        broker = InMemoryBroker(num_partitions=4)
+        files = [f"docs/file-{i}.pdf" for i in range(20)]
+        IngestJobProducer(broker.producer(), num_partitions=4).enqueue_many(files)
+
+        for partition, log in enumerate(broker.topics[INGEST_TOPIC]):
+            self.assertTrue(all(shard_for(r.key, 4) == partition for r in log))
+
+    def test_other_groups_read_everything(self):
+        self.drain(self.broker.consumer())
+        self.assertEqual(sorted(self.drain(self.broker.consumer(group_id="audit"))), list(range(40)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+# test_sharding.py
+"""
+Scatter-gather over local shard processes must rank like one unsharded
+VectorStore + BM25Store over the same corpus.
+
+    python -m unittest tests.test_sharding
+"""
+import time
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+import multiprocessing
+from concurrent.futures import TimeoutError as FuturesTimeout
+from multiprocessing.connection import Listener
+
+import numpy as np
+
+from storage.vector_store import VectorStore
+from storage.bm25_store import BM25Store
+from storage.shards import ShardSet, shard_for
+from retrieval.sharding import ShardedIndex, ShardServer, ShardClient, start_local_shards, stop_local_shards, check_endpoint, send_message, recv_message
+from retrieval.concurrency import _timed
+
+NUM_SHARDS = 3
+TEXT_DIM = 16
+IMAGE_DIM = 8
+TOP_K = 5
+VOCAB = [f"term{i}" for i in range(40)]
+
+
+def ranking(results):
+    """score → chunk_ids, without the lowest score (ties at the cut-off may differ)."""
+    by_score = {}
+    for r in results:
+        by_score.setdefault(round(r["score"], 5), set()).add(r["chunk_id"])
+    if by_score:
+        del by_score[min(by_score)]
+    return by_score
+
+
+class ShardedSearchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp(prefix="test-shards-")
+        rng = np.random.default_rng(0)
+        words = random.Random(0)
+
+        cls.single = VectorStore(text_dim=TEXT_DIM, image_dim=IMAGE_DIM, base_path=f"{cls.tmp}/single")
+        cls.single_bm25 = BM25Store()
+        shards = ShardSet(f"{cls.tmp}/sharded", NUM_SHARDS, text_dim=TEXT_DIM, image_dim=IMAGE_DIM)
+
+        cls.chunk_ids = []
+        for d in range(30):
+            source_path = f"docs/file-{d}.pdf"
+            vs, bm25 = shards.for_source(source_path)
+            for c in range(3):
+                chunk_id = f"doc-{d}-{c}"
+                vector = rng.standard_normal(TEXT_DIM).astype("float32")
+                text = " ".join(words.choice(VOCAB) for _ in range(words.randint(5, 30)))
+                for store, index in ((cls.single, cls.single_bm25), (vs, bm25)):
+                    store.add_text(vector, chunk_id)
+                    index.add(chunk_id, text)
+                cls.chunk_ids.append(chunk_id)
+        shards.save()
+
+        # every shard must hold something for the comparison to mean anything
+        assert all(s["text_vectors"] for s in shards.shard_sizes())
+
+        cls.processes, endpoints = start_local_shards(f"{cls.tmp}/sharded", NUM_SHARDS, authkey=None)
+        cls.index = ShardedIndex(endpoints, authkey=None)
+        cls.queries = rng.standard_normal((4, TEXT_DIM)).astype("float32")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.index.close()
+        stop_local_shards(cls.processes)
+        shutil.rmtree(cls.tmp, ignore_errors=True)
+
+    def test_sizes_add_up(self):
+        self.assertEqual(self.index.text_index.ntotal, self.single.text_index.ntotal)
+        self.assertEqual(self.index.N, self.single_bm25.N)
+
+    def test_dense_top_k_matches_single_index(self):
+        sharded = self.index.search_text_batch(self.queries, TOP_K)
+        single = self.single.search_text_batch(self.queries, TOP_K)
+        for got, expected in zip(sharded, single):
+            self.assertEqual([r["chunk_id"] for r in got], [r["chunk_id"] for r in expected])
+            np.testing.assert_allclose([r["score"] for r in got], [r["score"] for r in expected], rtol=1e-5)
+
+    def test_dense_filter_matches_single_index(self):
+        allowed = set(self.chunk_ids[::4])
+        sharded = self.index.search_text_batch(self.queries, TOP_K, allowed=self.index.text_bitmap(allowed))
+        single = self.single.search_text_batch(self.queries, TOP_K, allowed=self.single.text_bitmap(allowed))
+        for got, expected in zip(sharded, single):
+            self.assertTrue({r["chunk_id"] for r in got} <= allowed)
+            self.assertEqual([r["chunk_id"] for r in got], [r["chunk_id"] for r in expected])
+
+    def test_bm25_top_k_matches_single_index(self):
+        queries = ["term1 term2", "term7", "term3 term3 term30", "missing"]
+        sharded = self.index.search_batch(queries, TOP_K)
+        single = self.single_bm25.search_batch(queries, TOP_K)
+        for got, expected in zip(sharded, single):
+            np.testing.assert_allclose([r["score"] for r in got], [r["score"] for r in expected], rtol=1e-9)
+            self.assertEqual(ranking(got), ranking(expected))
+
+    def test_bm25_filter_matches_single_index(self):
+        allowed = set(self.chunk_ids[1::3])
+        sharded = self.index.search_batch(["term4 term5"], TOP_K, allowed=allowed)[0]
+        single = self.single_bm25.search_batch(["term4 term5"], TOP_K, allowed=allowed)[0]
+        self.assertTrue({r["chunk_id"] for r in sharded} <= allowed)
+        np.testing.assert_allclose([r["score"] for r in sharded], [r["score"] for r in single], rtol=1e-9)
+
+    def test_query_view_reports_generations_that_answered(self):
+        view = self.index.for_query()
+        view.search_text_batch(self.queries, TOP_K)
+        view.search_batch(["term1"], TOP_K)
+        self.assertEqual([len(s) for s in view.served], [1] * NUM_SHARDS)
+        self.assertEqual(view.served_generation(), self.index.generation)
+        # the shared index itself records nothing across queries
+        self.assertIsNone(self.index.served)
+
+
+class OwnedShardsTest(unittest.TestCase):
+
+    def test_writer_only_routes_files_of_its_shards(self):
+        tmp = tempfile.mkdtemp(prefix="test-owned-shards-")
+        self.addCleanup(shutil.rmtree, tmp, True)
+        shards = ShardSet(tmp, NUM_SHARDS, text_dim=TEXT_DIM, image_dim=IMAGE_DIM, owned=[1])
+
+        files = [f"docs/file-{i}.pdf" for i in range(20)]
+        mine = [f for f in files if shard_for(f, NUM_SHARDS) == 1]
+        self.assertEqual([f for f in files if shards.owns(f)], mine)
+        self.assertIs(shards.for_source(mine[0])[0], shards.vector_stores[0])
+        with self.assertRaises(ValueError):
+            shards.for_source(next(f for f in files if f not in mine))
+
+
+class ShardAuthTest(unittest.TestCase):
+
+    def test_wrong_authkey_is_rejected_and_server_keeps_serving(self):
+        tmp = tempfile.mkdtemp(prefix="test-shard-auth-")
+        self.addCleanup(shutil.rmtree, tmp, True)
+        VectorStore(text_dim=TEXT_DIM, image_dim=IMAGE_DIM, base_path=tmp).save()
+
+        server = ShardServer(tmp, ("127.0.0.1", 0), authkey=b"right", reload_interval_s=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        address = server.listener.address
+
+        with self.assertRaises(multiprocessing.AuthenticationError):
+            ShardClient(address, authkey=b"wrong").call("status")
+
+        client = ShardClient(address, authkey=b"right")
+        self.addCleanup(client.close)
+        self.assertEqual(client.call("status")["text_dim"], TEXT_DIM)
+
+
+def stalled_shard():
+    """Endpoint that answers status but never replies to a search."""
+    listener = Listener(("127.0.0.1", 0), authkey=None)
+    status = {"generation": 1, "text_dim": TEXT_DIM, "image_dim": IMAGE_DIM,
+              "text_vectors": 0, "image_vectors": 0, "bm25_documents": 0}
+
+    def handle(conn):
+        try:
+            while True:
+                if recv_message(conn)["method"] == "status":
+                    send_message(conn, {"status": "ok", "value": status})
+        except (EOFError, OSError):
+            conn.close()
+
+    def serve():
+        while True:
+            threading.Thread(target=handle, args=(listener.accept(),), daemon=True).start()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener
+
+
+class ShardTimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = stalled_shard()
+        host, port = self.listener.address
+        self.index = ShardedIndex([f"{host}:{port}"], authkey=None)
+        self.addCleanup(self.index.close)
+
+    def test_call_times_out_and_drops_its_connection(self):
+        client = self.index.clients[0]
+        with self.assertRaises(FuturesTimeout):
+            client.call("search_text", timeout=0.1, query_embeddings=[[0.0] * TEXT_DIM], top_k=1)
+        self.assertTrue(client._pool.empty())
+        # a fresh connection serves the next call
+        self.assertEqual(client.call("status")["generation"], 1)
+
+    def test_scatter_gives_up_at_the_signal_deadline(self):
+        queries = np.zeros((1, TEXT_DIM), dtype="float32")
+        started = time.perf_counter()
+        with self.assertRaises(FuturesTimeout):
+            _timed(lambda: self.index.search_text_batch(queries, TOP_K), started + 0.2)
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+
+class EndpointCheckTest(unittest.TestCase):
+
+    def test_remote_tcp_needs_authkey(self):
+        with self.assertRaises(ValueError):
+            check_endpoint(("10.0.0.5", 7100), None)
+        check_endpoint(("10.0.0.5", 7100), b"secret")
+
+    def test_loopback_and_unix_sockets_may_skip_authkey(self):
+        check_endpoint(("127.0.0.1", 7100), None)
+        check_endpoint(("localhost", 7100), None)
+        check_endpoint("/tmp/shard-00.sock", None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+# deadline.py
+"""
+Per-request latency budget, carried in QueryState["deadline"] as a
+time.monotonic() timestamp. No deadline → every stage runs.
+
+Required stages (intent, embed, retrieve, validate, answer) always run.
+Optional ones check has_budget() first and are skipped or cut down when
+too little time is left; each skip is recorded in skipped_stages with
+the budget that remained, so per-endpoint budgets can be tuned from it.
+Retrieval signals keep their own timeouts, cut to what is left
+(clamp_timeouts) so a late search cannot overrun the request.
+
+    graph.invoke(with_deadline({"user_query": q}, budget_ms=3000))
+"""
+import time
+from typing import Dict, Optional, Tuple
+
+# remaining budget (ms) an optional stage needs to be worth starting;
+# each includes the required stages that still follow it
+MIN_BUDGET_MS = {
+    "rewrite": 2500,         # expansion / HyDE / decomposition LLM call
+    "multi_query": 1500,     # searching the rewrites beside user_query
+    "image_search": 1500,    # CLIP text encoding + image.index
+    "rerank": 1500,          # cross-encoder batches
+    "map_reduce": 3000       # sub-answers + reduce instead of one answer call
+}
+
+
+def with_deadline(state: dict, budget_ms: float) -> dict:
+    return {**state, "deadline": time.monotonic() + budget_ms / 1000}
+
+
+def remaining_ms(state: dict) -> Optional[float]:
+    deadline = state.get("deadline")
+    if deadline is None:
+        return None
+    return (deadline - time.monotonic()) * 1000
+
+
+def has_budget(state: dict, stage: str) -> bool:
+    remaining = remaining_ms(state)
+    return remaining is None or remaining >= MIN_BUDGET_MS[stage]
+
+
+def skipped(state: dict, stage: str) -> dict:
+    """State update recording that stage was skipped for lack of budget."""
+    return {"skipped_stages": {stage: round(remaining_ms(state), 1)}}
+
+
+def clamp_timeouts(state: dict, timeouts_ms: Dict[str, float]) -> Tuple[Dict[str, float], dict]:
+    """
+    Per-signal timeouts (name -> ms) cut to the remaining budget, and the
+    state update recording each cut one in skipped_stages as "<name>_timeout".
+    """
+    remaining = remaining_ms(state)
+    if remaining is None:
+        return dict(timeouts_ms), {}
+
+    remaining = max(remaining, 0.0)
+    cut = {f"{name}_timeout": round(remaining, 1) for name, ms in timeouts_ms.items() if ms > remaining}
+    clamped = {name: min(ms, remaining) for name, ms in timeouts_ms.items()}
+    return clamped, ({"skipped_stages": cut} if cut else {})
@@ -0,0 +1,108 @@
+# fake_llm.py
+import time
+import json
+import asyncio
+import random
+import re
+import threading
+from typing import Callable, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+def _prompt_text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(getattr(m, "content", str(m)) for m in messages)
+
+
+def canned_reply(prompt: str) -> str:
+    """Plausible output for each control / answer prompt in agents/."""
+    if "query planner" in prompt:
+        return json.dumps({
+            "intent": "factual", "confidence": 0.9, "reason": "fake",
+            "expanded_query": "expanded query", "hyde": None, "sub_questions": None
+        })
+    if "intent classifier" in prompt:
+        return json.dumps({"intent": "factual", "confidence": 0.9, "reason": "fake"})
+    if "sub_questions" in prompt:
+        return json.dumps({"sub_questions": ["first part?", "second part?"]})
+    if '"hyde"' in prompt:
+        return json.dumps({"expanded_query": "expanded query", "hyde": "hypothetical answer"})
+    if "expanded_query" in prompt:
+        return json.dumps({"expanded_query": "expanded query"})
+
+    cited = re.findall(r"^\s*\[([^\]]+)\]", prompt, re.MULTILINE)
+    return f"Fake answer.\nEvidence: [{', '.join(cited[:2])}]"
+
+
+class FakeLLM:
+    """
+    Stand-in for ChatGoogleGenerativeAI with injected latency, for load
+    tests without network or quota. Install with utils.llm.set_llm().
+
+    latency_ms ± jitter_ms is spent in time.sleep (invoke) or
+    asyncio.sleep (ainvoke / astream), so thread-bound and loop-bound
+    callers wait the same way they would on Gemini.
+    """
+
+    # distinct from real models in utils.llm_cache keys
+    model = "fake-llm"
+    temperature = 0.0
+
+    def __init__(self, latency_ms: float = 800, jitter_ms: float = 0,
+                 respond: Callable[[str], str] = canned_reply, seed: Optional[int] = None,
+                 token_ms: float = 15):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms      # astream: gap between chunks after the first
+        self.respond = respond
+        self._random = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _delay_s(self) -> float:
+        jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def invoke(self, messages, **kwargs) -> AIMessage:
+        self._enter()
+        try:
+            time.sleep(self._delay_s())
+            return AIMessage(content=self.respond(_prompt_text(messages)))
+        finally:
+            self._exit()
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        self._enter()
+        try:
+            await asyncio.sleep(self._delay_s())
+            return AIMessage(content=self.respond(_prompt_text(messages)))
+        finally:
+            self._exit()
+
+    async def astream(self, messages, **kwargs):
+        """First chunk after latency_ms, then one word every token_ms."""
+        self._enter()
+        try:
+            await asyncio.sleep(self._delay_s())
+            text = self.respond(_prompt_text(messages))
+            for i, piece in enumerate(re.findall(r"\s*\S+", text) or [text]):
+                if i:
+                    await asyncio.sleep(self.token_ms / 1000)
+                yield AIMessageChunk(content=piece)
+        finally:
+            self._exit()
@@ -1,4 +1,8 @@
 # llm.py
+import os
+import asyncio
+import weakref
+
 from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
 
@@ -7,8 +11,13 @@ load_dotenv(override=True)
 
 CONTROL_MODEL = "gemini-2.5-flash"
 TEMPERATURE = 0.0
+# in-flight ainvoke calls per event loop
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+# response cache for control prompts (utils/llm_cache.py)
+LLM_CACHE = os.getenv("LLM_CACHE", "1").lower() in {"1", "true", "yes"}
 
 _llm = None
+_control_llm = None
 
 def get_llm():
     global _llm
@@ -19,3 +28,66 @@ def get_llm():
         )
     return _llm
 
+
+def get_control_llm():
+    """
+    Model for intent / rewrite prompts: get_llm() behind the exact +
+    semantic response cache when LLM_CACHE is on. Answer generation keeps
+    using get_llm() directly.
+    """
+    global _control_llm
+    if not LLM_CACHE:
+        return get_llm()
+    if _control_llm is None:
+        from utils.llm_cache import CachedLLM
+        _control_llm = CachedLLM(get_llm())
+    return _control_llm
+
+
+def set_llm_cache(enabled: bool):
+    """Turn the control-prompt cache on / off (benchmarks measure uncached calls)."""
+    global LLM_CACHE, _control_llm
+    LLM_CACHE = enabled
+    _control_llm = None
+
+
+def set_llm(llm):
+    """Replace the shared model, e.g. with utils.fake_llm.FakeLLM for load tests."""
+    global _llm, _control_llm
+    _llm = llm
+    _control_llm = None
+
+
+# --------------------------------------------------
+# Async path
+# --------------------------------------------------
+# asyncio.Semaphore belongs to one loop, so each running loop gets its own
+_semaphores = weakref.WeakKeyDictionary()
+
+def set_llm_concurrency(limit: int):
+    global LLM_MAX_CONCURRENCY
+    if limit < 1:
+        raise ValueError("LLM concurrency must be >= 1")
+    LLM_MAX_CONCURRENCY = limit
+    _semaphores.clear()
+
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphore
+
+
+async def ainvoke_llm(messages, llm=None, **kwargs):
+    """llm.ainvoke (default: the shared model), capped at LLM_MAX_CONCURRENCY calls in flight."""
+    async with _llm_semaphore():
+        return await (llm or get_llm()).ainvoke(messages, **kwargs)
+
+
+async def astream_llm(messages, llm=None, **kwargs):
+    """llm.astream under the same cap; the slot is held until the stream ends or is closed."""
+    async with _llm_semaphore():
+        async for chunk in (llm or get_llm()).astream(messages, **kwargs):
+            yield chunk
@@ -0,0 +1,253 @@
+# llm_cache.py
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+import numpy as np
+from langchain_core.messages import AIMessage
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./cache/llm_cache.sqlite")
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600
+LLM_CACHE_MAX_ENTRIES = 50_000
+SEMANTIC_THRESHOLD = 0.97         # cosine between BGE query embeddings
+
+
+def _prompt_text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    return json.dumps([[type(m).__name__, getattr(m, "content", str(m))] for m in messages])
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class CachedLLM:
+    """
+    Response cache in front of a chat model, persisted in sqlite.
+
+    Exact tier: sha256 of (model, temperature, full prompt). Only sound
+    because control prompts run at TEMPERATURE = 0.0.
+
+    Semantic tier (opt-in per call with query=... and query_embedding=...):
+    the prompt with the query cut out identifies the template; a cached
+    response for the same template whose query embedding has cosine >=
+    semantic_threshold is reused. The cache never embeds on its own: a
+    caller that has no embedding yet would pay for a second BGE pass
+    before the LLM call, so it gets the exact tier only and stores no
+    semantic entry. In the main graph that means the semantic tier serves
+    the intent classifier path only (EMBED runs before INTENT_CHECK
+    there); on the default path intent runs beside EMBED and uses the
+    exact tier. Meant for outputs that depend on what is asked, not on
+    the exact wording (intent labels), not for outputs that quote the query.
+
+    Entries expire after ttl_seconds; beyond max_entries the least
+    recently used are dropped.
+    """
+
+    def __init__(self, llm, path: str = LLM_CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, semantic_threshold: float = SEMANTIC_THRESHOLD):
+        self.llm = llm
+        self.model = getattr(llm, "model", type(llm).__name__)
+        self.temperature = getattr(llm, "temperature", None)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.semantic_threshold = semantic_threshold
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                template TEXT,
+                response TEXT NOT NULL,
+                embedding BLOB,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+        # template -> (keys, unit embeddings); rebuilt from sqlite on first use
+        self._semantic = {}
+        self._load_semantic()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    # -------------------------
+    # Keys
+    # -------------------------
+    def _exact_key(self, prompt: str) -> str:
+        return _hash(self.model, self.temperature, prompt)
+
+    def _template_key(self, prompt: str, query: str) -> str:
+        return _hash(self.model, self.temperature, prompt.replace(query, "\x00"))
+
+    # -------------------------
+    # Semantic index
+    # -------------------------
+    def _load_semantic(self):
+        rows = self._db.execute(
+            "SELECT key, template, embedding FROM llm_cache WHERE embedding IS NOT NULL AND created_at >= ?",
+            (time.time() - self.ttl_seconds,)
+        ).fetchall()
+        for key, template, blob in rows:
+            self._add_semantic(template, key, np.frombuffer(blob, dtype="float32"))
+
+    def _add_semantic(self, template, key, unit):
+        keys, vectors = self._semantic.get(template, ([], np.zeros((0, unit.shape[0]), dtype="float32")))
+        self._semantic[template] = (keys + [key], np.vstack([vectors, unit[None, :]]))
+
+    def _drop_semantic(self, dropped):
+        dropped = set(dropped)
+        for template, (keys, vectors) in list(self._semantic.items()):
+            keep = [i for i, k in enumerate(keys) if k not in dropped]
+            if len(keep) != len(keys):
+                self._semantic[template] = ([keys[i] for i in keep], vectors[keep])
+
+    def _nearest(self, template, unit) -> Optional[str]:
+        keys, vectors = self._semantic.get(template, ([], None))
+        if not keys:
+            return None
+        sims = vectors @ unit
+        best = int(sims.argmax())
+        return keys[best] if sims[best] >= self.semantic_threshold else None
+
+    # -------------------------
+    # Storage
+    # -------------------------
+    def _fetch(self, key) -> Optional[str]:
+        row = self._db.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        response, created_at = row
+        if created_at < time.time() - self.ttl_seconds:
+            self.expired += 1
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._drop_semantic([key])
+            return None
+        self._db.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        return response
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        dropped = [k for (k,) in self._db.execute(
+            "SELECT key FROM llm_cache ORDER BY last_used LIMIT ?", (excess,)
+        )]
+        self._db.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k in dropped])
+        self._drop_semantic(dropped)
+        self.evictions += len(dropped)
+
+    def lookup(self, prompt: str, query: str = None, query_embedding=None):
+        """(response or None, tier, unit query embedding or None)."""
+        unit = None
+        with self._lock:
+            response = self._fetch(self._exact_key(prompt))
+            if response is not None:
+                self._db.commit()
+                self.exact_hits += 1
+                return response, "exact", None
+
+        if query is not None and query_embedding is not None and query in prompt:
+            unit = np.asarray(query_embedding, dtype="float32")
+            unit = unit / max(float(np.linalg.norm(unit)), 1e-12)
+
+            with self._lock:
+                key = self._nearest(self._template_key(prompt, query), unit)
+                response = self._fetch(key) if key is not None else None
+                self._db.commit()
+                if response is not None:
+                    self.semantic_hits += 1
+                    return response, "semantic", unit
+
+        with self._lock:
+            self.misses += 1
+        return None, None, unit
+
+    def store(self, prompt: str, response: str, query: str = None, unit=None):
+        key = self._exact_key(prompt)
+        template = self._template_key(prompt, query) if unit is not None else None
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, template, response, embedding, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, template, response, None if unit is None else unit.astype("float32").tobytes(), now, now)
+            )
+            self._drop_semantic([key])
+            if unit is not None:
+                self._add_semantic(template, key, unit)
+            self._evict()
+            self._db.commit()
+
+    # -------------------------
+    # Chat model interface
+    # -------------------------
+    def invoke(self, messages, query: str = None, query_embedding=None, **kwargs) -> AIMessage:
+        prompt = _prompt_text(messages)
+        response, _, unit = self.lookup(prompt, query, query_embedding)
+        if response is not None:
+            return AIMessage(content=response)
+
+        result = self.llm.invoke(messages, **kwargs)
+        self.store(prompt, result.content, query, unit)
+        return result
+
+    async def ainvoke(self, messages, query: str = None, query_embedding=None, **kwargs) -> AIMessage:
+        prompt = _prompt_text(messages)
+        # sqlite reads are blocking
+        response, _, unit = await asyncio.to_thread(self.lookup, prompt, query, query_embedding)
+        if response is not None:
+            return AIMessage(content=response)
+
+        result = await self.llm.ainvoke(messages, **kwargs)
+        await asyncio.to_thread(self.store, prompt, result.content, query, unit)
+        return result
+
+    # -------------------------
+    # Metrics
+    # -------------------------
+    def purge_expired(self) -> int:
+        with self._lock:
+            dropped = [k for (k,) in self._db.execute(
+                "SELECT key FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )]
+            self._db.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k in dropped])
+            self._drop_semantic(dropped)
+            self._db.commit()
+            self.expired += len(dropped)
+            return len(dropped)
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "model": self.model,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "exact_hit_rate": round(self.exact_hits / lookups, 4) if lookups else 0.0,
+                "semantic_hit_rate": round(self.semantic_hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions
+            }